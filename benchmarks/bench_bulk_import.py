@@ -0,0 +1,93 @@
+"""Importing a multi-year history: one POST per row versus NDJSON through
+/api/entries/bulk, and peak Python memory while streaming it back out of
+/api/entries/export.
+
+    python benchmarks/bench_bulk_import.py [--days 1095] [--per-row-sample 500]
+
+The per-row rate is measured on a sample and extrapolated to the full history.
+Exits non-zero if the imported rollups or food profiles drift from the raw rows.
+"""
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from common import create_user, login, make_app, print_table
+
+FOODS = ('oats', 'eggs', 'rice', 'dal', 'chicken', 'latte', 'banana', 'paneer')
+
+def history(days):
+    today = date.today()
+    for offset in range(days):
+        day = (today - timedelta(days=offset)).isoformat()
+        for i in range(4):
+            yield dict(type='food', date=day, name=FOODS[(offset + i) % len(FOODS)], calories=300 + i, protein=12)
+        yield dict(type='water', date=day, amount_ml=2000)
+        yield dict(type='steps', date=day, steps=8000 + offset % 500)
+        yield dict(type='sleep', date=day, sleep_time='23:00', wake_time='07:00')
+        if offset % 7 == 0:
+            yield dict(type='weight', date=day, weight_kg=80)
+
+def new_client(app, name):
+    with app.app_context():
+        from calorie_tracker import db
+        user_id = create_user(name).id
+        db.session.commit()
+    client = app.test_client()
+    login(client, user_id)
+    return client, user_id
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=1095)
+    parser.add_argument('--per-row-sample', type=int, default=500)
+    args = parser.parse_args()
+
+    app = make_app()
+    rows = list(history(args.days))
+
+    client, _ = new_client(app, 'perrow')
+    started = time.perf_counter()
+    for row in rows[:args.per_row_sample]:
+        row = dict(row)
+        client.post(f"/api/entries/{row.pop('type')}", json=row)
+    per_row = (time.perf_counter() - started) / args.per_row_sample
+
+    client, user_id = new_client(app, 'bulk')
+    body = ''.join(json.dumps(row) + '\n' for row in rows).encode('utf-8')
+    started = time.perf_counter()
+    result = client.post('/api/entries/bulk', data=body, content_type='application/x-ndjson').get_json()
+    bulk = time.perf_counter() - started
+    if result['inserted'] != len(rows):
+        raise SystemExit(f"bulk import inserted {result['inserted']} of {len(rows)} rows: {result['errors'][:3]}")
+
+    with app.app_context():
+        from calorie_tracker.food_profile import find_drift as food_profile_drift
+        from calorie_tracker.rollups import find_drift as rollup_drift
+        if rollup_drift(user_id) or food_profile_drift(user_id):
+            raise SystemExit('bulk import left rollups or food profiles out of date')
+
+    print_table(('rows', 'per-row POST s (extrapolated)', 'bulk s', 'speedup'), [(
+        len(rows), f'{per_row * len(rows):.1f}', f'{bulk:.2f}', f'{per_row * len(rows) / bulk:.0f}x',
+    )])
+
+    export_rows = []
+    for days in (args.days // 3, args.days):
+        end = date.today().isoformat()
+        start = (date.today() - timedelta(days=days - 1)).isoformat()
+        tracemalloc.start()
+        started = time.perf_counter()
+        response = client.get(f'/api/entries/export?start={start}&end={end}', buffered=False)
+        size = lines = 0
+        for chunk in response.response:
+            size += len(chunk)
+            lines += chunk.count(b'\n')
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        export_rows.append((days, lines, f'{size / 1024:.0f}', f'{elapsed:.2f}', f'{peak / 1024 / 1024:.1f}'))
+    print_table(('export days', 'rows', 'KB', 's', 'peak MB'), export_rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""p50/p95 latency of /api/coach/history with inline vs precomputed suggestions.
+
+    python benchmarks/bench_coach_history.py [--latency 1] [--repeat 20]
+
+"inline" is the legacy path (SUGGESTIONS_PRECOMPUTE=0): every history load
+builds the planner context and waits on the provider. "precomputed" serves
+chips refreshed in the background after entry writes and coach messages.
+"after write" logs a food before each load, so it measures the request while
+a refresh is in flight.
+"""
+import argparse
+import os
+
+from common import create_user, login, make_app, print_table, seed_day, timed
+from stub_llm import start_stub
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    server, base = start_stub(latency=args.latency)
+    os.environ.update(GEMINI_API_BASE=base, GEMINI_API_KEY='stub')
+    app = make_app()
+    with app.app_context():
+        from datetime import date
+        from calorie_tracker import db, jobs
+        user_id = create_user('coach').id
+        seed_day(user_id, date.today(), 15)
+        db.session.commit()
+        client = app.test_client()
+        login(client, user_id)
+
+        def history():
+            assert client.get('/api/coach/history').status_code == 200
+
+        def after_write():
+            client.post('/api/entries/food', json={'name': 'snack', 'calories': 120})
+            history()
+
+        rows = []
+        for label, mode, fn in (('inline', '0', history), ('precomputed', '1', history),
+                                ('precomputed, after write', '1', after_write)):
+            os.environ['SUGGESTIONS_PRECOMPUTE'] = mode
+            history()
+            jobs.wait()
+            result = timed(fn, args.repeat, warmup=1)
+            jobs.wait()
+            rows.append((label, f"{result['p50_ms']:.1f}", f"{result['p95_ms']:.1f}"))
+        print_table(('suggestions', 'p50 ms', 'p95 ms'), rows)
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Time to first byte and to the final event for Nibbly turns, blocking
+/api/coach/message versus streamed /api/coach/message/stream.
+
+    python benchmarks/bench_coach_stream.py [--latency 2] [--repeat 5]
+
+Runs against benchmarks/stub_llm.py, which streams its reply in pieces
+spread over --latency seconds.
+"""
+import argparse
+import os
+import time
+
+from common import create_user, login, make_app, print_table
+from stub_llm import start_stub
+
+MESSAGES = (
+    ('planner', 'ate a burrito for lunch'),
+    ('chat', 'how is my day going'),
+)
+
+def blocking_turn(client, message):
+    started = time.perf_counter()
+    response = client.post('/api/coach/message', json={'message': message}, buffered=False)
+    first = time.perf_counter() - started
+    b''.join(response.response)
+    return first, time.perf_counter() - started, None
+
+def streamed_turn(client, message):
+    started = time.perf_counter()
+    response = client.post('/api/coach/message/stream', json={'message': message}, buffered=False)
+    first = token = None
+    for chunk in response.response:
+        now = time.perf_counter() - started
+        first = now if first is None else first
+        if token is None and chunk.startswith(b'event: token'):
+            token = now
+    return first, time.perf_counter() - started, token
+
+def p50(samples):
+    samples = sorted(sample for sample in samples if sample is not None)
+    return f'{samples[len(samples) // 2] * 1000:.0f}' if samples else '-'
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    server, base = start_stub(latency=args.latency)
+    os.environ.update(GEMINI_API_BASE=base, GEMINI_API_KEY='stub', SUGGESTIONS_PRECOMPUTE='0', MEAL_PARSER='0')
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        user_id = create_user('stream').id
+        db.session.commit()
+    client = app.test_client()
+    login(client, user_id)
+
+    rows = []
+    for label, message in MESSAGES:
+        for mode, run in (('blocking', blocking_turn), ('stream', streamed_turn)):
+            samples = [run(client, message) for _ in range(args.repeat)]
+            rows.append((label, mode, p50(s[0] for s in samples), p50(s[2] for s in samples), p50(s[1] for s in samples)))
+    server.shutdown()
+    print_table(('turn', 'endpoint', 'p50 first byte ms', 'p50 first token ms', 'p50 done ms'), rows)
+
+if __name__ == '__main__':
+    main()
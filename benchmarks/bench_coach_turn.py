@@ -0,0 +1,63 @@
+"""Queries and latency per Nibbly turn on /api/coach/message.
+
+    python benchmarks/bench_coach_turn.py [--repeat 10] [--budget 20]
+
+Counts come from the X-Query-Count header the app adds in testing/debug
+mode. Exits 1 when any turn goes over --budget queries.
+"""
+import argparse
+import os
+import sys
+import time
+
+from common import create_user, login, make_app, print_table, seed_day, days_back
+from stub_llm import start_stub
+
+MESSAGES = (
+    ('food (planner)', 'ate a burrito for lunch'),
+    ('water', 'drank 500 ml water'),
+    ('steps', 'walked 4000 steps'),
+    ('remember', 'remember I like green tea'),
+    ('chat', 'how am I doing today'),
+)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget', type=int, default=20)
+    args = parser.parse_args()
+
+    server, base = start_stub()
+    os.environ.update(GEMINI_API_BASE=base, GEMINI_API_KEY='stub', SUGGESTIONS_PRECOMPUTE='0')
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        user_id = create_user('coach').id
+        for day in days_back(30):
+            seed_day(user_id, day, 10)
+        db.session.commit()
+    client = app.test_client()
+    login(client, user_id)
+
+    rows = []
+    over = []
+    for label, message in MESSAGES:
+        counts, samples = [], []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.post('/api/coach/message', json={'message': message})
+            samples.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, response.get_data(as_text=True)
+            counts.append(int(response.headers['X-Query-Count']))
+        samples.sort()
+        rows.append((label, min(counts), max(counts), f'{samples[len(samples) // 2]:.1f}'))
+        if max(counts) > args.budget:
+            over.append(label)
+    server.shutdown()
+    print_table(('turn', 'min queries', 'max queries', 'p50 ms'), rows)
+    if over:
+        print(f"over the {args.budget}-query budget: {', '.join(over)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""CPU time and bytes saved compressing /api/entries and /api/history JSON:
+the legacy one-shot gzip -9 hook versus the negotiated, size-tiered levels in
+calorie_tracker/compression.py.
+
+    python benchmarks/bench_compression.py [--entries 40] [--days 1825] [--repeat 50]
+
+Payloads are the real endpoint bodies for a seeded user, fetched uncompressed.
+br and zstd rows only appear when the brotli and zstandard packages are
+installed.
+"""
+import argparse
+import gzip
+import time
+from datetime import date, timedelta
+
+from common import create_user, login, make_app, print_table, seed_day
+
+def cpu_ms(fn, repeat):
+    fn()
+    started = time.thread_time()
+    for _ in range(repeat):
+        fn()
+    return (time.thread_time() - started) * 1000 / repeat
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries', type=int, default=40)
+    parser.add_argument('--days', type=int, default=1825)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        user_id = create_user('compress').id
+        today = date.today()
+        for offset in range(args.days):
+            seed_day(user_id, today - timedelta(days=offset), args.entries if offset == 0 else 10)
+        db.session.commit()
+    client = app.test_client()
+    login(client, user_id)
+
+    from calorie_tracker.compression import COMPRESSORS, PREFERENCE, compress_body, pick_level
+    year = (today - timedelta(days=364)).isoformat()
+    start = (today - timedelta(days=args.days - 1)).isoformat()
+    payloads = {
+        f'entries ({args.entries} foods)': '/api/entries',
+        'history (365 days, week)': f'/api/history?start={year}&bucket=week',
+        'history (365 days)': f'/api/history?start={year}',
+        f'history ({args.days} days)': f'/api/history?start={start}',
+    }
+    rows = []
+    for label, url in payloads.items():
+        body = client.get(url, headers={'Accept-Encoding': 'identity'}).get_data()
+        legacy = gzip.compress(body)
+        rows.append((label, len(body), 'gzip -9 (legacy)', len(legacy), f'{1 - len(legacy) / len(body):.0%}',
+                     f'{cpu_ms(lambda: gzip.compress(body), args.repeat):.3f}'))
+        for encoding in PREFERENCE:
+            if encoding not in COMPRESSORS:
+                continue
+            level = pick_level(encoding, len(body), 'application/json')
+            out = compress_body(body, encoding, level)
+            rows.append(('', '', f'{encoding} {level}', len(out), f'{1 - len(out) / len(body):.0%}',
+                         f'{cpu_ms(lambda: compress_body(body, encoding, level), args.repeat):.3f}'))
+    print_table(('payload', 'raw bytes', 'encoding', 'bytes', 'saved', 'cpu ms'), rows)
+
+if __name__ == '__main__':
+    main()
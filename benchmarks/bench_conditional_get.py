@@ -0,0 +1,95 @@
+"""Polling the read-heavy endpoints with If-None-Match: full 200 responses
+versus 304s answered from the ResourceVersion row.
+
+    python benchmarks/bench_conditional_get.py [--days 90] [--friends 50] [--repeat 100]
+
+Exits non-zero if an unchanged poll touches an entry, rollup or friendship
+table, or if a write does not change the ETag of the endpoints that cover it.
+"""
+import argparse
+import os
+import re
+
+from common import QueryCounter, create_user, days_back, login, make_app, print_table, seed_day, timed
+
+ENDPOINTS = ('/api/dashboard', '/api/entries', '/api/goals', '/api/profile', '/api/friends', '/api/privacy/friends')
+DATA_TABLES = re.compile(
+    r'\b(food_entry|water_entry|weight_entry|step_entry|sleep_entry|calories_burnt_entry|daily_rollup'
+    r'|friendship|friend_privacy)\b'
+)
+
+# Each write and the endpoints whose ETag it has to change.
+WRITES = (
+    ('log food', 'post', '/api/entries/food', dict(name='oats', calories=300),
+     ('/api/dashboard', '/api/entries')),
+    ('update goals', 'put', '/api/goals', dict(water_goal=3000),
+     ('/api/dashboard', '/api/goals', '/api/profile')),
+    ('update privacy', 'put', '/api/privacy/friends', dict(show_weight=True),
+     ('/api/friends', '/api/privacy/friends')),
+)
+
+class TableCounter(QueryCounter):
+    def _count(self, conn, cursor, statement, *args):
+        if DATA_TABLES.search(statement):
+            self.count += 1
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--friends', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=100)
+    args = parser.parse_args()
+
+    # Background suggestion refreshes would show up in the query counts.
+    os.environ['SUGGESTIONS_PRECOMPUTE'] = '0'
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.models import Friendship
+        user_id = create_user('poller').id
+        for day in days_back(args.days):
+            seed_day(user_id, day, 20)
+        for i in range(args.friends):
+            friend = create_user(f'friend{i}')
+            db.session.add(Friendship(requester_id=user_id, receiver_id=friend.id, status='accepted'))
+        db.session.commit()
+        engine = db.engine
+    client = app.test_client()
+    login(client, user_id)
+
+    from calorie_tracker.jobs import wait
+    etags = {url: client.get(url).headers['ETag'] for url in ENDPOINTS}
+    wait()
+    rows = []
+    failures = []
+    for url in ENDPOINTS:
+        with QueryCounter(engine) as full_queries:
+            client.get(url)
+        with QueryCounter(engine) as poll_queries, TableCounter(engine) as poll_tables:
+            response = client.get(url, headers={'If-None-Match': etags[url]})
+        if response.status_code != 304:
+            failures.append(f'{url} answered an unchanged poll with {response.status_code}')
+        if poll_tables.count:
+            failures.append(f'{url} ran {poll_tables.count} entry-table queries on an unchanged poll')
+        full = timed(lambda: client.get(url).get_data(), args.repeat)
+        poll = timed(lambda: client.get(url, headers={'If-None-Match': etags[url]}).get_data(), args.repeat)
+        rows.append((url, full_queries.count, poll_queries.count, poll_tables.count,
+                     f"{full['p50_ms']:.3f}", f"{poll['p50_ms']:.3f}"))
+    print_table(('endpoint', '200 queries', '304 queries', '304 entry-table queries', '200 p50 ms', '304 p50 ms'), rows)
+
+    for label, method, url, body, covered in WRITES:
+        getattr(client, method)(url, json=body)
+        for endpoint in ENDPOINTS:
+            response = client.get(endpoint, headers={'If-None-Match': etags[endpoint]})
+            if endpoint in covered and response.status_code != 200:
+                failures.append(f'{label} left {endpoint} answering 304')
+            if endpoint not in covered and response.status_code != 304:
+                failures.append(f'{label} changed the ETag of {endpoint}')
+            etags[endpoint] = response.headers['ETag']
+
+    if failures:
+        raise SystemExit('\n'.join(failures))
+    print('Unchanged polls ran no entry-table queries; writes changed exactly the ETags they cover.')
+
+if __name__ == '__main__':
+    main()
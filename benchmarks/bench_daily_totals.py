@@ -0,0 +1,64 @@
+"""Compare daily totals strategies: the legacy five-query version, the single
+UNION ALL aggregate over raw entries, and the DailyRollup row lookup.
+
+    python benchmarks/bench_daily_totals.py [--repeat 200]
+"""
+import argparse
+from datetime import date
+
+from common import make_app, create_user, seed_day, timed, print_table
+
+def legacy_daily_totals(user_id, date_):
+    from calorie_tracker.models import FoodEntry, WaterEntry, StepEntry, SleepEntry, CaloriesBurntEntry
+    food_entries = FoodEntry.query.filter_by(user_id=user_id, date=date_).all()
+    water_entries = WaterEntry.query.filter_by(user_id=user_id, date=date_).all()
+    step_entries = StepEntry.query.filter_by(user_id=user_id, date=date_).all()
+    sleep_entries = SleepEntry.query.filter_by(user_id=user_id, date=date_).all()
+    calories_burnt_entries = CaloriesBurntEntry.query.filter_by(user_id=user_id, date=date_).all()
+    return {
+        'calories': sum(e.calories for e in food_entries),
+        'carbs': sum(e.carbs for e in food_entries),
+        'protein': sum(e.protein for e in food_entries),
+        'fat': sum(e.fat for e in food_entries),
+        'sugar': sum(e.sugar for e in food_entries),
+        'water': sum(e.amount_ml for e in water_entries),
+        'steps': sum(e.steps for e in step_entries),
+        'sleep': sum(e.duration_hours for e in sleep_entries),
+        'calories_burnt': sum(e.calories_burnt for e in calories_burnt_entries)
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app()
+    rows = []
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.utils import aggregate_daily_totals, get_daily_totals
+        for entries_per_day in (10, 100, 1000):
+            user = create_user(f'bench{entries_per_day}')
+            seed_day(user.id, date.today(), entries_per_day)
+            db.session.commit()
+            expected = legacy_daily_totals(user.id, date.today())
+            if expected != aggregate_daily_totals(user.id, date.today()) or expected != get_daily_totals(user.id, date.today()):
+                raise SystemExit(f'totals mismatch at {entries_per_day} entries/day')
+
+            def run_legacy():
+                legacy_daily_totals(user.id, date.today())
+                db.session.expunge_all()
+
+            legacy = timed(run_legacy, args.repeat)
+            aggregated = timed(lambda: aggregate_daily_totals(user.id, date.today()), args.repeat)
+            rollup = timed(lambda: get_daily_totals(user.id, date.today()), args.repeat)
+            rows.append((
+                entries_per_day,
+                f"{legacy['p50_ms']:.3f}", f"{aggregated['p50_ms']:.3f}", f"{rollup['p50_ms']:.3f}",
+                f"{legacy['p95_ms']:.3f}", f"{aggregated['p95_ms']:.3f}", f"{rollup['p95_ms']:.3f}",
+            ))
+    print_table(('entries/day', 'legacy p50 ms', 'aggregated p50 ms', 'rollup p50 ms',
+                 'legacy p95 ms', 'aggregated p95 ms', 'rollup p95 ms'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Food reference lookup latency at 25, 10k and 300k items.
+
+    python benchmarks/bench_food_index.py [--sizes 25,10000,300000] [--repeat 200]
+
+Builds synthetic CSV datasets on top of the built-in MACRO_REFERENCE and
+loads them the way FOOD_DATABASE_PATH does. The legacy columns replay the
+old linear scan (regex per alias per item); with --check both paths are
+compared on every prompt. The linear scan is skipped above --legacy-limit
+items because it takes seconds per prompt there.
+"""
+import argparse
+import csv
+import os
+import random
+import re
+import tempfile
+import time
+import tracemalloc
+
+from common import print_table, timed
+
+import calorie_tracker.food_index as food_index
+
+WORDS = ('spicy', 'grilled', 'baked', 'crispy', 'sweet', 'sour', 'smoked', 'roasted', 'fresh', 'frozen',
+         'mango', 'lentil', 'paneer', 'tofu', 'kale', 'quinoa', 'bagel', 'waffle', 'taco', 'curry',
+         'noodle', 'soup', 'salad', 'wrap', 'pie', 'bar', 'muffin', 'pudding', 'biscuit', 'stew')
+
+PROMPTS = (
+    'ate 2 eggs and rice for lunch',
+    'large cold coffee and a banana',
+    'had 150 g grilled chicken with dal and 2 roti',
+    'spicy mango curry with quinoa',
+    'smoked tofu wrap and a crispy waffle bar',
+    'a small bowl of tonkotsu ramen',
+    'price check: whole milk, 1 cup and oatsmeal',
+    'hello there',
+)
+
+def legacy_reference_context(items, prompt='', limit=8):
+    terms = set(re.findall(r'[a-z][a-z0-9]+', (prompt or '').lower()))
+    scored = []
+    for item in items:
+        aliases = set(item['aliases']) | {item['name'].lower()}
+        score = 0
+        for alias in aliases:
+            alias_terms = set(re.findall(r'[a-z][a-z0-9]+', alias))
+            if alias in (prompt or '').lower():
+                score += 4
+            score += len(terms & alias_terms)
+        if score:
+            scored.append((score, item))
+    if not scored:
+        scored = [(1, item) for item in items[:limit]]
+    scored.sort(key=lambda pair: (-pair[0], pair[1]['name']))
+    return [{key: value for key, value in item.items() if key != 'aliases'} for _, item in scored[:limit]]
+
+def legacy_match_aliases(items, lower):
+    results = []
+    for item in items:
+        for alias in sorted(item['aliases'], key=len, reverse=True):
+            if re.search(rf'\b{re.escape(alias)}\b', lower):
+                results.append((item['name'], alias))
+                break
+    return results
+
+SYLLABLES = ('ba', 'ko', 'ri', 'ta', 'mu', 'ne', 'so', 'la', 'pi', 'du', 'ge', 'vo', 'chi', 'ran', 'tel')
+
+def vocabulary(rng, size=4000):
+    words = set(WORDS)
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+def synthetic_items(count, seed=7):
+    rng = random.Random(seed)
+    vocab = vocabulary(rng)
+    items = []
+    for index in range(count):
+        # Mostly rare words with a few very common ones, like real food names.
+        words = [rng.choice(WORDS) if rng.random() < 0.3 else rng.choice(vocab) for _ in range(3)]
+        alias = ' '.join(words[:2])
+        items.append(dict(
+            name=f"{' '.join(words)} {index}, 1 serving",
+            aliases=(alias, f'{words[1]} {words[2]}') if index % 2 else (alias,),
+            calories=rng.randint(20, 900), protein=rng.randint(0, 60), carbs=rng.randint(0, 120),
+            fat=rng.randint(0, 50), sugar=rng.randint(0, 40),
+        ))
+    return items
+
+def write_csv(items):
+    path = os.path.join(tempfile.mkdtemp(prefix='fitit-foods-'), 'foods.csv')
+    with open(path, 'w', newline='', encoding='utf-8') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(('name', 'aliases') + food_index.MACRO_FIELDS)
+        for item in items:
+            writer.writerow((item['name'], '|'.join(item['aliases'])) + tuple(item[f] for f in food_index.MACRO_FIELDS))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='25,10000,300000')
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--memory', action='store_true', help='Also measure index size (slow, uses tracemalloc).')
+    parser.add_argument('--legacy-limit', type=int, default=20000, help='Skip the linear scan above this size.')
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(value) for value in args.sizes.split(',')):
+        items = list(food_index.MACRO_REFERENCE) + synthetic_items(max(size - len(food_index.MACRO_REFERENCE), 0))
+        path = write_csv(items[len(food_index.MACRO_REFERENCE):]) if size > len(food_index.MACRO_REFERENCE) else None
+        started = time.perf_counter()
+        index = food_index.build_food_index(path)
+        load_s = time.perf_counter() - started
+        memory_mb = '-'
+        if args.memory:
+            del index
+            tracemalloc.start()
+            index = food_index.build_food_index(path)
+            memory_mb = f'{tracemalloc.get_traced_memory()[0] / 1e6:.1f}'
+            tracemalloc.stop()
+
+        if args.check:
+            for prompt in PROMPTS:
+                assert index.reference_context(prompt) == legacy_reference_context(items, prompt), prompt
+                new = [(item['name'], alias) for item, alias in index.match_aliases(prompt.lower())]
+                assert new == legacy_match_aliases(items, prompt.lower()), prompt
+
+        indexed = timed(lambda: [(index.reference_context(p), index.match_aliases(p.lower())) for p in PROMPTS], args.repeat)
+        per_prompt = len(PROMPTS)
+        legacy_ms = '-'
+        if size <= args.legacy_limit:
+            legacy = timed(lambda: [(legacy_reference_context(items, p), legacy_match_aliases(items, p.lower()))
+                                    for p in PROMPTS], max(1, args.repeat // max(1, size // 500)), warmup=1)
+            legacy_ms = f"{legacy['p50_ms'] / per_prompt:.3f}"
+        rows.append((
+            len(index), f'{load_s:.2f}', memory_mb,
+            legacy_ms, f"{indexed['p50_ms'] / per_prompt:.3f}",
+            f"{indexed['p95_ms'] / per_prompt:.3f}",
+        ))
+    print_table(('items', 'load s', 'index MB', 'legacy ms/prompt', 'indexed p50 ms/prompt', 'indexed p95 ms/prompt'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Routine foods for a Nibbly turn: the legacy 30-day regroup versus the
+FoodProfile lookup, plus the write cost the profile adds to a food insert.
+
+    python benchmarks/bench_food_profile.py [--repeat 200]
+"""
+import argparse
+from datetime import date, timedelta
+
+from common import make_app, create_user, timed, print_table
+
+NAMES = ('oats', 'eggs', 'rice', 'dal', 'chicken', 'latte', 'banana', 'paneer', 'roti', 'salad',
+         'idli', 'dosa', 'pasta', 'yogurt', 'apple', 'toast')
+
+def legacy_common_foods(user_id, selected):
+    from calorie_tracker.models import FoodEntry
+    entries = (FoodEntry.query.filter(
+        FoodEntry.user_id == user_id,
+        FoodEntry.date >= selected - timedelta(days=30),
+        FoodEntry.date <= selected,
+    ).order_by(FoodEntry.date.desc(), FoodEntry.id.desc()).limit(80).all())
+    grouped = {}
+    for entry in entries:
+        item = grouped.setdefault(entry.name.strip().lower(), dict(name=entry.name, count=0, calories=0.0))
+        item['count'] += 1
+        item['calories'] += entry.calories
+    return sorted(grouped.values(), key=lambda item: (-item['count'], item['name']))[:12]
+
+def seed_foods(user_id, days, per_day):
+    from calorie_tracker import db
+    from calorie_tracker.models import FoodEntry
+    today = date.today()
+    db.session.add_all(
+        FoodEntry(user_id=user_id, date=today - timedelta(days=day), name=NAMES[(day * per_day + i) % len(NAMES)],
+                  calories=100 + i, protein=5, carbs=12, fat=3, sugar=1)
+        for day in range(days) for i in range(per_day)
+    )
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app()
+    rows = []
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.food_profile import find_drift, top_foods
+        from calorie_tracker.models import FoodEntry
+        for days, per_day in ((30, 4), (365, 6), (1095, 10)):
+            user = create_user(f'profile{days}')
+            seed_foods(user.id, days, per_day)
+            db.session.commit()
+            if find_drift(user.id):
+                raise SystemExit(f'food profile drifted at {days} days')
+
+            def run_legacy():
+                legacy_common_foods(user.id, date.today())
+                db.session.expunge_all()
+
+            def insert_food():
+                db.session.add(FoodEntry(user_id=user.id, date=date.today(), name='oats', calories=300))
+                db.session.flush()
+                db.session.rollback()
+
+            legacy = timed(run_legacy, args.repeat)
+            profile = timed(lambda: top_foods(user.id), args.repeat)
+            insert = timed(insert_food, args.repeat)
+            rows.append((
+                days * per_day, f"{legacy['p50_ms']:.3f}", f"{profile['p50_ms']:.3f}",
+                f"{legacy['p95_ms']:.3f}", f"{profile['p95_ms']:.3f}", f"{insert['p50_ms']:.3f}",
+            ))
+    print_table(('food entries', 'legacy p50 ms', 'profile p50 ms', 'legacy p95 ms', 'profile p95 ms',
+                 'insert+flush p50 ms'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Query count and latency of /api/friends/activity at 10, 100 and 500 friends.
+
+    python benchmarks/bench_friends_activity.py [--repeat 20]
+
+The legacy column replays the previous per-friend loop (lazy User load,
+privacy lookup, five-query totals, latest weight and food names for every
+friend).
+"""
+import argparse
+from datetime import date, datetime
+
+from common import QueryCounter, make_app, create_user, login, seed_day, timed, print_table
+from bench_daily_totals import legacy_daily_totals
+
+def legacy_activity(user, selected):
+    from sqlalchemy import or_
+    from calorie_tracker.models import FoodEntry, Friendship, WeightEntry
+    from calorie_tracker.routes.api_routes import _ensure_friend_privacy
+    friendships = Friendship.query.filter(
+        Friendship.status == 'accepted',
+        or_(Friendship.requester_id == user.id, Friendship.receiver_id == user.id),
+    ).order_by(Friendship.updated_at.desc(), Friendship.id.desc()).all()
+    summaries = []
+    for friendship in friendships:
+        friend = friendship.receiver if friendship.requester_id == user.id else friendship.requester
+        privacy = _ensure_friend_privacy(friend.id)
+        summary = dict(totals=legacy_daily_totals(friend.id, selected))
+        if privacy.show_weight:
+            summary['weight'] = (WeightEntry.query.filter_by(user_id=friend.id)
+                                 .order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).first())
+        if privacy.show_food_names:
+            summary['foods'] = (FoodEntry.query.filter_by(user_id=friend.id, date=selected)
+                                .order_by(FoodEntry.id.desc()).limit(5).all())
+        summaries.append(summary)
+    return summaries
+
+def seed_friends(owner, count):
+    from calorie_tracker import db
+    from calorie_tracker.models import FriendPrivacy, Friendship, WeightEntry
+    for index in range(count):
+        friend = create_user(f'{owner.username}-friend{index}')
+        seed_day(friend.id, date.today(), 10)
+        db.session.add(WeightEntry(user_id=friend.id, date=date.today(), weight_kg=70 + index % 10))
+        db.session.add(FriendPrivacy(user_id=friend.id, show_weight=index % 2 == 0, show_food_names=index % 3 == 0))
+        pair = (owner.id, friend.id) if index % 2 else (friend.id, owner.id)
+        db.session.add(Friendship(requester_id=pair[0], receiver_id=pair[1], status='accepted',
+                                  created_at=datetime.utcnow(), updated_at=datetime.utcnow()))
+    db.session.commit()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app()
+    rows = []
+    with app.app_context():
+        from flask_login import login_user
+        from calorie_tracker import db
+        for count in (10, 100, 500):
+            owner = create_user(f'owner{count}')
+            seed_friends(owner, count)
+            client = app.test_client()
+            login(client, owner.id)
+
+            with app.test_request_context():
+                login_user(owner)
+                with QueryCounter(db.engine) as legacy_queries:
+                    legacy_activity(owner, date.today())
+                db.session.rollback()
+                legacy = timed(lambda: (legacy_activity(owner, date.today()), db.session.rollback()), args.repeat)
+
+            with QueryCounter(db.engine) as batched_queries:
+                assert client.get('/api/friends/activity?limit=500').status_code == 200
+            batched = timed(lambda: client.get('/api/friends/activity?limit=500'), args.repeat)
+            rows.append((
+                count,
+                legacy_queries.count, batched_queries.count,
+                f"{legacy['p50_ms']:.1f}", f"{batched['p50_ms']:.1f}",
+                f"{legacy['p95_ms']:.1f}", f"{batched['p95_ms']:.1f}",
+            ))
+    print_table(('friends', 'legacy queries', 'endpoint queries', 'legacy p50 ms', 'endpoint p50 ms',
+                 'legacy p95 ms', 'endpoint p95 ms'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Seed a large SQLite history and check that every hot query uses an index.
+
+    python benchmarks/bench_indexes.py --users 10000 --days 730
+    python benchmarks/bench_indexes.py --users 500 --days 90 --drop-indexes
+
+Prints EXPLAIN QUERY PLAN for each hot query and flags full table scans,
+so an index regression shows up as a SCAN line instead of a SEARCH line.
+"""
+import argparse
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+
+from common import make_app, temp_database_url, timed, print_table
+
+def seed(path, users, days, density, seed_value=7):
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    today = date.today()
+    conn.executemany(
+        'INSERT INTO user (id, username, profile_name, email, password_hash, activity_level) VALUES (?, ?, ?, ?, ?, ?)',
+        ((uid, f'user{uid}', f'User {uid}', f'user{uid}@bench.local', 'bench', 'sedentary') for uid in range(1, users + 1)),
+    )
+    for uid in range(1, users + 1):
+        food, water, weight, steps, sleep, burnt, chat, actions = [], [], [], [], [], [], [], []
+        for offset in range(days):
+            if rng.random() > density:
+                continue
+            day = (today - timedelta(days=offset)).isoformat()
+            stamp = f'{day} 12:00:00.000000'
+            food.extend((uid, day, f'food {rng.randint(1, 200)}', rng.uniform(50, 800), 10, 30, 8, 4) for _ in range(rng.randint(1, 5)))
+            water.extend((uid, day, 250) for _ in range(rng.randint(1, 4)))
+            steps.append((uid, day, rng.randint(1000, 15000)))
+            sleep.append((uid, day, rng.uniform(5, 9)))
+            burnt.append((uid, day, rng.randint(100, 600)))
+            if rng.random() < 0.2:
+                weight.append((uid, day, rng.uniform(55, 95)))
+            chat.extend((uid, role, 'message', stamp) for role in ('user', 'assistant'))
+            actions.append((uid, 'nibbly', 'create_food', 'ok', '{}', stamp))
+        conn.executemany('INSERT INTO food_entry (user_id, date, name, calories, protein, carbs, fat, sugar) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', food)
+        conn.executemany('INSERT INTO water_entry (user_id, date, amount_ml) VALUES (?, ?, ?)', water)
+        conn.executemany('INSERT INTO weight_entry (user_id, date, weight_kg) VALUES (?, ?, ?)', weight)
+        conn.executemany('INSERT INTO step_entry (user_id, date, steps) VALUES (?, ?, ?)', steps)
+        conn.executemany('INSERT INTO sleep_entry (user_id, date, duration_hours) VALUES (?, ?, ?)', sleep)
+        conn.executemany('INSERT INTO calories_burnt_entry (user_id, date, calories_burnt) VALUES (?, ?, ?)', burnt)
+        conn.executemany('INSERT INTO chat_message (user_id, role, content, created_at) VALUES (?, ?, ?, ?)', chat)
+        conn.executemany('INSERT INTO agent_action_log (user_id, agent, tool, status, request, created_at) VALUES (?, ?, ?, ?, ?, ?)', actions)
+    conn.executemany(
+        "INSERT OR IGNORE INTO friendship (requester_id, receiver_id, status, created_at, updated_at) VALUES (?, ?, 'accepted', ?, ?)",
+        ((uid, rng.randint(1, users), datetime.utcnow(), datetime.utcnow())
+         for uid in range(1, users + 1) for _ in range(3)),
+    )
+    conn.execute('DELETE FROM friendship WHERE requester_id = receiver_id')
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def hot_queries(user_id, selected):
+    from sqlalchemy import and_, or_, select
+    from calorie_tracker.models import (
+        FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry,
+        ChatMessage, UserMemory, AgentActionLog, Friendship,
+    )
+    from calorie_tracker.utils import DAILY_TOTALS_QUERY, ROLLUP_QUERY
+    queries = [
+        ('daily rollup', ROLLUP_QUERY, dict(user_id=user_id, date=selected)),
+        ('daily totals from entries', DAILY_TOTALS_QUERY, dict(user_id=user_id, date=selected)),
+    ]
+    for model in (FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry):
+        queries.append((f'{model.__tablename__} for date',
+                        select(model).where(model.user_id == user_id, model.date == selected).order_by(model.id.desc()), {}))
+    queries.extend([
+        ('latest weight', select(WeightEntry).where(WeightEntry.user_id == user_id)
+         .order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).limit(1), {}),
+        ('sleep chart', select(SleepEntry).where(SleepEntry.user_id == user_id)
+         .order_by(SleepEntry.date.desc()).limit(14), {}),
+        ('routine foods', select(FoodEntry).where(
+            FoodEntry.user_id == user_id, FoodEntry.date >= selected - timedelta(days=30), FoodEntry.date <= selected,
+        ).order_by(FoodEntry.date.desc(), FoodEntry.id.desc()).limit(80), {}),
+        ('chat history', select(ChatMessage).where(ChatMessage.user_id == user_id)
+         .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc()).limit(40), {}),
+        ('agent actions', select(AgentActionLog).where(AgentActionLog.user_id == user_id, AgentActionLog.agent == 'nibbly')
+         .order_by(AgentActionLog.created_at.desc(), AgentActionLog.id.desc()).limit(10), {}),
+        ('memories', select(UserMemory).where(UserMemory.user_id == user_id), {}),
+        ('friendships', select(Friendship).where(
+            Friendship.status == 'accepted',
+            or_(Friendship.requester_id == user_id, Friendship.receiver_id == user_id),
+        ).order_by(Friendship.updated_at.desc(), Friendship.id.desc()), {}),
+        ('friendship pair', select(Friendship).where(or_(
+            and_(Friendship.requester_id == user_id, Friendship.receiver_id == user_id + 1),
+            and_(Friendship.requester_id == user_id + 1, Friendship.receiver_id == user_id),
+        )), {}),
+    ])
+    return queries
+
+def is_table_scan(detail, tables):
+    words = detail.split()
+    return len(words) > 1 and words[0] == 'SCAN' and words[1] in tables and 'USING' not in words
+
+def explain(connection, statement, params):
+    compiled = statement.params(params).compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    values = compiled.construct_params()
+    positional = tuple(
+        values[name].isoformat() if isinstance(values[name], date) else values[name]
+        for name in compiled.positiontup
+    )
+    return connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', positional).all()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--density', type=float, default=0.3, help='share of days with any logging')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--drop-indexes', action='store_true', help='drop the composite indexes to show the regression')
+    args = parser.parse_args()
+
+    database_url = temp_database_url('indexes')
+    app = make_app(database_url)
+    path = database_url.replace('sqlite:///', '', 1)
+    started = time.perf_counter()
+    seed(path, args.users, args.days, args.density)
+    print(f'seeded {args.users} users x {args.days} days in {time.perf_counter() - started:.1f}s ({path})')
+
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.rollups import rebuild_rollups
+        rebuild_rollups()
+        if args.drop_indexes:
+            for (name,) in db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND name LIKE 'ix_%'")).all():
+                db.session.execute(db.text(f'DROP INDEX {name}'))
+            db.session.commit()
+
+        user_id = max(args.users // 2, 1)
+        rows = []
+        scans = []
+        for label, statement, params in hot_queries(user_id, date.today()):
+            plan = explain(db.session.connection(), statement, params)
+            details = [row[-1] for row in plan]
+            print(f'\n{label}')
+            for detail in details:
+                print(f'  {detail}')
+            if any(is_table_scan(detail, db.metadata.tables) for detail in details):
+                scans.append(label)
+            timing = timed(lambda: db.session.execute(statement, params).all(), args.repeat)
+            db.session.expunge_all()
+            rows.append((label, f"{timing['p50_ms']:.3f}", f"{timing['p95_ms']:.3f}"))
+
+    print()
+    print_table(('query', 'p50 ms', 'p95 ms'), rows)
+    if scans:
+        print(f"\nFULL TABLE SCANS: {', '.join(scans)}")
+        raise SystemExit(1)
+    print('\nno full table scans')
+
+if __name__ == '__main__':
+    main()
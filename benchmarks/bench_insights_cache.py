@@ -0,0 +1,57 @@
+"""/api/dashboard/insights latency with a cold and a warm response cache.
+
+    python benchmarks/bench_insights_cache.py [--latency 1] [--backend memory]
+
+Uses benchmarks/stub_llm.py as the provider. "cold" clears the cache before
+every request, "warm" serves repeats of the same context, and "after write"
+logs a water entry first so the day's cached answer is invalidated.
+"""
+import argparse
+import os
+
+from common import create_user, login, make_app, print_table, timed
+from stub_llm import start_stub
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=1.0)
+    parser.add_argument('--backend', choices=('memory', 'database'), default='memory')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    server, base = start_stub(latency=args.latency)
+    os.environ.update(GEMINI_API_BASE=base, GEMINI_API_KEY='stub', AI_CACHE_BACKEND=args.backend)
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.cache import get_cache
+        user_id = create_user('insights').id
+        db.session.commit()
+        client = app.test_client()
+        login(client, user_id)
+        cache = get_cache()
+
+        def fetch():
+            assert client.get('/api/dashboard/insights').status_code == 200
+
+        def cold():
+            cache.clear()
+            fetch()
+
+        def after_write():
+            client.post('/api/entries/water', json={'amount_ml': 1})
+            fetch()
+
+        rows = []
+        for label, fn in (('cold', cold), ('warm', fetch), ('after write', after_write)):
+            before = server.RequestHandlerClass.requests
+            result = timed(fn, args.repeat, warmup=1)
+            calls = server.RequestHandlerClass.requests - before
+            rows.append((label, calls, f"{result['p50_ms']:.1f}", f"{result['p95_ms']:.1f}"))
+        print_table(('mode', 'provider calls', 'p50 ms', 'p95 ms'), rows)
+        print()
+        print(', '.join(f'{name}={value}' for name, value in cache.stats().items()))
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""LLM client: pooled connections, bounded concurrency and the circuit breaker.
+
+    python benchmarks/bench_llm_client.py [--latency 2] [--workers 16]
+
+Runs against benchmarks/stub_llm.py. The first table compares a fresh
+urllib connection per call with the pooled client. The second fires
+concurrent /api/dashboard/insights requests while the provider is slow and
+shows how LLM_MAX_CONCURRENCY keeps the rest of the workers on the local
+fallback instead of parking them all on the provider. The third shows calls
+against a dead provider before and after the breaker opens.
+"""
+import argparse
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_user, login, make_app, print_table, timed
+from stub_llm import start_stub
+
+def urllib_post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+def bench_pooling(repeat):
+    from calorie_tracker.llm import LLMClient
+    server, base = start_stub()
+    url = f'{base}/v1/responses'
+    body = {'input': [{'role': 'user', 'content': 'hello'}]}
+    client = LLMClient()
+    fresh = timed(lambda: urllib_post(url, body), repeat)
+    pooled = timed(lambda: client.post_json(url, body), repeat)
+    client.close()
+    server.shutdown()
+    print_table(('mode', 'p50 ms', 'p95 ms'), [
+        ('fresh connection', f"{fresh['p50_ms']:.2f}", f"{fresh['p95_ms']:.2f}"),
+        ('pooled client', f"{pooled['p50_ms']:.2f}", f"{pooled['p95_ms']:.2f}"),
+    ])
+
+def bench_concurrency(app, latency, workers):
+    from calorie_tracker.llm import reset_client
+    server, base = start_stub(latency=latency)
+    os.environ['GEMINI_API_BASE'] = base
+    os.environ['GEMINI_API_KEY'] = 'stub'
+    with app.app_context():
+        user_id = create_user('insights').id
+        from calorie_tracker import db
+        db.session.commit()
+
+    def one_request(_):
+        client = app.test_client()
+        login(client, user_id)
+        started = time.perf_counter()
+        assert client.get('/api/dashboard/insights').status_code == 200
+        return (time.perf_counter() - started) * 1000
+
+    rows = []
+    for limit in (workers, 4):
+        os.environ['LLM_MAX_CONCURRENCY'] = str(limit)
+        reset_client()
+        before = server.RequestHandlerClass.requests
+        started = time.perf_counter()
+        with ThreadPoolExecutor(workers) as pool:
+            samples = sorted(pool.map(one_request, range(workers)))
+        wall = time.perf_counter() - started
+        provider_calls = server.RequestHandlerClass.requests - before
+        rows.append((
+            limit, provider_calls, workers - provider_calls,
+            f'{samples[len(samples) // 2]:.0f}', f'{samples[-1]:.0f}', f'{wall:.2f}',
+        ))
+    server.shutdown()
+    os.environ.pop('GEMINI_API_KEY')
+    os.environ.pop('LLM_MAX_CONCURRENCY')
+    print_table(('max concurrency', 'provider calls', 'fallbacks', 'p50 ms', 'max ms', 'wall s'), rows)
+
+def bench_breaker():
+    from calorie_tracker.llm import LLMClient, LLMError
+    client = LLMClient(failure_threshold=5, reset_after=30)
+    url = 'http://127.0.0.1:1/v1/responses'
+    rows = []
+    for attempt in range(1, 9):
+        started = time.perf_counter()
+        try:
+            client.post_json(url, {}, timeout=2)
+        except LLMError as exc:
+            error = type(exc).__name__
+        rows.append((attempt, client.breaker_for(url).state, error, f'{(time.perf_counter() - started) * 1000:.3f}'))
+    print_table(('call', 'breaker', 'error', 'ms'), rows)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=2.0)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    app = make_app()
+    bench_pooling(args.repeat)
+    print()
+    bench_concurrency(app, args.latency, args.workers)
+    print()
+    bench_breaker()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Share of food messages Nibbly answers without a provider round trip.
+
+    python benchmarks/bench_meal_parser.py [--latency 1.0] [--repeat 3]
+
+Sends a mix of meal logs through /api/coach/message with the local parser on
+and off, against the stub provider at --latency seconds per call, and reports
+the LLM offload ratio and per-turn latency for each run.
+"""
+import argparse
+import os
+import time
+
+from common import create_user, login, make_app, print_table
+from stub_llm import start_stub
+
+MESSAGES = (
+    '2 eggs and rice',
+    'ate 2 large eggs and a cup of rice for breakfast',
+    '200g chicken and half cup dal',
+    '12 oz latte',
+    'a banana',
+    '3 idli x2',
+    'lunch: 2 eggs, 1 cup oats, coffee',
+    'half a bowl of tonkotsu ramen',
+    'had burrito bowl with rice and chicken',
+    '2 roti with paneer 150 g',
+    # Left for the planner: unknown dishes, corrections and vague portions.
+    'chicken tikka masala',
+    'remove the rice',
+    'banana smoothie 500 ml',
+    '200 g rice',
+)
+
+def run(client, repeat):
+    from calorie_tracker.meal_parser import path_stats, reset_path_stats
+    reset_path_stats()
+    local, planner = [], []
+    for _ in range(repeat):
+        for message in MESSAGES:
+            started = time.perf_counter()
+            response = client.post('/api/coach/message', json={'message': message})
+            elapsed = (time.perf_counter() - started) * 1000
+            assert response.status_code == 200, response.get_data(as_text=True)
+            intent = response.get_json()['reply']['intent']
+            (local if intent == 'local_food_plan' else planner).append(elapsed)
+    return path_stats(), local, planner
+
+def p50(samples):
+    return f'{sorted(samples)[len(samples) // 2]:.1f}' if samples else '-'
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type=float, default=1.0, help='Stub provider seconds per call.')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    server, base = start_stub(latency=args.latency)
+    os.environ.update(GEMINI_API_BASE=base, GEMINI_API_KEY='stub', SUGGESTIONS_PRECOMPUTE='0')
+    app = make_app()
+    client = app.test_client()
+
+    rows = []
+    for label, flag in (('planner only', '0'), ('local parser', '1')):
+        os.environ['MEAL_PARSER'] = flag
+        # A fresh user per run, so foods logged by one run are not routine foods in the next.
+        with app.app_context():
+            from calorie_tracker import db
+            user_id = create_user(f'meals{flag}').id
+            db.session.commit()
+        login(client, user_id)
+        calls_before = server.RequestHandlerClass.requests
+        started = time.perf_counter()
+        stats, local, planner = run(client, args.repeat)
+        total_ms = (time.perf_counter() - started) * 1000
+        turns = len(local) + len(planner)
+        rows.append((
+            label, turns, stats['local'], stats['llm'], server.RequestHandlerClass.requests - calls_before,
+            f"{stats['llm_offload_ratio']:.0%}", p50(local), p50(planner), f'{total_ms / turns:.1f}',
+        ))
+    server.shutdown()
+    print_table(
+        ('run', 'turns', 'local', 'llm', 'provider calls', 'offload', 'p50 local ms', 'p50 other ms', 'mean ms'),
+        rows,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""Latency added by the opt-in request metrics in calorie_tracker/metrics.py:
+the same endpoints with METRICS=0 and METRICS=1, each in a fresh process.
+
+    python benchmarks/bench_metrics_overhead.py [--days 30] [--repeat 300]
+
+Also prints the per-endpoint p50/p95 that the histograms report, so they can
+be compared with the wall-clock numbers measured here.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from common import create_user, days_back, login, make_app, print_table, seed_day, timed
+
+ENDPOINTS = ('/api/dashboard', '/api/entries', '/api/history', '/api/goals')
+
+def measure(args):
+    os.environ['SUGGESTIONS_PRECOMPUTE'] = '0'
+    app = make_app()
+    with app.app_context():
+        from calorie_tracker import db
+        user_id = create_user('metrics').id
+        for day in days_back(args.days):
+            seed_day(user_id, day, 10)
+        db.session.commit()
+    client = app.test_client()
+    login(client, user_id)
+
+    from calorie_tracker.metrics import endpoint_stats
+    results = {url: timed(lambda: client.get(url).get_data(), args.repeat) for url in ENDPOINTS}
+    histograms = {endpoint: stats for (series, endpoint, _), stats in endpoint_stats().items() if series == 'duration_ms'}
+    print(json.dumps(dict(timings=results, histograms=histograms)))
+
+def run(mode, args):
+    env = dict(os.environ, METRICS=mode)
+    output = subprocess.run(
+        [sys.executable, __file__, '--child', '--days', str(args.days), '--repeat', str(args.repeat)],
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=300)
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+    if args.child:
+        measure(args)
+        return
+
+    off, on = run('0', args), run('1', args)
+    rows = []
+    for url in ENDPOINTS:
+        before, after = off['timings'][url]['p50_ms'], on['timings'][url]['p50_ms']
+        rows.append((url, f'{before:.3f}', f'{after:.3f}', f'{(after - before) * 1000:+.0f}'))
+    print_table(('endpoint', 'p50 ms off', 'p50 ms on', 'overhead us'), rows)
+
+    rows = [
+        (endpoint, stats['count'], f"{stats['p50']:.3f}", f"{stats['p95']:.3f}", f"{stats['max']:.3f}")
+        for endpoint, stats in sorted(on['histograms'].items())
+    ]
+    print_table(('histogram', 'count', 'p50 ms', 'p95 ms', 'max ms'), rows)
+
+if __name__ == '__main__':
+    main()
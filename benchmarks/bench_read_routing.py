@@ -0,0 +1,130 @@
+"""Read/write routing with READ_DATABASE_URL: two SQLite files, the replica
+refreshed from the primary by common.sync_sqlite every --lag seconds.
+
+    python benchmarks/bench_read_routing.py [--days 60] [--readers 3] [--duration 5] [--lag 0.5]
+
+Checks first that polls run entirely on the replica, that writes never
+touch it, and that a user reads back their own write before the replica has
+it. Then it runs polling readers alongside a writer and reports how many
+statements each engine served. Exits non-zero if any check fails.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from common import QueryCounter, create_user, days_back, login, make_app, print_table, seed_day, sync_sqlite
+
+READ_AFTER_WRITE_SECONDS = 1.0
+
+def food_names(client):
+    return [food['name'] for food in client.get('/api/entries').get_json()['food']]
+
+def check_routing(client, primary, replica, sync, failures):
+    with QueryCounter(primary) as on_primary, QueryCounter(replica) as on_replica:
+        client.get('/api/dashboard')
+    if on_primary.count or not on_replica.count:
+        failures.append(f'dashboard poll ran {on_primary.count} primary / {on_replica.count} replica queries')
+
+    with QueryCounter(primary) as on_primary, QueryCounter(replica) as on_replica:
+        client.post('/api/entries/food', json=dict(name='routing check', calories=100))
+    if on_replica.count:
+        failures.append(f'a write ran {on_replica.count} queries on the replica')
+
+    with QueryCounter(replica) as on_replica:
+        names = food_names(client)
+    if 'routing check' not in names or on_replica.count:
+        failures.append('a read right after a write did not come from the primary')
+
+    time.sleep(READ_AFTER_WRITE_SECONDS + 0.1)
+    if 'routing check' in food_names(client):
+        failures.append('once the read-after-write window passed, reads still came from the primary')
+    sync()
+    if 'routing check' not in food_names(client):
+        failures.append('the replica did not show the write after a sync')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--readers', type=int, default=3)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--lag', type=float, default=0.5, help='seconds between replica syncs')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitit-replica-')
+    primary_url = f"sqlite:///{os.path.join(directory, 'primary.db')}"
+    replica_url = f"sqlite:///{os.path.join(directory, 'replica.db')}"
+    os.environ.update(READ_DATABASE_URL=replica_url, READ_AFTER_WRITE_SECONDS=str(READ_AFTER_WRITE_SECONDS),
+                      SUGGESTIONS_PRECOMPUTE='0')
+    app = make_app(primary_url)
+    with app.app_context():
+        from calorie_tracker import db
+        from calorie_tracker.routing import REPLICA
+        user_ids = []
+        for i in range(args.readers + 1):
+            user_ids.append(create_user(f'reader{i}').id)
+            for day in days_back(args.days):
+                seed_day(user_ids[-1], day, 10)
+        db.session.commit()
+        primary, replica = db.engine, db.engines[REPLICA]
+
+    def sync():
+        sync_sqlite(primary_url, replica_url)
+
+    sync()
+    clients = []
+    for user_id in user_ids:
+        client = app.test_client()
+        login(client, user_id)
+        clients.append(client)
+
+    failures = []
+    check_routing(clients[0], primary, replica, sync, failures)
+
+    stop = threading.Event()
+    samples = dict(read=[], write=[])
+
+    def timed_loop(kind, fn):
+        while not stop.is_set():
+            started = time.perf_counter()
+            fn()
+            samples[kind].append((time.perf_counter() - started) * 1000)
+
+    def poll(client):
+        return lambda: (client.get('/api/dashboard'), client.get('/api/history'))
+
+    def syncer():
+        while not stop.wait(args.lag):
+            sync()
+
+    writer = clients[0]
+    threads = [threading.Thread(target=timed_loop, args=('read', poll(client))) for client in clients[1:]]
+    threads.append(threading.Thread(target=timed_loop, args=(
+        'write', lambda: writer.post('/api/entries/water', json=dict(amount_ml=250))
+    )))
+    threads.append(threading.Thread(target=syncer))
+    with QueryCounter(primary) as on_primary, QueryCounter(replica) as on_replica:
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    rows = []
+    for kind in ('read', 'write'):
+        values = sorted(samples[kind])
+        if values:
+            rows.append((kind, len(values), f'{values[len(values) // 2]:.1f}',
+                         f'{values[min(int(len(values) * 0.95), len(values) - 1)]:.1f}'))
+    print_table(('requests', 'count', 'p50 ms', 'p95 ms'), rows)
+    total = on_primary.count + on_replica.count
+    print(f'statements: {on_primary.count} primary, {on_replica.count} replica '
+          f'({on_replica.count / max(total, 1):.0%} served by the replica)')
+    if failures:
+        raise SystemExit('\n'.join(failures))
+    print('Polls ran on the replica, writes stayed on the primary, and writers read their own writes.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""Per-user shards with SHARD_URLS: the primary plus --shards more SQLite
+files, each user's entries, chat and derived tables on one of them.
+
+    python benchmarks/bench_shards.py [--shards 2] [--users 12] [--days 30] [--latency-ms 2]
+
+Checks that new users spread across every shard, that a user's requests
+touch only their own shard and the primary, that /api/friends/activity over
+friends on every shard matches what each friend sees on their own dashboard,
+that reads with no shard in scope fail loudly, and that `flask shards move`
+keeps a user's history, rollups and food profiles intact. Then it times
+friends activity with the per-shard reads fanned out and run one after
+another, with --latency-ms added to every statement to stand in for a
+networked database. Exits non-zero if any check fails.
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import QueryCounter, create_user, days_back, login, make_app, print_table, seed_day, timed
+
+def sqlite_url(directory, name):
+    return f"sqlite:///{os.path.join(directory, f'{name}.db')}"
+
+def add_latency(engine, seconds):
+    from sqlalchemy import event
+
+    def delay(*args):
+        time.sleep(seconds)
+
+    event.listen(engine, 'before_cursor_execute', delay)
+
+def dashboard_calories(app, user_id):
+    client = app.test_client()
+    login(client, user_id)
+    return client.get('/api/dashboard').get_json()['totals']['calories']
+
+def check_placement(app, user_ids, failures):
+    from calorie_tracker.models import User
+    from calorie_tracker.shards import shard_count
+    with app.app_context():
+        placed = {user.id: user.shard for user in User.query.filter(User.id.in_(user_ids))}
+    used = set(placed.values())
+    if used != set(range(shard_count())):
+        failures.append(f'new users landed on shards {sorted(used)} of {shard_count()}')
+    return placed
+
+def check_isolation(app, engines, user_id, shard, failures):
+    client = app.test_client()
+    login(client, user_id)
+    counters = {k: QueryCounter(engine) for k, engine in engines.items()}
+    for counter in counters.values():
+        counter.__enter__()
+    try:
+        client.get('/api/dashboard')
+        client.post('/api/entries/food', json=dict(name='isolation check', calories=10))
+        client.get('/api/entries')
+    finally:
+        for counter in counters.values():
+            counter.__exit__(None, None, None)
+    stray = {k: c.count for k, c in counters.items() if k not in (0, shard) and c.count}
+    if stray:
+        failures.append(f'user on shard {shard} ran queries on other shards: {stray}')
+    if not counters[shard].count:
+        failures.append(f'user on shard {shard} never reached their shard')
+
+def check_unscoped(app, failures):
+    from calorie_tracker.models import FoodEntry
+    from calorie_tracker.shards import ShardError
+    with app.app_context():
+        try:
+            FoodEntry.query.count()
+        except ShardError:
+            return
+    failures.append('an entry query with no shard in scope did not raise ShardError')
+
+def check_activity(app, viewer_id, user_ids, failures):
+    client = app.test_client()
+    login(client, viewer_id)
+    payload = client.get('/api/friends/activity').get_json()
+    seen = {payload['mine']['user']['id']: payload['mine']['calories']}
+    seen.update((friend['user']['id'], friend['calories']) for friend in payload['friends'])
+    for user_id in user_ids:
+        expected = dashboard_calories(app, user_id)
+        if seen.get(user_id) != expected:
+            failures.append(f'friends activity shows {seen.get(user_id)} kcal for user {user_id}, their dashboard {expected}')
+    return client
+
+def snapshot(app, user_id, start, end):
+    client = app.test_client()
+    login(client, user_id)
+    history = client.get(f'/api/history?start={start.isoformat()}&end={end.isoformat()}').get_json()
+    foods = sorted(food['name'] for food in client.get('/api/entries').get_json()['food'])
+    return history, foods
+
+def check_move(app, user_id, source, target, args, failures):
+    from calorie_tracker import db, food_profile, rollups
+    from calorie_tracker.shards import bind_key, row_counts, using_shard
+    end = date.today()
+    start = end - timedelta(days=args.days)
+    before = snapshot(app, user_id, start, end)
+    with app.app_context():
+        source_rows = sum(row_counts(source).values())
+    result = app.test_cli_runner().invoke(args=['shards', 'move', str(user_id), str(target)])
+    if result.exit_code:
+        failures.append(f'shards move failed: {result.output.strip()}')
+        return
+    print(result.output.strip())
+    if snapshot(app, user_id, start, end) != before:
+        failures.append('history or entries changed across a move')
+    with app.app_context():
+        moved_rows = source_rows - sum(row_counts(source).values())
+        with using_shard(shard=target):
+            drift = rollups.find_drift(user_id) + food_profile.find_drift(user_id)
+        from calorie_tracker.models import FoodEntry
+        table = FoodEntry.__table__
+        with db.engines[bind_key(source)].connect() as connection:
+            left = connection.execute(table.select().where(table.c.user_id == user_id)).all()
+    if not moved_rows or left:
+        failures.append(f'the source shard kept {len(left)} food rows after the move')
+    if drift:
+        failures.append(f'{len(drift)} rollup or food profile rows drifted after the move')
+    client = app.test_client()
+    login(client, user_id)
+    client.post('/api/entries/food', json=dict(name='after the move', calories=10))
+    if 'after the move' not in snapshot(app, user_id, start, end)[1]:
+        failures.append('a write after the move did not read back')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shards', type=int, default=2, help='shards besides the primary')
+    parser.add_argument('--users', type=int, default=12)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='added to every statement while timing')
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='fitit-shards-')
+    os.environ.update(SHARD_URLS=','.join(sqlite_url(directory, f'shard{i}') for i in range(1, args.shards + 1)),
+                      SUGGESTIONS_PRECOMPUTE='0')
+    app = make_app(sqlite_url(directory, 'primary'))
+    from calorie_tracker import db
+    from calorie_tracker.models import FriendPrivacy, Friendship
+    from calorie_tracker.shards import bind_key, reset_executor, shard_count
+    with app.app_context():
+        users = [create_user(f'sharded{i}') for i in range(args.users)]
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        for index, user_id in enumerate(user_ids):
+            for day in days_back(args.days):
+                seed_day(user_id, day, 5 + index)
+        viewer = user_ids[0]
+        db.session.add_all(Friendship(requester_id=viewer, receiver_id=user_id, status='accepted')
+                           for user_id in user_ids[1:])
+        # Shares everything, so activity runs all three reads on every shard.
+        db.session.add_all(FriendPrivacy(user_id=user_id, show_weight=True, show_food_names=True)
+                           for user_id in user_ids)
+        db.session.commit()
+        engines = {shard: db.engines[bind_key(shard)] for shard in range(shard_count())}
+
+    failures = []
+    placed = check_placement(app, user_ids, failures)
+    for shard in range(shard_count()):
+        owner = next((uid for uid in user_ids if placed[uid] == shard), None)
+        if owner is not None:
+            check_isolation(app, engines, owner, shard, failures)
+    check_unscoped(app, failures)
+    client = check_activity(app, viewer, user_ids, failures)
+
+    mover = user_ids[-1]
+    check_move(app, mover, placed[mover], (placed[mover] + 1) % shard_count(), args, failures)
+    check_activity(app, viewer, user_ids, failures)
+    for command in (['rollups', 'check'], ['food-profiles', 'check']):
+        result = app.test_cli_runner().invoke(args=command)
+        if result.exit_code:
+            failures.append(f"flask {' '.join(command)}: {result.output.strip()}")
+    print(app.test_cli_runner().invoke(args=['shards', 'stats']).output.strip())
+
+    for engine in engines.values():
+        add_latency(engine, args.latency_ms / 1000)
+    rows = []
+    for label, workers in (('fan-out', shard_count()), ('one at a time', 0)):
+        os.environ['SHARD_FANOUT_WORKERS'] = str(workers)
+        reset_executor()
+        stats = timed(lambda: client.get('/api/friends/activity'), repeat=args.repeat)
+        rows.append((label, workers, f"{stats['p50_ms']:.1f}", f"{stats['p95_ms']:.1f}"))
+    print_table(('friends activity', 'workers', 'p50 ms', 'p95 ms'), rows)
+    if failures:
+        raise SystemExit('\n'.join(failures))
+    print('Users spread across shards, reads and writes stayed on their shard, and a move kept every total.')
+
+if __name__ == '__main__':
+    main()
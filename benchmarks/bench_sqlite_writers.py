@@ -0,0 +1,159 @@
+"""Commit throughput with several processes writing one SQLite file, as
+under multiple gunicorn workers: DB_PROFILE=plain (rollback journal, full
+fsync per commit) versus DB_PROFILE=tuned (WAL, synchronous=NORMAL, busy
+timeout and cache pragmas from calorie_tracker/engine.py).
+
+    python benchmarks/bench_sqlite_writers.py [--writers 4] [--readers 2] [--duration 10] [--mode both]
+
+Writers insert food entries either with a direct ORM commit or through
+POST /api/entries/food. Either way, each commit also maintains rollups, food
+profiles and resource versions. Readers poll /api/dashboard and
+/api/history. Every process is a separate app with its own connection pool.
+Exits non-zero if the tuned profile reports any "database is locked" errors.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from common import create_user, login, make_app, print_table
+
+PROFILES = ('plain', 'tuned')
+
+def seed(args):
+    app = make_app(args.database)
+    with app.app_context():
+        from calorie_tracker import db
+        for i in range(args.writers + args.readers):
+            create_user(f'writer{i}')
+        db.session.commit()
+
+def run_client(args):
+    from sqlalchemy.exc import OperationalError
+    app = make_app(args.database)
+    client = app.test_client()
+    with app.app_context():
+        from calorie_tracker.models import User
+        user_id = User.query.filter_by(username=f'writer{args.index}').one().id
+    login(client, user_id)
+    today = date.today()
+    start = (today - timedelta(days=29)).isoformat()
+
+    def write():
+        return client.post('/api/entries/food', json=dict(name='oats', calories=300, protein=12))
+
+    def commit():
+        # The same insert and after_flush maintenance without the HTTP layer,
+        # so the journal and fsync cost is a larger share of each sample.
+        with app.app_context():
+            from calorie_tracker import db
+            from calorie_tracker.models import FoodEntry
+            try:
+                db.session.add(FoodEntry(user_id=user_id, date=today, name='oats', calories=300, protein=12))
+                db.session.commit()
+            except OperationalError:
+                db.session.rollback()
+                raise
+        return None
+
+    def read():
+        client.get('/api/dashboard')
+        return client.get(f'/api/history?start={start}&end={today.isoformat()}')
+
+    if args.role == 'writer':
+        action = write if args.mode == 'api' else commit
+    else:
+        action = read
+    samples, locked, failed = [], 0, 0
+    time.sleep(max(0.0, args.start - time.time()))
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = action()
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+            continue
+        if response is not None and response.status_code >= 400:
+            failed += 1
+            continue
+        samples.append((time.perf_counter() - started) * 1000)
+    print(json.dumps(dict(role=args.role, samples=samples, locked=locked, failed=failed)))
+
+def run_profile(profile, mode, args):
+    database = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='fitit-writers-'), 'writers.db')}"
+    env = dict(os.environ, DB_PROFILE=profile, SUGGESTIONS_PRECOMPUTE='0')
+    base = [sys.executable, __file__, '--database', database, '--duration', str(args.duration),
+            '--writers', str(args.writers), '--readers', str(args.readers), '--mode', mode]
+    subprocess.run(base + ['--child', 'seed'], env=env, check=True)
+    start = time.time() + args.startup
+    roles = ['writer'] * args.writers + ['reader'] * args.readers
+    children = [
+        subprocess.Popen(base + ['--child', role, '--index', str(i), '--start', str(start)],
+                         env=env, stdout=subprocess.PIPE, text=True)
+        for i, role in enumerate(roles)
+    ]
+    results = []
+    for child in children:
+        output, _ = child.communicate()
+        if child.returncode:
+            raise SystemExit(f'{profile} child exited with {child.returncode}')
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def summarize(profile, mode, role, results, duration):
+    results = [r for r in results if r['role'] == role]
+    samples = sorted(s for r in results for s in r['samples'])
+    if not samples:
+        return (profile, mode, role, 0, '0', '-', '-', '-', sum(r['locked'] for r in results), sum(r['failed'] for r in results))
+
+    def pick(fraction):
+        return f'{samples[min(int(len(samples) * fraction), len(samples) - 1)]:.1f}'
+
+    return (profile, mode, role, len(samples), f'{len(samples) / duration:.0f}', pick(0.5), pick(0.95), pick(0.99),
+            sum(r['locked'] for r in results), sum(r['failed'] for r in results))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--startup', type=float, default=5.0, help='seconds allowed for every child to boot')
+    parser.add_argument('--mode', choices=('commit', 'api', 'both'), default='both',
+                        help='writers commit through the ORM directly, or POST through the API')
+    parser.add_argument('--child', choices=('seed', 'writer', 'reader'))
+    parser.add_argument('--database')
+    parser.add_argument('--index', type=int, default=0)
+    parser.add_argument('--start', type=float, default=0.0)
+    args = parser.parse_args()
+    if args.child == 'seed':
+        seed(args)
+        return
+    if args.child:
+        args.role = args.child
+        run_client(args)
+        return
+
+    rows = []
+    locked = 0
+    modes = ('commit', 'api') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        for profile in PROFILES:
+            results = run_profile(profile, mode, args)
+            if profile == 'tuned':
+                locked += sum(r['locked'] for r in results)
+            rows.append(summarize(profile, mode, 'writer', results, args.duration))
+            if args.readers:
+                rows.append(summarize(profile, mode, 'reader', results, args.duration))
+    print_table(('profile', 'writes', 'role', 'ops', 'ops/s', 'p50 ms', 'p95 ms', 'p99 ms', 'locked', 'failed'), rows)
+    if locked:
+        raise SystemExit(f"tuned profile hit {locked} 'database is locked' errors")
+
+if __name__ == '__main__':
+    main()
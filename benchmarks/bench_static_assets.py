@@ -0,0 +1,80 @@
+"""Serving the React build: the legacy exists() + send_from_directory path
+re-gzipped by the after_request hook, versus the in-memory asset manifest.
+
+    python benchmarks/bench_static_assets.py [--bundle-kb 600] [--repeat 50]
+
+Writes a synthetic Vite-style build to a temp dir and points REACT_BUILD_DIR
+at it. "revalidate" sends the ETag from the first response back as
+If-None-Match.
+"""
+import argparse
+import os
+import random
+import tempfile
+
+from common import make_app, print_table, timed
+
+WORDS = ('const', 'return', 'function', 'useState', 'props', 'className', 'div', 'span', 'map', 'null')
+
+def write_build(bundle_kb):
+    root = tempfile.mkdtemp(prefix='fitit-dist-')
+    os.makedirs(os.path.join(root, 'assets'))
+    rng = random.Random(7)
+
+    def source(size):
+        words = []
+        while sum(len(word) + 1 for word in words) < size:
+            words.append(f'{rng.choice(WORDS)}{rng.randrange(500)}')
+        return ' '.join(words)
+
+    files = {
+        'index.html': '<!doctype html><html><head></head><body><div id="root"></div></body></html>' + source(1500),
+        'assets/index-Bq7x3kLm.js': source(bundle_kb * 1024),
+        'assets/index-C9d2Fe0a.css': source(bundle_kb * 64),
+    }
+    for path, text in files.items():
+        with open(os.path.join(root, path), 'w', encoding='utf-8') as handle:
+            handle.write(text)
+    return root, files
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bundle-kb', type=int, default=600)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    root, files = write_build(args.bundle_kb)
+    os.environ['REACT_BUILD_DIR'] = root
+    app = make_app()
+
+    from flask import send_from_directory
+
+    @app.route('/legacy/<path:path>')
+    def legacy(path):
+        if os.path.exists(os.path.join(root, path)):
+            return send_from_directory(root, path)
+        return send_from_directory(root, 'index.html')
+
+    client = app.test_client()
+    headers = {'Accept-Encoding': 'gzip, deflate, br'}
+    rows = []
+    for path in files:
+        legacy_response = client.get(f'/legacy/{path}', headers=headers)
+        response = client.get(f'/{path}', headers=headers)
+        revalidate = dict(headers, **{'If-None-Match': response.headers['ETag']})
+        assert client.get(f'/{path}', headers=revalidate).status_code == 304
+
+        old = timed(lambda: client.get(f'/legacy/{path}', headers=headers).get_data(), args.repeat)
+        new = timed(lambda: client.get(f'/{path}', headers=headers).get_data(), args.repeat)
+        hit = timed(lambda: client.get(f'/{path}', headers=revalidate).get_data(), args.repeat)
+        rows.append((
+            path, len(files[path]) // 1024,
+            f"{len(legacy_response.data) // 1024} {legacy_response.headers.get('Content-Encoding', '-')}",
+            f"{len(response.data) // 1024} {response.headers.get('Content-Encoding', '-')}",
+            f"{old['p50_ms']:.3f}", f"{new['p50_ms']:.3f}", f"{hit['p50_ms']:.3f}",
+        ))
+    print_table(('file', 'raw KB', 'legacy KB', 'manifest KB', 'legacy p50 ms', 'manifest p50 ms',
+                 'revalidate p50 ms'), rows)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Latency of /api/friends/search lookups against synthetic users.
+
+    python benchmarks/bench_user_search.py --users 1000000
+
+Compares the prefix-term index with the previous ilike('%q%') scan over
+username, profile_name and email.
+"""
+import argparse
+import random
+import sqlite3
+import string
+import time
+
+from common import make_app, temp_database_url, timed, print_table
+
+FIRST = ('james', 'maria', 'john', 'priya', 'wei', 'fatima', 'lucas', 'sofia', 'arjun', 'emma',
+         'noah', 'olivia', 'mateo', 'aisha', 'liam', 'chen', 'ravi', 'nina', 'omar', 'zoe')
+LAST = ('smith', 'garcia', 'kumar', 'nguyen', 'johnson', 'lee', 'patel', 'brown', 'silva', 'khan')
+
+def seed(path, users, seed_value=11):
+    from calorie_tracker.search import search_rows
+    rng = random.Random(seed_value)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous=OFF')
+    batch_users, batch_terms = [], []
+    for uid in range(1, users + 1):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        suffix = ''.join(rng.choices(string.ascii_lowercase + string.digits, k=5))
+        username = f'{first}{last[:3]}{suffix}'
+        profile_name = f'{first.title()} {last.title()}'
+        email = f'{first}.{last}.{suffix}@example.com'
+        batch_users.append((uid, username, profile_name, email, 'bench', 'sedentary'))
+        batch_terms.extend(
+            (row['term'], row['user_id'], row['rank'], row['sort_name'])
+            for row in search_rows(uid, username, profile_name, email)
+        )
+        if len(batch_users) == 5000 or uid == users:
+            conn.executemany('INSERT INTO user (id, username, profile_name, email, password_hash, activity_level) '
+                             'VALUES (?, ?, ?, ?, ?, ?)', batch_users)
+            conn.executemany('INSERT OR IGNORE INTO user_search_term (term, user_id, rank, sort_name) VALUES (?, ?, ?, ?)',
+                             batch_terms)
+            batch_users, batch_terms = [], []
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--skip-legacy', action='store_true', help='skip the ilike scan, which is slow at 1M users')
+    args = parser.parse_args()
+
+    database_url = temp_database_url('search')
+    app = make_app(database_url)
+    started = time.perf_counter()
+    seed(database_url.replace('sqlite:///', '', 1), args.users)
+    print(f'seeded {args.users} users in {time.perf_counter() - started:.1f}s')
+
+    rows = []
+    with app.app_context():
+        from sqlalchemy import or_
+        from calorie_tracker.models import User
+        from calorie_tracker.search import search_user_ids
+
+        def legacy(query):
+            return (User.query.filter(or_(
+                User.username.ilike(f'%{query}%'),
+                User.profile_name.ilike(f'%{query}%'),
+                User.email.ilike(f'%{query}%'),
+            )).order_by(User.username.asc()).limit(12).all())
+
+        for query in ('jo', 'pri', 'sofia', 'mariagar', 'omar kh', 'zzzz'):
+            indexed = timed(lambda: search_user_ids(query), args.repeat)
+            row = [query, len(search_user_ids(query)), f"{indexed['p50_ms']:.3f}", f"{indexed['p95_ms']:.3f}"]
+            if not args.skip_legacy:
+                scan = timed(lambda: legacy(query), max(args.repeat // 10, 3), warmup=1)
+                row.extend([f"{scan['p50_ms']:.3f}", f"{scan['p95_ms']:.3f}"])
+            rows.append(row)
+    headers = ['query', 'hits', 'index p50 ms', 'index p95 ms']
+    if not args.skip_legacy:
+        headers.extend(['ilike p50 ms', 'ilike p95 ms'])
+    print_table(headers, rows)
+
+if __name__ == '__main__':
+    main()
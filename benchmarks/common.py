@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+def temp_database_url(name='bench'):
+    path = os.path.join(tempfile.mkdtemp(prefix='fitit-'), f'{name}.db')
+    return f'sqlite:///{path}'
+
+def make_app(database_url=None, **config):
+    os.environ['DATABASE_URL'] = database_url or temp_database_url()
+    from config import Config
+    Config.SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
+    for key, value in config.items():
+        setattr(Config, key, value)
+    from calorie_tracker import create_app
+    app = create_app()
+    app.config['TESTING'] = True
+    return app
+
+def create_user(name, **fields):
+    from calorie_tracker import db
+    from calorie_tracker.models import User
+    user = User(username=name, email=f'{name}@bench.local', profile_name=name.title(), **fields)
+    user.password_hash = 'bench'
+    db.session.add(user)
+    db.session.flush()
+    return user
+
+def seed_day(user_id, day, entries_per_day):
+    from calorie_tracker import db
+    from calorie_tracker.models import FoodEntry, WaterEntry, StepEntry, SleepEntry, CaloriesBurntEntry
+    share = max(entries_per_day // 5, 1)
+    db.session.add_all(
+        [FoodEntry(user_id=user_id, date=day, name=f'food {i}', calories=100 + i, protein=5, carbs=12, fat=3, sugar=1)
+         for i in range(entries_per_day - 4 * share)]
+        + [WaterEntry(user_id=user_id, date=day, amount_ml=250) for _ in range(share)]
+        + [StepEntry(user_id=user_id, date=day, steps=1000) for _ in range(share)]
+        + [SleepEntry(user_id=user_id, date=day, duration_hours=0.5) for _ in range(share)]
+        + [CaloriesBurntEntry(user_id=user_id, date=day, calories_burnt=50) for _ in range(share)]
+    )
+
+def days_back(count, end=None):
+    end = end or date.today()
+    return [end - timedelta(days=offset) for offset in range(count)]
+
+def timed(fn, repeat=50, warmup=3):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return dict(
+        mean_ms=sum(samples) / len(samples),
+        p50_ms=samples[len(samples) // 2],
+        p95_ms=samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+    )
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).ljust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(row, widths)))
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _count(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(self.engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._count)
+
+def sync_sqlite(source_url, target_url):
+    # Stand-in for replication: copies the primary file over the replica with
+    # SQLite's online backup, which readers of the target see atomically.
+    import sqlite3
+    from sqlalchemy.engine import make_url
+    source = sqlite3.connect(make_url(source_url).database)
+    target = sqlite3.connect(make_url(target_url).database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
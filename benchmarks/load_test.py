@@ -0,0 +1,316 @@
+"""Scripted load against the API: throughput and p50/p95/p99 latency per
+endpoint, through the Flask test client and through a real threaded WSGI
+server on a local port.
+
+    python benchmarks/load_test.py [--transport both] [--duration 5] [--concurrency 4]
+                                   [--scenarios dashboard_polling,logging_burst,nibbly,friend_activity]
+                                   [--output load.json] [--baseline previous.json] [--tolerance 0.25]
+                                   [--users 50 --days 90 ...]
+
+Data comes from synthetic.py at the given scale, and Nibbly talks to
+stub_llm.py. Every worker logs in through /api/auth/login as its own user
+and runs its scenario in a loop for --duration seconds.
+
+--output writes the results as JSON with the commit they were measured on.
+With --baseline, the run exits 1 when an endpoint's p50 or p95 is more than
+--tolerance slower than in that file, ignoring differences under 1 ms, or
+when an endpoint that had no errors now has some.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+from http.cookies import SimpleCookie
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from common import ROOT, make_app, print_table
+from stub_llm import start_stub
+from synthetic import PASSWORD, add_scale_arguments, generate
+
+NIBBLY_MESSAGES = (
+    'ate a paneer wrap for lunch', 'drank 500 ml water', 'walked 6000 steps',
+    'how am I doing today', 'remember I like green tea', 'had oats with milk and a banana',
+)
+MIN_REGRESSION_MS = 1.0
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.error_examples = []
+        self._lock = threading.Lock()
+
+    def add(self, label, elapsed_ms, status, body):
+        with self._lock:
+            self.samples.setdefault(label, []).append(elapsed_ms)
+            if status >= 400:
+                self.errors[label] = self.errors.get(label, 0) + 1
+                if len(self.error_examples) < 5:
+                    self.error_examples.append(f'{label} -> {status}: {body[:200]!r}')
+
+class InProcessSession:
+    def __init__(self, app, recorder):
+        self.client = app.test_client()
+        self.recorder = recorder
+
+    def request(self, method, path, label=None, json=None, headers=None):
+        started = time.perf_counter()
+        response = self.client.open(path, method=method, json=json, headers=headers)
+        body = response.get_data()
+        self.recorder.add(label or f'{method} {path}', (time.perf_counter() - started) * 1000, response.status_code, body)
+        return response.status_code, response.headers, body
+
+class HttpSession:
+    # One keep-alive connection per worker, cookies kept by hand.
+    def __init__(self, address, recorder):
+        self.connection = http.client.HTTPConnection(*address, timeout=60)
+        self.cookies = SimpleCookie()
+        self.recorder = recorder
+
+    def request(self, method, path, label=None, json=None, headers=None):
+        headers = dict(headers or {})
+        body = None
+        if json is not None:
+            body = _json_bytes(json)
+            headers['Content-Type'] = 'application/json'
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{key}={morsel.value}' for key, morsel in self.cookies.items())
+        started = time.perf_counter()
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        self.recorder.add(label or f'{method} {path}', (time.perf_counter() - started) * 1000, response.status, data)
+        for cookie in response.headers.get_all('Set-Cookie') or ():
+            self.cookies.load(cookie)
+        return response.status, response.headers, data
+
+    def close(self):
+        self.connection.close()
+
+def _json_bytes(value):
+    return json.dumps(value).encode('utf-8')
+
+def log_in(session, email):
+    status, _, body = session.request('POST', '/api/auth/login', json=dict(email=email, password=PASSWORD))
+    if status != 200:
+        raise SystemExit(f'login as {email} failed with {status}: {body[:200]!r}')
+
+def conditional_get(session, state, path, label=None):
+    # Polling clients send back the last ETag they saw.
+    etag = state.get(path)
+    status, headers, _ = session.request('GET', path, label=label, headers={'If-None-Match': etag} if etag else None)
+    if headers.get('ETag'):
+        state[path] = headers.get('ETag')
+    return status
+
+def dashboard_polling(session, state, rng):
+    today = date.today()
+    conditional_get(session, state, '/api/dashboard')
+    conditional_get(session, state, '/api/entries')
+    start = (today - timedelta(days=29)).isoformat()
+    session.request('GET', f'/api/history?start={start}&end={today.isoformat()}', label='GET /api/history')
+    time.sleep(0.01)
+
+def logging_burst(session, state, rng):
+    for _ in range(3):
+        session.request('POST', '/api/entries/food', json=dict(
+            name=rng.choice(('oats with milk', 'banana', 'latte', 'paneer wrap')),
+            calories=rng.randint(90, 700), protein=rng.randint(1, 40),
+        ))
+    session.request('POST', '/api/entries/water', json=dict(amount_ml=250))
+    session.request('POST', '/api/entries/steps', json=dict(steps=rng.randint(500, 3000)))
+    conditional_get(session, state, '/api/dashboard')
+
+def nibbly(session, state, rng):
+    session.request('POST', '/api/coach/message', json=dict(message=rng.choice(NIBBLY_MESSAGES)))
+    if rng.random() < 0.25:
+        session.request('GET', '/api/coach/history')
+
+def friend_activity(session, state, rng):
+    conditional_get(session, state, '/api/friends')
+    session.request('GET', '/api/friends/activity')
+    session.request('GET', f'/api/friends/search?q=load{rng.randint(1, 9)}', label='GET /api/friends/search')
+
+SCENARIOS = dict(
+    dashboard_polling=dashboard_polling,
+    logging_burst=logging_burst,
+    nibbly=nibbly,
+    friend_activity=friend_activity,
+)
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+def run_scenario(scenario, new_session, emails, args):
+    recorder = Recorder()
+    iterations = [0] * args.concurrency
+    ready = threading.Barrier(args.concurrency + 1)
+    failures = []
+
+    def worker(index):
+        rng = random.Random(args.seed * 1000 + index)
+        try:
+            # The login goes to a throwaway recorder so it is not measured.
+            session = new_session(Recorder())
+            log_in(session, emails[index % len(emails)])
+        except BaseException as exc:
+            failures.append(exc)
+            ready.abort()
+            return
+        session.recorder = recorder
+        ready.wait()
+        state = {}
+        deadline = time.perf_counter() + args.duration
+        while time.perf_counter() < deadline:
+            scenario(session, state, rng)
+            iterations[index] += 1
+        if hasattr(session, 'close'):
+            session.close()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    try:
+        ready.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        raise SystemExit(f'worker setup failed: {failures[0]}')
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return recorder, sum(iterations), time.perf_counter() - started
+
+def summarize(transport, scenario, recorder, seconds):
+    rows = []
+    for label, samples in sorted(recorder.samples.items()):
+        samples = sorted(samples)
+        rows.append(dict(
+            transport=transport, scenario=scenario, endpoint=label, requests=len(samples),
+            errors=recorder.errors.get(label, 0), rps=round(len(samples) / seconds, 1),
+            mean_ms=round(sum(samples) / len(samples), 3), p50_ms=round(percentile(samples, 0.5), 3),
+            p95_ms=round(percentile(samples, 0.95), 3), p99_ms=round(percentile(samples, 0.99), 3),
+            max_ms=round(samples[-1], 3),
+        ))
+    return rows
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=ROOT, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+def regressions(results, baseline, tolerance):
+    previous = {(r['transport'], r['scenario'], r['endpoint']): r for r in baseline['results']}
+    found = []
+    for row in results:
+        old = previous.get((row['transport'], row['scenario'], row['endpoint']))
+        if old is None:
+            continue
+        if row['errors'] and not old['errors']:
+            found.append(f"{row['transport']} {row['scenario']} {row['endpoint']}: {row['errors']} errors, none before")
+        for field in ('p50_ms', 'p95_ms'):
+            if row[field] > old[field] * (1 + tolerance) and row[field] - old[field] >= MIN_REGRESSION_MS:
+                found.append(f"{row['transport']} {row['scenario']} {row['endpoint']} {field}: "
+                             f"{old[field]:.2f} -> {row[field]:.2f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transport', choices=('test-client', 'wsgi', 'both'), default='both')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--llm-latency', type=float, default=0.05)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"unknown scenarios: {', '.join(unknown)}; choose from {', '.join(SCENARIOS)}")
+    transports = ('test-client', 'wsgi') if args.transport == 'both' else (args.transport,)
+
+    stub, stub_url = start_stub(latency=args.llm_latency)
+    os.environ.update(GEMINI_API_BASE=stub_url, GEMINI_API_KEY='stub')
+    app = make_app()
+    started = time.perf_counter()
+    with app.app_context():
+        generate(args)
+    print(f'seeded {args.users} users x {args.days} days in {time.perf_counter() - started:.1f}s', flush=True)
+    emails = [f'load{i}@load.local' for i in range(args.users)]
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    sessions = {
+        'test-client': lambda recorder: InProcessSession(app, recorder),
+        'wsgi': lambda recorder: HttpSession(server.server_address, recorder),
+    }
+
+    results, runs, examples = [], [], []
+    try:
+        for transport in transports:
+            for name in scenarios:
+                recorder, iterations, seconds = run_scenario(SCENARIOS[name], sessions[transport], emails, args)
+                results.extend(summarize(transport, name, recorder, seconds))
+                runs.append(dict(transport=transport, scenario=name, iterations=iterations,
+                                 seconds=round(seconds, 2), iterations_per_s=round(iterations / seconds, 1)))
+                examples.extend(recorder.error_examples)
+    finally:
+        server.shutdown()
+        stub.shutdown()
+        from calorie_tracker.jobs import wait
+        wait()
+
+    print_table(('transport', 'scenario', 'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'), [
+        (r['transport'], r['scenario'], r['endpoint'], r['requests'], r['errors'], r['rps'],
+         f"{r['p50_ms']:.2f}", f"{r['p95_ms']:.2f}", f"{r['p99_ms']:.2f}") for r in results
+    ])
+    print()
+    print_table(('transport', 'scenario', 'iterations', 'iterations/s'), [
+        (r['transport'], r['scenario'], r['iterations'], r['iterations_per_s']) for r in runs
+    ])
+    for example in examples:
+        print(f'error: {example}')
+
+    commit, dirty = git_commit()
+    report = dict(
+        meta=dict(commit=commit, dirty=dirty, created_at=datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+                  python=platform.python_version(), platform=platform.platform(),
+                  database=app.config['SQLALCHEMY_DATABASE_URI'].split(':', 1)[0], args=vars(args)),
+        scenarios=runs,
+        results=results,
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'wrote {args.output}')
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        if found:
+            print(f"slower than {args.baseline} ({baseline['meta'].get('commit')}):")
+            print('\n'.join(f'  {line}' for line in found))
+            sys.exit(1)
+        print(f"no endpoint more than {args.tolerance:.0%} slower than {args.baseline}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Local stand-in for the Gemini and OpenAI HTTP APIs.
+
+    python benchmarks/stub_llm.py --port 8765 --latency 2
+    GEMINI_API_KEY=stub GEMINI_API_BASE=http://127.0.0.1:8765 flask run
+
+Replies are canned JSON shaped like the prompt that was sent, so Nibbly,
+suggestions and dashboard insights all parse them. Streaming requests
+(Gemini `streamGenerateContent?alt=sse`, OpenAI `"stream": true`) get the
+same text as server-sent events in STREAM_CHUNKS pieces spread over the
+latency, so the first token arrives well before the last.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_CHUNKS = 8
+
+def canned_reply(prompt):
+    if 'suggestion chips' in prompt:
+        return {'suggestions': ['Log 2 eggs', 'Log 500 ml water', 'Make rice a larger portion', 'Remove coffee']}
+    if 'dashboard insights' in prompt:
+        return {'insights': ['Protein is on track.', 'Drink another 500 ml of water.', 'A short walk helps close the step gap.']}
+    if 'in-app nutrition agent' in prompt:
+        message = re.search(r'"message": "([^"]*)"', prompt)
+        name = (message.group(1) if message else 'meal')[:60] or 'meal'
+        return {
+            'reply': f'Logged {name}.',
+            'tool_calls': [{'tool': 'create_food', 'args': {
+                'name': name, 'calories': 420, 'protein': 24, 'carbs': 48, 'fat': 14, 'sugar': 6,
+            }}],
+        }
+    return {'reply': 'Sounds good. Tell me what you ate next.', 'memories': []}
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.0
+    requests = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        with StubHandler.lock:
+            StubHandler.requests += 1
+        openai = self.path.startswith('/v1/responses')
+        if openai:
+            prompt = ' '.join(str(item.get('content', '')) for item in body.get('input', []))
+        else:
+            prompt = ' '.join(
+                part.get('text', '')
+                for content in body.get('contents', [])
+                for part in content.get('parts', [])
+            )
+        text = json.dumps(canned_reply(prompt))
+        if body.get('stream') or ':streamGenerateContent' in self.path:
+            self.stream(text, openai)
+            return
+        if self.latency:
+            time.sleep(self.latency)
+        if openai:
+            payload = {'output_text': text}
+        else:
+            payload = {'candidates': [{'content': {'parts': [{'text': text}]}}]}
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, text, openai):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        size = -(-len(text) // STREAM_CHUNKS)
+        for start in range(0, len(text), size):
+            if self.latency:
+                time.sleep(self.latency / STREAM_CHUNKS)
+            piece = text[start:start + size]
+            if openai:
+                event = {'type': 'response.output_text.delta', 'delta': piece}
+            else:
+                event = {'candidates': [{'content': {'parts': [{'text': piece}]}}]}
+            self.write_chunk(f'data: {json.dumps(event)}\n\n')
+        if openai:
+            self.write_chunk('data: {"type": "response.completed"}\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, text):
+        data = text.encode('utf-8')
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+def start_stub(port=0, latency=0.0):
+    handler = type('Handler', (StubHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    server, url = start_stub(args.port, args.latency)
+    print(f'stub LLM listening on {url} with {args.latency}s latency')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Seeded synthetic data for load tests: users with goals, a few years of
+entries, accepted friendships, Nibbly chat history and memories.
+
+    python benchmarks/synthetic.py --database sqlite:///fitit-load.db --users 200 --days 365
+
+Generation is deterministic for a given --seed. Entries go through
+calorie_tracker.bulk, so rollups, food profiles and the search index are the
+same as for real traffic. Every user can log in with PASSWORD.
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as clock, timedelta
+
+from common import make_app
+
+PASSWORD = 'load-test'
+
+FOODS = (
+    ('oats with milk', 320, 12, 54, 7, 12), ('scrambled eggs', 210, 14, 2, 16, 1),
+    ('chicken rice bowl', 640, 42, 78, 14, 4), ('dal and rice', 520, 18, 88, 9, 3),
+    ('paneer wrap', 480, 22, 46, 22, 5), ('greek yogurt', 150, 15, 8, 4, 6),
+    ('banana', 105, 1, 27, 0, 14), ('latte', 190, 10, 15, 7, 14),
+    ('salmon salad', 430, 34, 12, 26, 5), ('pasta bolognese', 690, 31, 86, 21, 9),
+    ('protein shake', 180, 30, 6, 3, 2), ('apple', 95, 0, 25, 0, 19),
+)
+MEAL_TIMES = (clock(8, 15), clock(13, 0), clock(16, 30), clock(20, 0), clock(21, 30))
+CHAT_LINES = (
+    ('user', 'ate a chicken rice bowl for lunch', 'log_food'),
+    ('assistant', 'Logged chicken rice bowl, 640 kcal.', 'log_food'),
+    ('user', 'how am I doing on protein today', 'chat'),
+    ('assistant', 'You are 40 g short of your protein goal. A shake would close most of it.', 'chat'),
+    ('user', 'drank 500 ml water', 'log_water'),
+    ('assistant', 'Added 500 ml of water.', 'log_water'),
+)
+MEMORIES = (
+    ('diet', 'vegetarian on weekdays'), ('allergy', 'peanuts'), ('goal', 'lose 4 kg before summer'),
+    ('drink', 'prefers green tea'), ('schedule', 'trains at 7am'), ('dislikes', 'mushrooms'),
+)
+
+def add_scale_arguments(parser):
+    # generate() takes the parsed namespace, so scripts share these flags.
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--days', type=int, default=90)
+    parser.add_argument('--foods-per-day', type=int, default=4)
+    parser.add_argument('--friends', type=int, default=10)
+    parser.add_argument('--chat-messages', type=int, default=200)
+    parser.add_argument('--memories', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+
+def entry_rows(rng, scale, today):
+    # Rows in the bulk import format, oldest day first.
+    for offset in range(scale.days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        for meal in range(rng.randint(max(scale.foods_per_day - 1, 0), scale.foods_per_day + 1)):
+            name, calories, protein, carbs, fat, sugar = rng.choice(FOODS)
+            portion = rng.choice((0.75, 1, 1, 1, 1.5))
+            yield dict(type='food', date=day, time=MEAL_TIMES[meal % len(MEAL_TIMES)].strftime('%H:%M'), name=name,
+                       calories=round(calories * portion), protein=round(protein * portion),
+                       carbs=round(carbs * portion), fat=round(fat * portion), sugar=round(sugar * portion))
+        for _ in range(rng.randint(2, 6)):
+            yield dict(type='water', date=day, amount_ml=rng.choice((250, 330, 500)))
+        yield dict(type='steps', date=day, steps=rng.randint(2000, 16000))
+        yield dict(type='sleep', date=day, sleep_time=f'{rng.choice((22, 23, 0)):02d}:{rng.choice((0, 30)):02d}',
+                   wake_time=f'{rng.randint(6, 8):02d}:{rng.choice((0, 15, 45)):02d}')
+        if rng.random() < 0.4:
+            yield dict(type='calories_burnt', date=day, calories_burnt=rng.randint(150, 700))
+        if offset % 7 == 0:
+            yield dict(type='weight', date=day, weight_kg=round(rng.uniform(55, 95), 1))
+
+def create_users(scale, rng, prefix):
+    from werkzeug.security import generate_password_hash
+    from calorie_tracker import db
+    from calorie_tracker.models import User
+    # One hash for everyone: pbkdf2 per user would dominate seeding time.
+    password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256')
+    users = []
+    for i in range(scale.users):
+        user = User(
+            username=f'{prefix}{i}', email=f'{prefix}{i}@load.local', profile_name=f'Load User {i}',
+            password_hash=password_hash, height_cm=rng.randint(155, 195), weight_kg=rng.randint(55, 95),
+            gender=rng.choice(('male', 'female')), calorie_goal=rng.choice((1800, 2000, 2200, 2500)),
+            protein_goal=rng.choice((90, 120, 150)),
+        )
+        db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    return [user.id for user in users]
+
+def create_friendships(user_ids, scale):
+    from calorie_tracker import db
+    from calorie_tracker.models import Friendship
+    # Each user befriends the next `friends / 2` users around a ring, so
+    # everyone ends up with about `friends` accepted friends.
+    half = min(scale.friends // 2, max(len(user_ids) - 1, 0) // 2)
+    now = datetime.utcnow()
+    rows = [
+        dict(requester_id=user_id, receiver_id=user_ids[(i + step) % len(user_ids)], status='accepted',
+             created_at=now, updated_at=now)
+        for i, user_id in enumerate(user_ids) for step in range(1, half + 1)
+    ]
+    if rows:
+        db.session.execute(Friendship.__table__.insert(), rows)
+
+def create_chat(user_ids, scale, rng):
+    from calorie_tracker import db
+    from calorie_tracker.models import ChatMessage, UserMemory
+    from calorie_tracker.shards import using_shard
+    now = datetime.utcnow()
+    for user_id in user_ids:
+        started = now - timedelta(minutes=scale.chat_messages * 10)
+        messages = []
+        for i in range(scale.chat_messages):
+            role, content, intent = CHAT_LINES[i % len(CHAT_LINES)]
+            messages.append(dict(user_id=user_id, role=role, content=content, intent=intent,
+                                 created_at=started + timedelta(minutes=i * 10)))
+        memories = [
+            dict(user_id=user_id, key=key, value=value, updated_at=now)
+            for key, value in rng.sample(MEMORIES, min(scale.memories, len(MEMORIES)))
+        ]
+        # Core inserts carry no instance to route by, so name the user's shard.
+        with using_shard(user_id):
+            if messages:
+                db.session.execute(ChatMessage.__table__.insert(), messages)
+            if memories:
+                db.session.execute(UserMemory.__table__.insert(), memories)
+
+def generate(scale, prefix='load'):
+    # Call inside an app context. Returns the new user ids.
+    from calorie_tracker import db
+    from calorie_tracker.bulk import import_rows
+    rng = random.Random(scale.seed)
+    user_ids = create_users(scale, rng, prefix)
+    today = date.today()
+    for user_id in user_ids:
+        rows = ((line, row, None) for line, row in enumerate(entry_rows(rng, scale, today), 1))
+        result = import_rows(user_id, rows)
+        if result['rejected']:
+            raise RuntimeError(f"synthetic rows rejected: {result['errors'][:3]}")
+    create_friendships(user_ids, scale)
+    create_chat(user_ids, scale, rng)
+    db.session.commit()
+    return user_ids
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--database', help='SQLAlchemy URL to seed (default: a new temp SQLite file)')
+    parser.add_argument('--prefix', default='load')
+    add_scale_arguments(parser)
+    args = parser.parse_args()
+
+    app = make_app(args.database)
+    started = time.perf_counter()
+    with app.app_context():
+        user_ids = generate(args, args.prefix)
+    print(f"seeded {len(user_ids)} users in {time.perf_counter() - started:.1f}s into {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f'log in as {args.prefix}0@load.local / {PASSWORD}')
+
+if __name__ == '__main__':
+    main()
@@ -1,77 +1,122 @@
-from flask import Flask, request, send_from_directory
+from flask import Flask, request
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
 from flask_cors import CORS
 from config import Config
 import os
-import gzip
+from .routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 migrate = Migrate()
 
-REACT_BUILD = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
-
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
     CORS(app, supports_credentials=True, origins=['http://localhost:3000'])
 
-    @app.after_request
-    def gzip_text_responses(response):
-        if (
-            'gzip' not in request.headers.get('Accept-Encoding', '').lower()
-            or response.status_code < 200
-            or response.status_code >= 300
-            or response.headers.get('Content-Encoding')
-        ):
-            return response
-
-        content_type = response.headers.get('Content-Type', '')
-        compressible = (
-            content_type.startswith('text/')
-            or 'javascript' in content_type
-            or 'json' in content_type
-            or 'xml' in content_type
-            or 'svg' in content_type
-        )
-        if not compressible:
-            return response
-
-        if response.direct_passthrough:
-            response.direct_passthrough = False
-
-        body = response.get_data()
-        if len(body) < 1024:
-            return response
-
-        compressed = gzip.compress(body)
-        response.set_data(compressed)
-        response.headers['Content-Encoding'] = 'gzip'
-        response.headers['Content-Length'] = str(len(compressed))
-        response.headers['Vary'] = 'Accept-Encoding'
-        return response
+    # Metrics hooks go first so their timer spans every other hook, compression included.
+    from .metrics import enabled as metrics_enabled, init_metrics, install_db_timer
+    init_metrics(app)
+
+    # Registered early so it runs late, after every other hook has set the body.
+    from .compression import init_compression
+    init_compression(app)
 
+    from .engine import engine_options, install_pragmas
+    from .routing import REPLICA, replica_url
+    from .shards import bind_key, create_shard_tables, each_shard, shard_binds, shard_count
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config['SQLALCHEMY_DATABASE_URI']))
+    if replica_url():
+        app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA] = dict(url=replica_url(), **engine_options(replica_url()))
+    app.config.setdefault('SQLALCHEMY_BINDS', {}).update(shard_binds(engine_options))
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
 
+    from .turn import install_query_counter, query_count, reset_turn
+
+    @app.before_request
+    def start_turn():
+        reset_turn()
+
+    @app.after_request
+    def expose_query_count(response):
+        if app.debug or app.testing:
+            response.headers['X-Query-Count'] = str(query_count())
+        return response
+
     # Register only the API blueprint
     from .routes.api_routes import api_bp
     app.register_blueprint(api_bp)
 
+    from .cache import cache_cli
+    from .engine import engine_cli
+    from .food_profile import food_profiles_cli
+    from .jobs import jobs_cli
+    from .meal_parser import meals_cli
+    from .rollups import rollups_cli
+    from .search import search_cli
+    from .shards import shards_cli
+    from .static_assets import assets_cli
+    app.cli.add_command(cache_cli)
+    app.cli.add_command(engine_cli)
+    app.cli.add_command(food_profiles_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(meals_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(shards_cli)
+
     # Serve React build for all non-API routes
+    from .static_assets import get_manifest, serve_asset
+
     @app.route('/', defaults={'path': ''})
     @app.route('/<path:path>')
     def serve_react(path):
-        file_path = os.path.join(REACT_BUILD, path)
-        if path and os.path.exists(file_path):
-            return send_from_directory(REACT_BUILD, path)
-        return send_from_directory(REACT_BUILD, 'index.html')
+        return serve_asset(path)
+
+    # Read and compress the build once here instead of per request.
+    get_manifest()
 
     with app.app_context():
+        install_pragmas(db.engine)
+        if REPLICA in db.engines:
+            install_pragmas(db.engines[REPLICA], read_only=True)
+        for shard in range(1, shard_count()):
+            install_pragmas(db.engines[bind_key(shard)])
+        for engine in db.engines.values():
+            install_query_counter(engine)
+            if metrics_enabled():
+                install_db_timer(engine)
         db.create_all()
+        for shard in range(1, shard_count()):
+            create_shard_tables(db.engines[bind_key(shard)])
+        from .food_profile import backfill_empty as backfill_food_profiles
+        from .rollups import backfill_empty as backfill_rollups
+        for _ in each_shard():
+            count = backfill_rollups()
+            if count:
+                app.logger.warning('Backfilled %d rollup day(s) from existing entries.', count)
+            count = backfill_food_profiles()
+            if count:
+                app.logger.warning('Backfilled %d food profile(s) from existing entries.', count)
+        from .search import backfill_index
+        count = backfill_index()
+        if count:
+            app.logger.warning('Indexed %d existing user(s) for search.', count)
+        if os.environ.get('FOOD_DATABASE_PATH'):
+            # Large datasets take seconds to index; build it before the first lookup needs it.
+            from .food_index import get_food_index
+            from .jobs import submit
+            submit('food-index', get_food_index)
+
+    # Outbox workers, and the replay of jobs committed before a crash or
+    # restart, start with the first request.
+    from .jobs import init_app as init_jobs
+    init_jobs(app)
 
     return app
@@ -0,0 +1,164 @@
+from collections import defaultdict
+from datetime import date
+import csv
+import io
+import json
+from sqlalchemy import select
+from . import db
+from . import food_profile, rollups, shards
+from .cache import get_cache, scope_for
+from .entries import ENTRY_MODELS, EntryError, entry_values
+from .models import FoodEntry
+from .utils import TOTAL_METRICS
+from .versions import ENTRIES, bump
+
+# Export columns per type; import reads the same names, so an export loads back as-is.
+EXPORT_FIELDS = dict(
+    food=('date', 'time', 'name', 'calories', 'protein', 'carbs', 'fat', 'sugar'),
+    water=('date', 'amount_ml'),
+    weight=('date', 'weight_kg'),
+    steps=('date', 'steps'),
+    sleep=('date', 'sleep_time', 'wake_time', 'duration_hours'),
+    calories_burnt=('date', 'calories_burnt'),
+)
+CSV_FIELDS = ('type', *dict.fromkeys(f for fields in EXPORT_FIELDS.values() for f in fields), 'unit')
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+SUGGESTION_REFRESH_DAYS = 7
+def read_rows(stream, content_type):
+    # Yields (line number, row dict or None, parse error) without reading the whole body.
+    text = io.TextIOWrapper(stream, encoding='utf-8', errors='replace', newline='')
+    if content_type == 'text/csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, {k: v.strip() for k, v in row.items() if k and v and v.strip()}, None
+        return
+    for number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield number, None, 'Invalid JSON'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Each line must be a JSON object'
+            continue
+        yield number, row, None
+
+def _write_batch(user_id, batch):
+    # Entries and their derived rows go to the user's shard.
+    connection = db.session.connection(bind_arguments=dict(shard=shards.shard_of(user_id)))
+    deltas = defaultdict(lambda: dict.fromkeys(TOTAL_METRICS, 0))
+    changes = defaultdict(food_profile._new_bucket)
+    for entry_type, rows in batch.items():
+        model = ENTRY_MODELS[entry_type]
+        # executemany; no ORM objects, so the after_flush hooks never see these
+        # rows and their derived tables are updated here instead.
+        connection.execute(model.__table__.insert(), rows)
+        columns = rollups.ROLLUP_SOURCES.get(model)
+        for row in rows:
+            if columns:
+                rollups._add(deltas, user_id, row['date'], columns, row.get, 1)
+            if model is FoodEntry:
+                food_profile._add(changes, user_id, row['name'], row['date'], row.get, 1)
+    rollups.apply_deltas(connection, deltas)
+    food_profile.apply_changes(connection, changes)
+    return {row['date'] for rows in batch.values() for row in rows}
+
+def _finish_import(user_id, days, today):
+    # The cache and resource versions are global.
+    get_cache().invalidate_scopes({scope_for(user_id, day) for day in days}, db.session.connection())
+    bump(db.session.connection(), {(user_id, ENTRIES)})
+    # Refreshed after commit by the same listener as single writes. Older
+    # days keep their chips until they expire rather than costing a provider
+    # call each.
+    recent = {(user_id, day) for day in days if (today - day).days < SUGGESTION_REFRESH_DAYS}
+    if recent:
+        db.session.info.setdefault('suggestion_days', set()).update(recent)
+
+def import_rows(user_id, rows, batch_size=BATCH_SIZE):
+    # One transaction: batches bound memory, not what a failure leaves behind,
+    # so an import that fails part way writes nothing.
+    today = date.today()
+    result = dict(inserted=0, rejected=0, by_type=dict.fromkeys(ENTRY_MODELS, 0), errors=[])
+    batch, pending, days = defaultdict(list), 0, set()
+
+    def reject(line, message):
+        result['rejected'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append(dict(line=line, error=message))
+
+    def write():
+        days.update(_write_batch(user_id, batch))
+        for entry_type, written in batch.items():
+            result['by_type'][entry_type] += len(written)
+        result['inserted'] += pending
+
+    try:
+        for line, row, error in rows:
+            if error:
+                reject(line, error)
+                continue
+            entry_type = str(row.get('type') or '').strip()
+            try:
+                values = entry_values(entry_type, row, today)
+            except EntryError as exc:
+                reject(line, str(exc))
+                continue
+            batch[entry_type].append(dict(values, user_id=user_id))
+            pending += 1
+            if pending >= batch_size:
+                write()
+                batch, pending = defaultdict(list), 0
+        if pending:
+            write()
+        if days:
+            _finish_import(user_id, days, today)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+def _export_value(value):
+    if value is None:
+        return None
+    if isinstance(value, date):
+        return value.isoformat()
+    if hasattr(value, 'strftime'):
+        return value.strftime('%H:%M')
+    return value
+
+def export_rows(user_id, start=None, end=None, batch_size=BATCH_SIZE):
+    # One list of rows per fetched partition, so memory is bounded by batch_size.
+    for entry_type, fields in EXPORT_FIELDS.items():
+        model = ENTRY_MODELS[entry_type]
+        query = select(*(getattr(model, field) for field in fields)).where(model.user_id == user_id)
+        if start is not None:
+            query = query.where(model.date >= start)
+        if end is not None:
+            query = query.where(model.date <= end)
+        result = db.session.execute(query.order_by(model.date, model.id).execution_options(yield_per=batch_size))
+        for partition in result.partitions():
+            yield [
+                dict(type=entry_type, **{field: _export_value(value) for field, value in zip(fields, row)})
+                for row in partition
+            ]
+
+def export_ndjson(user_id, start=None, end=None):
+    for rows in export_rows(user_id, start, end):
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+def export_csv(user_id, start=None, end=None):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CSV_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+    for rows in export_rows(user_id, start, end):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,258 @@
+from collections import OrderedDict, defaultdict
+from itertools import chain
+import hashlib
+import json
+import os
+import threading
+import time
+import click
+from flask.cli import AppGroup
+from sqlalchemy import delete, event, func, inspect, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from . import db
+from .models import CacheEntry, FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry
+from .rollups import _committed_value
+
+DEFAULT_TTL = 3600
+DEFAULT_MAX_ENTRIES = 1024
+
+# Shared entries only get their LRU timestamp refreshed this often, so a hot
+# key does not turn every read into a write.
+TOUCH_INTERVAL = 60
+
+# A write to any of these drops cached responses for that entry's user and day.
+SCOPED_MODELS = (FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry)
+
+def context_digest(*parts):
+    payload = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def scope_for(user_id, date_):
+    return f'{user_id}:{date_.isoformat()}'
+
+class _Counters:
+    def __init__(self):
+        self._counts = dict(hits=0, misses=0, sets=0, evictions=0, invalidations=0, errors=0)
+        self._counts_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._counts_lock:
+            self._counts[name] += amount
+
+    def stats(self):
+        with self._counts_lock:
+            stats = dict(self._counts)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+
+class MemoryCache(_Counters):
+    backend = 'memory'
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._scopes = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def _drop(self, key):
+        _, scope, _ = self._entries.pop(key)
+        keys = self._scopes.get(scope)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._scopes[scope]
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[0] <= time.time():
+                self._drop(key)
+                item = None
+            if item is not None:
+                self._entries.move_to_end(key)
+        self._count('hits' if item is not None else 'misses')
+        return item[2] if item is not None else None
+
+    def set(self, key, value, scope, ttl=None):
+        evicted = 0
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + (ttl or self.ttl), scope, value)
+            self._scopes[scope].add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                evicted += 1
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def invalidate_scopes(self, scopes, connection=None):
+        dropped = 0
+        with self._lock:
+            for scope in scopes:
+                for key in list(self._scopes.get(scope, ())):
+                    self._drop(key)
+                    dropped += 1
+        if dropped:
+            self._count('invalidations', dropped)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['entries'] = len(self._entries)
+        return dict(stats, backend=self.backend)
+
+# Rows live in the app database, so every worker shares hits.
+class DatabaseCache(_Counters):
+    backend = 'database'
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        super().__init__()
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get(self, key):
+        table = CacheEntry.__table__
+        now = time.time()
+        try:
+            with db.engine.connect() as connection:
+                row = connection.execute(
+                    select(table.c.value, table.c.expires_at, table.c.used_at).where(table.c.key == key)
+                ).first()
+                if row is not None and row.expires_at > now and now - row.used_at > TOUCH_INTERVAL:
+                    connection.execute(update(table).where(table.c.key == key).values(used_at=now))
+                    connection.commit()
+        except SQLAlchemyError:
+            self._count('errors')
+            row = None
+        if row is None or row.expires_at <= now:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return json.loads(row.value)
+
+    def set(self, key, value, scope, ttl=None):
+        table = CacheEntry.__table__
+        now = time.time()
+        row = dict(key=key, scope=scope, value=json.dumps(value), expires_at=now + (ttl or self.ttl), used_at=now)
+        try:
+            with db.engine.begin() as connection:
+                dialect = connection.dialect.name
+                if dialect in ('sqlite', 'postgresql'):
+                    insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+                    statement = insert(table)
+                    statement = statement.on_conflict_do_update(
+                        index_elements=['key'],
+                        set_={column: statement.excluded[column] for column in ('scope', 'value', 'expires_at', 'used_at')},
+                    )
+                    connection.execute(statement, row)
+                else:
+                    connection.execute(delete(table).where(table.c.key == key))
+                    connection.execute(table.insert(), row)
+                evicted = self._evict(connection, now)
+        except SQLAlchemyError:
+            self._count('errors')
+            return
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def _evict(self, connection, now):
+        table = CacheEntry.__table__
+        evicted = connection.execute(delete(table).where(table.c.expires_at <= now)).rowcount or 0
+        excess = connection.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+        if excess > 0:
+            oldest = select(table.c.key).order_by(table.c.used_at).limit(excess).scalar_subquery()
+            evicted += connection.execute(delete(table).where(table.c.key.in_(oldest))).rowcount or 0
+        return evicted
+
+    def invalidate_scopes(self, scopes, connection=None):
+        table = CacheEntry.__table__
+        statement = delete(table).where(table.c.scope.in_(list(scopes)))
+        if connection is not None:
+            dropped = connection.execute(statement).rowcount
+        else:
+            with db.engine.begin() as own_connection:
+                dropped = own_connection.execute(statement).rowcount
+        if dropped:
+            self._count('invalidations', dropped)
+
+    def clear(self):
+        with db.engine.begin() as connection:
+            connection.execute(delete(CacheEntry.__table__))
+
+    def stats(self):
+        stats = super().stats()
+        try:
+            with db.engine.connect() as connection:
+                stats['entries'] = connection.execute(select(func.count()).select_from(CacheEntry.__table__)).scalar()
+        except SQLAlchemyError:
+            stats['entries'] = None
+        return dict(stats, backend=self.backend)
+
+BACKENDS = {'memory': MemoryCache, 'database': DatabaseCache}
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend = os.environ.get('AI_CACHE_BACKEND', 'memory').lower()
+                if backend not in BACKENDS:
+                    raise ValueError(f'AI_CACHE_BACKEND must be one of: {", ".join(BACKENDS)}')
+                _cache = BACKENDS[backend](
+                    max_entries=int(os.environ.get('AI_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)),
+                    ttl=float(os.environ.get('AI_CACHE_TTL_SECONDS', DEFAULT_TTL)),
+                )
+    return _cache
+
+def reset_cache():
+    global _cache
+    with _cache_lock:
+        _cache = None
+
+def changed_days(session):
+    days = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if not isinstance(obj, SCOPED_MODELS):
+            continue
+        if obj.user_id is not None and obj.date is not None:
+            days.add((obj.user_id, obj.date))
+        if obj not in session.new:
+            # A moved entry also touches the day it left.
+            state = inspect(obj)
+            user_id, date_ = _committed_value(state, 'user_id'), _committed_value(state, 'date')
+            if user_id is not None and date_ is not None:
+                days.add((user_id, date_))
+    return days
+
+@event.listens_for(db.session, 'after_flush')
+def _invalidate_changed_days(session, flush_context):
+    scopes = {scope_for(user_id, date_) for user_id, date_ in changed_days(session)}
+    if scopes:
+        get_cache().invalidate_scopes(scopes, session.connection())
+
+cache_cli = AppGroup('cache', help='Inspect and clear the AI response cache.')
+
+@cache_cli.command('stats')
+def stats_command():
+    for name, value in get_cache().stats().items():
+        click.echo(f'{name}: {value}')
+
+@cache_cli.command('clear')
+def clear_command():
+    get_cache().clear()
+    click.echo('Cleared the AI response cache.')
@@ -0,0 +1,197 @@
+import threading
+import time
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MIN_BYTES = 1024
+LARGE_BYTES = 64 * 1024
+
+# Levels per payload class. Past these, each step costs far more CPU than
+# the bytes it saves on JSON (gzip 9 is ~3x gzip 4 for ~7% less output on a
+# year of history). Streams flush after every chunk, so they stay cheap.
+LEVELS = {
+    'zstd': dict(small=3, large=1, stream=3),
+    'br': dict(small=5, large=4, stream=4),
+    'gzip': dict(small=6, large=4, stream=5),
+}
+
+def compressible(mimetype):
+    return (
+        mimetype.startswith('text/')
+        or 'javascript' in mimetype
+        or 'json' in mimetype
+        or 'xml' in mimetype
+        or 'svg' in mimetype
+    )
+
+class GzipCompressor:
+    def __init__(self, level):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._obj.flush()
+
+class BrotliCompressor:
+    def __init__(self, level):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data):
+        return self._obj.process(data)
+
+    def flush(self):
+        return self._obj.flush()
+
+    def finish(self):
+        return self._obj.finish()
+
+class ZstdCompressor:
+    def __init__(self, level):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._obj.compress(data)
+
+    def flush(self):
+        return self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._obj.flush()
+
+# Server preference when the client rates encodings equally: zstd is the
+# cheapest per byte saved, brotli the smallest, gzip the fallback.
+COMPRESSORS = {'gzip': GzipCompressor}
+if brotli is not None:
+    COMPRESSORS['br'] = BrotliCompressor
+if zstandard is not None:
+    COMPRESSORS['zstd'] = ZstdCompressor
+PREFERENCE = ('zstd', 'br', 'gzip')
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+def _record(encoding, bytes_in, bytes_out, cpu):
+    with _stats_lock:
+        stats = _stats.setdefault(encoding, dict(responses=0, bytes_in=0, bytes_out=0, cpu_ms=0.0))
+        stats['responses'] += 1
+        stats['bytes_in'] += bytes_in
+        stats['bytes_out'] += bytes_out
+        stats['cpu_ms'] += cpu * 1000
+
+def compression_stats():
+    with _stats_lock:
+        return {encoding: dict(stats, cpu_ms=round(stats['cpu_ms'], 3)) for encoding, stats in _stats.items()}
+
+def reset_compression_stats():
+    with _stats_lock:
+        _stats.clear()
+
+def negotiate(accept_encodings, encodings=None):
+    best, best_quality = None, 0
+    for encoding in PREFERENCE:
+        if encoding not in (encodings or COMPRESSORS):
+            continue
+        quality = accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+def pick_level(encoding, size, mimetype):
+    if size is None or mimetype == 'text/event-stream':
+        return LEVELS[encoding]['stream']
+    return LEVELS[encoding]['large' if size >= LARGE_BYTES else 'small']
+
+def compress_body(body, encoding, level):
+    compressor = COMPRESSORS[encoding](level)
+    return compressor.compress(body) + compressor.finish()
+
+def _compress_stream(chunks, compressor, encoding, flush):
+    size = written = cpu = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            started = time.thread_time()
+            data = compressor.compress(chunk)
+            if flush:
+                # Each event has to reach the client now, not when the buffer fills.
+                data += compressor.flush()
+            cpu += time.thread_time() - started
+            size += len(chunk)
+            written += len(data)
+            if data:
+                yield data
+        started = time.thread_time()
+        data = compressor.finish()
+        cpu += time.thread_time() - started
+        written += len(data)
+        yield data
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+        _record(encoding, size, written, cpu)
+
+def _mark_encoded(response, encoding):
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # A strong tag names exact bytes, and these bytes are new.
+        response.set_etag(f'{etag}-{encoding}')
+
+def compress_response(response):
+    if (
+        response.status_code < 200
+        or response.status_code >= 300
+        or response.status_code == 204
+        or response.headers.get('Content-Encoding')
+        or not compressible(response.mimetype or '')
+        # Static assets already picked a precompressed variant.
+        or 'accept-encoding' in response.vary
+    ):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Generators flush per chunk so server-sent events keep arriving as
+        # they happen; files are only read in chunks and flush at the end.
+        flush = not response.direct_passthrough
+        compressor = COMPRESSORS[encoding](pick_level(encoding, None, response.mimetype))
+        response.response = _compress_stream(response.response, compressor, encoding, flush)
+        response.direct_passthrough = False
+        response.headers.pop('Content-Length', None)
+        _mark_encoded(response, encoding)
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_BYTES:
+        return response
+    started = time.thread_time()
+    compressed = compress_body(body, encoding, pick_level(encoding, len(body), response.mimetype))
+    _record(encoding, len(body), len(compressed), time.thread_time() - started)
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    _mark_encoded(response, encoding)
+    return response
+
+def init_compression(app):
+    app.after_request(compress_response)
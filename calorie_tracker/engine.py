@@ -0,0 +1,114 @@
+import os
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# DB_PROFILE=tuned (the default) applies the pool options and SQLite pragmas
+# below; DB_PROFILE=plain keeps SQLAlchemy's defaults, which is what the app
+# ran with before and what bench_sqlite_writers.py compares against.
+PROFILES = ('tuned', 'plain')
+
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+TEMP_STORES = ('DEFAULT', 'FILE', 'MEMORY')
+
+def profile():
+    name = os.environ.get('DB_PROFILE', 'tuned').lower()
+    if name not in PROFILES:
+        raise ValueError(f"DB_PROFILE must be one of: {', '.join(PROFILES)}")
+    return name
+
+def _choice(name, default, allowed):
+    value = os.environ.get(name, default).upper()
+    if value not in allowed:
+        raise ValueError(f"{name} must be one of: {', '.join(allowed)}")
+    return value
+
+def sqlite_pragmas(read_only=False):
+    # WAL lets readers run alongside the single writer instead of blocking it,
+    # and synchronous=NORMAL fsyncs at checkpoints rather than on every commit.
+    # A power cut can lose the last few commits but cannot corrupt the file.
+    pragmas = (
+        ('journal_mode', _choice('SQLITE_JOURNAL_MODE', 'WAL', JOURNAL_MODES)),
+        ('synchronous', _choice('SQLITE_SYNCHRONOUS', 'NORMAL', SYNCHRONOUS_MODES)),
+        ('busy_timeout', int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+        # Negative cache_size is in KiB, per connection.
+        ('cache_size', -int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))),
+        ('mmap_size', int(os.environ.get('SQLITE_MMAP_SIZE_MB', 128)) * 1024 * 1024),
+        ('temp_store', _choice('SQLITE_TEMP_STORE', 'MEMORY', TEMP_STORES)),
+    )
+    if read_only:
+        # The journal mode belongs to the file and is the primary's to set;
+        # query_only turns any write that reaches the read pool into an error.
+        return pragmas[1:] + (('query_only', 'ON'),)
+    return pragmas
+
+def engine_options(url):
+    if profile() == 'plain':
+        return {}
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # Flask-SQLAlchemy picks the pool (StaticPool for :memory:), so only
+        # the driver's own lock wait is set here, matching busy_timeout.
+        return dict(connect_args=dict(timeout=int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)) / 1000))
+    return dict(
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 10)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 20)),
+        pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT_SECONDS', 10)),
+        # Servers and proxies drop idle connections; recycle before they do and
+        # check each one on checkout instead of failing the first query.
+        pool_recycle=int(os.environ.get('DB_POOL_RECYCLE_SECONDS', 1800)),
+        pool_pre_ping=True,
+    )
+
+def _execute_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    _execute_pragmas(dbapi_connection, sqlite_pragmas())
+
+def _apply_read_only_pragmas(dbapi_connection, connection_record):
+    _execute_pragmas(dbapi_connection, sqlite_pragmas(read_only=True))
+
+def install_pragmas(engine, read_only=False):
+    if engine.dialect.name != 'sqlite':
+        return
+    if profile() == 'plain' and not read_only:
+        return
+    listener = _apply_read_only_pragmas if read_only else _apply_pragmas
+    if not event.contains(engine, 'connect', listener):
+        event.listen(engine, 'connect', listener)
+        # Connections opened before the listener existed miss the pragmas.
+        engine.dispose()
+
+def describe(engine, read_only=False):
+    if engine.dialect.name != 'sqlite':
+        return dict(profile=profile(), dialect=engine.dialect.name, pool=engine.pool.status())
+    with engine.connect() as connection:
+        settings = {
+            name: connection.exec_driver_sql(f'PRAGMA {name}').scalar()
+            for name, _ in sqlite_pragmas(read_only)
+        }
+    return dict(profile=profile(), dialect='sqlite', pool=engine.pool.status(), **settings)
+
+engine_cli = AppGroup('engine', help='Inspect the database engine profile.')
+
+@engine_cli.command('show')
+def show_command():
+    from . import db
+    from .routing import REPLICA
+    from .shards import bind_key, shard_count
+    for name, value in describe(db.engine).items():
+        click.echo(f'{name}: {value}')
+    if REPLICA in db.engines:
+        for name, value in describe(db.engines[REPLICA], read_only=True).items():
+            click.echo(f'{REPLICA}.{name}: {value}')
+    for shard in range(1, shard_count()):
+        for name, value in describe(db.engines[bind_key(shard)]).items():
+            click.echo(f'{bind_key(shard)}.{name}: {value}')
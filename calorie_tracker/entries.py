@@ -0,0 +1,88 @@
+from datetime import date, datetime, timedelta
+import math
+from .models import FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry
+
+ENTRY_MODELS = dict(food=FoodEntry, water=WaterEntry, weight=WeightEntry,
+                    steps=StepEntry, sleep=SleepEntry, calories_burnt=CaloriesBurntEntry)
+
+FUTURE_DATE_ERROR = 'Future dates cannot be logged. Fitit only accepts real-time or past entries.'
+
+class EntryError(ValueError):
+    pass
+
+def _number(row, field, cast=float, default=None):
+    value = row.get(field)
+    if value is None or value == '':
+        if default is None:
+            raise EntryError(f'{field} is required')
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise EntryError(f'{field} must be a number')
+    if not math.isfinite(number):
+        raise EntryError(f'{field} must be a number')
+    return cast(number)
+
+def _time(row, field, required=False):
+    value = row.get(field)
+    if not value:
+        if required:
+            raise EntryError(f'{field} is required')
+        return None
+    try:
+        return datetime.strptime(value, '%H:%M').time()
+    except (TypeError, ValueError):
+        raise EntryError(f'{field} must use HH:MM')
+
+def _sleep_values(row, selected):
+    # Imports from other trackers often carry only a duration, so that is
+    # accepted as well as both times.
+    if not row.get('sleep_time') and not row.get('wake_time') and row.get('duration_hours') not in (None, ''):
+        duration = _number(row, 'duration_hours')
+        if not 0 < duration <= 24:
+            raise EntryError('duration_hours must be between 0 and 24')
+        return dict(duration_hours=duration, sleep_time=None, wake_time=None)
+    sleep_time = _time(row, 'sleep_time', required=True)
+    wake_time = _time(row, 'wake_time', required=True)
+    start = datetime.combine(selected, sleep_time)
+    end = datetime.combine(selected, wake_time)
+    if end <= start:
+        end += timedelta(days=1)
+    return dict(duration_hours=(end - start).total_seconds() / 3600, sleep_time=sleep_time, wake_time=wake_time)
+
+def entry_values(entry_type, row, today=None):
+    # The column values for one entry; the single-entry routes and bulk
+    # import both validate through here.
+    if entry_type not in ENTRY_MODELS:
+        raise EntryError(f"type must be one of: {', '.join(ENTRY_MODELS)}")
+    try:
+        selected = datetime.strptime(row.get('date') or (today or date.today()).isoformat(), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise EntryError('date must use YYYY-MM-DD')
+    if selected > (today or date.today()):
+        raise EntryError(FUTURE_DATE_ERROR)
+    values = dict(date=selected)
+    if entry_type == 'food':
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise EntryError('Food name is required')
+        values.update(
+            name=name[:100], time=_time(row, 'time'), calories=_number(row, 'calories'),
+            protein=_number(row, 'protein', default=0), carbs=_number(row, 'carbs', default=0),
+            fat=_number(row, 'fat', default=0), sugar=_number(row, 'sugar', default=0),
+        )
+    elif entry_type == 'water':
+        values['amount_ml'] = _number(row, 'amount_ml', int)
+    elif entry_type == 'weight':
+        weight = _number(row, 'weight_kg')
+        if row.get('unit') == 'lbs':
+            weight *= 0.453592
+        values['weight_kg'] = weight
+    elif entry_type == 'steps':
+        values['steps'] = _number(row, 'steps', int)
+    elif entry_type == 'sleep':
+        values.update(_sleep_values(row, selected))
+    elif entry_type == 'calories_burnt':
+        values['calories_burnt'] = _number(row, 'calories_burnt', int)
+    return values
@@ -0,0 +1,216 @@
+from array import array
+from collections import Counter
+import csv
+import heapq
+import os
+import re
+import sqlite3
+import sys
+import threading
+
+MACRO_REFERENCE = [
+    dict(name='cooked white rice, 1 cup', aliases=('rice', 'white rice'), calories=205, protein=4.3, carbs=44.5, fat=0.4, sugar=0.1),
+    dict(name='cooked brown rice, 1 cup', aliases=('brown rice',), calories=218, protein=4.5, carbs=45.8, fat=1.6, sugar=0.7),
+    dict(name='cooked basmati rice, 1 cup', aliases=('basmati', 'basmati rice'), calories=210, protein=4.4, carbs=45.6, fat=0.5, sugar=0.1),
+    dict(name='cooked pasta, 1 cup', aliases=('pasta', 'noodles'), calories=220, protein=8.1, carbs=43.2, fat=1.3, sugar=0.8),
+    dict(name='wheat chapati, 1 medium', aliases=('chapati', 'roti'), calories=120, protein=3.1, carbs=18.0, fat=3.7, sugar=0.8),
+    dict(name='idli, 1 piece', aliases=('idli',), calories=58, protein=2.0, carbs=12.0, fat=0.4, sugar=0.2),
+    dict(name='plain dosa, 1 medium', aliases=('dosa',), calories=168, protein=3.8, carbs=29.0, fat=3.7, sugar=0.9),
+    dict(name='cooked oatmeal, 1 cup', aliases=('oatmeal', 'oats'), calories=166, protein=5.9, carbs=28.1, fat=3.6, sugar=0.6),
+    dict(name='whole egg, 1 large', aliases=('egg', 'eggs'), calories=72, protein=6.3, carbs=0.4, fat=4.8, sugar=0.2),
+    dict(name='grilled chicken breast, 100 g', aliases=('chicken', 'chicken breast', 'grilled chicken'), calories=165, protein=31.0, carbs=0.0, fat=3.6, sugar=0.0),
+    dict(name='salmon, cooked, 100 g', aliases=('salmon',), calories=206, protein=22.1, carbs=0.0, fat=12.4, sugar=0.0),
+    dict(name='tofu, firm, 100 g', aliases=('tofu',), calories=144, protein=17.3, carbs=2.8, fat=8.7, sugar=0.6),
+    dict(name='paneer, 100 g', aliases=('paneer',), calories=321, protein=21.4, carbs=3.6, fat=25.0, sugar=2.6),
+    dict(name='cooked chickpeas, 1 cup', aliases=('chickpeas', 'chana'), calories=269, protein=14.5, carbs=45.0, fat=4.2, sugar=7.9),
+    dict(name='cooked lentils, 1 cup', aliases=('lentils', 'dal', 'dhal'), calories=230, protein=17.9, carbs=39.9, fat=0.8, sugar=3.6),
+    dict(name='banana, 1 medium', aliases=('banana',), calories=105, protein=1.3, carbs=27.0, fat=0.4, sugar=14.4),
+    dict(name='apple, 1 medium', aliases=('apple',), calories=95, protein=0.5, carbs=25.1, fat=0.3, sugar=18.9),
+    dict(name='whole milk, 1 cup', aliases=('milk', 'whole milk'), calories=149, protein=7.7, carbs=11.7, fat=7.9, sugar=12.3),
+    dict(name='plain greek yogurt, 170 g', aliases=('greek yogurt', 'yogurt', 'curd'), calories=100, protein=17.3, carbs=6.1, fat=0.7, sugar=5.7),
+    dict(name='whey protein shake, 1 scoop', aliases=('protein shake', 'whey', 'shake'), calories=120, protein=24.0, carbs=3.0, fat=1.5, sugar=1.0),
+    dict(name='brewed coffee, 12 oz', aliases=('coffee', 'black coffee'), calories=5, protein=0.3, carbs=0.0, fat=0.0, sugar=0.0),
+    dict(name='latte with whole milk, 16 oz', aliases=('latte', 'cold coffee', 'iced coffee'), calories=190, protein=10.0, carbs=18.0, fat=9.0, sugar=17.0),
+    dict(name='smoothie, fruit and yogurt, 16 oz', aliases=('smoothie',), calories=300, protein=10.0, carbs=55.0, fat=4.0, sugar=40.0),
+    dict(name='tonkotsu ramen bowl', aliases=('tonkotsu', 'ramen', 'tonkotsu ramen'), calories=650, protein=28.0, carbs=70.0, fat=28.0, sugar=5.0),
+    dict(name='burrito bowl with rice and chicken', aliases=('burrito bowl', 'chipotle bowl'), calories=700, protein=42.0, carbs=78.0, fat=24.0, sugar=6.0),
+]
+
+MACRO_FIELDS = ('calories', 'protein', 'carbs', 'fat', 'sugar')
+
+TERM_PATTERN = re.compile(r'[a-z][a-z0-9]+')
+BOUNDARY_PATTERN = re.compile(r'\b')
+ALIAS_SEPARATOR = re.compile(r'[|;]')
+
+def _push(mapping, key, item_id):
+    # Most keys belong to one item, so store a bare id until a second shows up.
+    current = mapping.get(key)
+    if current is None:
+        mapping[key] = item_id
+    elif isinstance(current, tuple):
+        if current[-1] != item_id:
+            mapping[key] = current + (item_id,)
+    elif current != item_id:
+        mapping[key] = (current, item_id)
+
+def _ids(value):
+    return value if isinstance(value, tuple) else (value,)
+
+class FoodIndex:
+    def __init__(self, items=()):
+        self.names = []
+        self.aliases = []
+        self.macros = array('d')
+        # Lowercase name or alias -> item id(s); substring scoring for the planner context.
+        self._keys = {}
+        # Alias -> item id(s); word-bounded matching for the reference fallback.
+        self._alias_keys = {}
+        # Token -> item ids, one entry per alias that contains the token.
+        self._postings = {}
+        for item in items:
+            self.add(item['name'], item.get('aliases') or (), [item.get(field) or 0 for field in MACRO_FIELDS])
+        self._finish()
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, aliases, macros):
+        item_id = len(self.names)
+        aliases = tuple(sys.intern(alias) for alias in aliases if alias)
+        self.names.append(name)
+        self.aliases.append(aliases)
+        self.macros.extend(float(value) for value in macros)
+        for key in set(aliases) | {name.lower()}:
+            _push(self._keys, sys.intern(key), item_id)
+            for term in set(TERM_PATTERN.findall(key)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = array('i')
+                postings.append(item_id)
+        for alias in set(aliases):
+            _push(self._alias_keys, alias, item_id)
+
+    def _finish(self):
+        # Rank of each item in (name, id) order, so ranking compares plain ints.
+        self._by_rank = array('i', sorted(range(len(self.names)), key=lambda item_id: (self.names[item_id], item_id)))
+        self._rank = array('i', bytes(4 * len(self.names)))
+        for rank, item_id in enumerate(self._by_rank):
+            self._rank[item_id] = rank
+        self._key_lengths = sorted({len(key) for key in self._keys})
+        self._key_starts = {key[0] for key in self._keys}
+        self._max_alias_length = max((len(alias) for alias in self._alias_keys), default=0)
+
+    def item(self, item_id):
+        offset = item_id * len(MACRO_FIELDS)
+        return dict(name=self.names[item_id], **dict(zip(MACRO_FIELDS, self.macros[offset:offset + len(MACRO_FIELDS)])))
+
+    def _contained_keys(self, text):
+        found = set()
+        size = len(text)
+        for start in range(size):
+            if text[start] not in self._key_starts:
+                continue
+            for length in self._key_lengths:
+                if start + length > size:
+                    break
+                key = text[start:start + length]
+                if key in self._keys:
+                    found.add(key)
+        return found
+
+    def reference_context(self, prompt='', limit=8):
+        # Same scoring as the original linear scan: +4 for every name or alias
+        # that appears anywhere in the prompt, +1 per shared word per alias.
+        text = (prompt or '').lower()
+        scores = Counter()
+        for term in set(TERM_PATTERN.findall(text)):
+            postings = self._postings.get(term)
+            if postings is not None:
+                scores.update(postings)
+        for key in self._contained_keys(text):
+            for item_id in _ids(self._keys[key]):
+                scores[item_id] += 4
+        if not scores:
+            ids = sorted(range(min(limit, len(self.names))), key=lambda item_id: self._rank[item_id])
+            return [self.item(item_id) for item_id in ids]
+        # Highest score first, then name: fold both into one int per item so
+        # the heap compares ints instead of calling a key function.
+        size, rank, top = len(self.names), self._rank, max(scores.values())
+        keys = [(top - score) * size + rank[item_id] for item_id, score in scores.items()]
+        return [self.item(self._by_rank[key % size]) for key in heapq.nsmallest(limit, keys)]
+
+    def alias_spans(self, text):
+        # An alias matches like re.search(rf'\b{alias}\b', text): the span has
+        # to start and end on a word boundary, so only those spans are looked up.
+        bounds = [match.start() for match in BOUNDARY_PATTERN.finditer(text)]
+        spans = []
+        for position, start in enumerate(bounds):
+            for end in bounds[position + 1:]:
+                if end - start > self._max_alias_length:
+                    break
+                alias = text[start:end]
+                item_ids = self._alias_keys.get(alias)
+                if item_ids is not None:
+                    spans.append((start, end, alias, _ids(item_ids)))
+        return spans
+
+    def match_aliases(self, text):
+        matched = {alias for _, _, alias, _ in self.alias_spans(text)}
+        items = {}
+        for alias in matched:
+            for item_id in _ids(self._alias_keys[alias]):
+                items[item_id] = None
+        results = []
+        for item_id in sorted(items):
+            # Prefer the longest alias, ties in declaration order.
+            alias = next(a for a in sorted(self.aliases[item_id], key=len, reverse=True) if a in matched)
+            results.append((self.item(item_id), alias))
+        return results
+
+def _split_aliases(value):
+    return [alias.strip().lower() for alias in ALIAS_SEPARATOR.split(value or '') if alias.strip()]
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _dataset_rows(path):
+    if path.lower().endswith(('.db', '.sqlite', '.sqlite3')):
+        connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            columns = ', '.join(('name', 'aliases') + MACRO_FIELDS)
+            yield from connection.execute(f'SELECT {columns} FROM foods')
+        finally:
+            connection.close()
+        return
+    with open(path, newline='', encoding='utf-8') as dataset:
+        for row in csv.DictReader(dataset):
+            yield (row.get('name'), row.get('aliases')) + tuple(row.get(field) for field in MACRO_FIELDS)
+
+def build_food_index(path=None):
+    index = FoodIndex(MACRO_REFERENCE)
+    if path:
+        for name, aliases, *macros in _dataset_rows(path):
+            name = (name or '').strip()
+            if name:
+                index.add(name, _split_aliases(aliases), [_number(value) for value in macros])
+        index._finish()
+    return index
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_food_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = build_food_index(os.environ.get('FOOD_DATABASE_PATH'))
+    return _index
+
+def reset_food_index():
+    global _index
+    with _index_lock:
+        _index = None
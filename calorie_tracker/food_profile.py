@@ -0,0 +1,308 @@
+from collections import defaultdict
+from datetime import date
+import math
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db, shards
+from .models import FoodEntry, FoodProfile
+from .rollups import _committed_value, _keep_old_value
+
+MACROS = ('calories', 'protein', 'carbs', 'fat', 'sugar')
+SUMS = ('count', *MACROS)
+
+# score is a count with a HALF_LIFE_DAYS half-life as of score_date, the
+# latest entry date the row has seen, so it never exceeds count. rank is
+# log2 of that score moved back to EPOCH; it grows by one per half-life, so
+# ordering by it is ordering by the decayed count as of any day.
+EPOCH = date(2026, 1, 1)
+HALF_LIFE_DAYS = 30
+# Caps the exponent so a mistyped far-future date cannot overflow a float.
+MAX_HALF_LIVES = 512
+
+DRIFT_TOLERANCE = 0.01
+
+# Renames move an entry between profiles, so the old name is needed too.
+event.listen(FoodEntry.name, 'set', _keep_old_value, active_history=True)
+
+def food_key(name):
+    return (name or '').strip().lower()[:100]
+
+def decay(score, from_date, to_date):
+    return score * 2.0 ** min((from_date - to_date).days / HALF_LIFE_DAYS, MAX_HALF_LIVES)
+
+def score_rank(score, score_date):
+    if score <= 0 or score_date is None:
+        return None
+    return math.log2(score) + (score_date - EPOCH).days / HALF_LIFE_DAYS
+
+def merge_score(dates, score=0.0, score_date=None):
+    # dates maps an entry date to the net number of entries added on it.
+    as_of = max([day for day in (score_date, *(day for day, n in dates.items() if n > 0)) if day], default=None)
+    if as_of is None:
+        return score, score_date
+    if score_date is not None:
+        score = decay(score, score_date, as_of)
+    score += sum(n * decay(1.0, day, as_of) for day, n in dates.items())
+    # Subtracting weights that have decayed to nothing can leave rounding error.
+    return max(score, 0.0), as_of
+
+def _add(changes, user_id, name, date_, values, sign):
+    key = food_key(name)
+    if user_id is None or date_ is None or not key:
+        return
+    bucket = changes[(user_id, key)]
+    bucket['count'] += sign
+    for macro in MACROS:
+        bucket[macro] += sign * (values(macro) or 0)
+    bucket['dates'][date_] += sign
+    if sign > 0:
+        bucket['name'] = name.strip()[:100]
+        bucket['last_date'] = max(bucket['last_date'] or date_, date_)
+    else:
+        bucket['removed_date'] = max(bucket['removed_date'] or date_, date_)
+
+def _new_bucket():
+    return dict(dict.fromkeys(SUMS, 0), dates=defaultdict(int), name=None, last_date=None, removed_date=None)
+
+def collect_changes(session):
+    changes = defaultdict(_new_bucket)
+    for obj in session.new:
+        if isinstance(obj, FoodEntry):
+            _add(changes, obj.user_id, obj.name, obj.date, lambda attr: getattr(obj, attr), 1)
+    for obj in session.deleted:
+        if isinstance(obj, FoodEntry):
+            state = inspect(obj)
+            _add(changes, _committed_value(state, 'user_id'), _committed_value(state, 'name'),
+                 _committed_value(state, 'date'), lambda attr: _committed_value(state, attr), -1)
+    for obj in session.dirty:
+        if not isinstance(obj, FoodEntry):
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[attr].history.has_changes() for attr in ('user_id', 'name', 'date', *MACROS)):
+            continue
+        _add(changes, _committed_value(state, 'user_id'), _committed_value(state, 'name'),
+             _committed_value(state, 'date'), lambda attr: _committed_value(state, attr), -1)
+        _add(changes, obj.user_id, obj.name, obj.date, lambda attr: getattr(obj, attr), 1)
+    return changes
+
+MERGED = ('name', *SUMS, 'score', 'score_date', 'rank', 'last_date')
+
+def _empty_row(user_id, key):
+    return dict(user_id=user_id, key=key, name=None, **dict.fromkeys(SUMS, 0), score=0.0, score_date=None,
+                last_date=None)
+
+def _merge(row, bucket):
+    score, score_date = merge_score(bucket['dates'], row['score'], row['score_date'])
+    last_date = row['last_date']
+    if bucket['last_date'] is not None and (last_date is None or bucket['last_date'] > last_date):
+        last_date = bucket['last_date']
+    return dict(
+        {column: row[column] + bucket[column] for column in SUMS},
+        user_id=row['user_id'], key=row['key'], name=bucket['name'] or row['name'], last_date=last_date,
+        score=score, score_date=score_date, rank=score_rank(score, score_date),
+    )
+
+def _locked_rows(connection, keys):
+    table = FoodProfile.__table__
+    by_user = defaultdict(list)
+    for user_id, key in keys:
+        by_user[user_id].append(key)
+    rows = {}
+    for user_id, user_keys in by_user.items():
+        for row in connection.execute(
+            select(table).where(table.c.user_id == user_id, table.c.key.in_(user_keys)).with_for_update()
+        ):
+            rows[(row.user_id, row.key)] = row._asdict()
+    return rows
+
+def _insert_new(connection, rows):
+    # Returns the rows another transaction created first.
+    table = FoodProfile.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = (insert(table).on_conflict_do_nothing(index_elements=['user_id', 'key'])
+                     .returning(table.c.user_id, table.c.key))
+        inserted = set(map(tuple, connection.execute(statement, rows)))
+        return [row for row in rows if (row['user_id'], row['key']) not in inserted]
+    for row in rows:
+        connection.execute(table.insert().values(**row))
+    return []
+
+def _refresh_last_dates(connection, user_id, removed):
+    # Removing the most recent entry of a food moves its last_date back.
+    table = FoodProfile.__table__
+    stale = [
+        key for key, last_date in connection.execute(
+            select(table.c.key, table.c.last_date).where(table.c.user_id == user_id, table.c.key.in_(list(removed)))
+        )
+        if last_date is not None and removed[key] >= last_date
+    ]
+    if not stale:
+        return
+    entries = FoodEntry.__table__
+    latest = {}
+    for name, last_date in connection.execute(
+        select(entries.c.name, func.max(entries.c.date)).where(entries.c.user_id == user_id).group_by(entries.c.name)
+    ):
+        key = food_key(name)
+        if key in removed and (key not in latest or last_date > latest[key]):
+            latest[key] = last_date
+    for key in stale:
+        connection.execute(
+            table.update().where(table.c.user_id == user_id, table.c.key == key).values(last_date=latest.get(key))
+        )
+
+def apply_changes(connection, changes):
+    # The decay needs pow(), which SQLite may not have, so rows are read,
+    # merged in Python and written back.
+    table = FoodProfile.__table__
+    current = _locked_rows(connection, changes)
+    created, updates = [], []
+    for (user_id, key), bucket in changes.items():
+        row = current.get((user_id, key))
+        if row is not None:
+            updates.append(_merge(row, bucket))
+        elif bucket['name'] is not None:
+            created.append(_merge(_empty_row(user_id, key), bucket))
+    if created:
+        lost = _insert_new(connection, created)
+        if lost:
+            current = _locked_rows(connection, [(row['user_id'], row['key']) for row in lost])
+            updates.extend(_merge(row, changes[key]) for key, row in current.items())
+    if updates:
+        connection.execute(
+            table.update().where(table.c.user_id == bindparam('b_user_id'), table.c.key == bindparam('b_key')),
+            [dict({column: row[column] for column in MERGED}, b_user_id=row['user_id'], b_key=row['key'])
+             for row in updates],
+        )
+    removed = defaultdict(dict)
+    for (user_id, key), bucket in changes.items():
+        if bucket['removed_date'] is not None:
+            removed[user_id][key] = bucket['removed_date']
+    for user_id, user_keys in removed.items():
+        _refresh_last_dates(connection, user_id, user_keys)
+    if removed:
+        connection.execute(table.delete().where(table.c.user_id.in_(list(removed)), table.c.count <= 0))
+
+@event.listens_for(db.session, 'after_flush')
+def _update_food_profiles(session, flush_context):
+    changes = collect_changes(session)
+    if changes:
+        for connection, group in shards.connections(session, changes):
+            apply_changes(connection, group)
+
+def top_foods(user_id, limit=12, today=None):
+    today = today or date.today()
+    # Plain rows: the flush hook writes through Core, which would leave ORM
+    # copies loaded earlier in the request stale.
+    table = FoodProfile.__table__
+    rows = db.session.execute(
+        select(table).where(table.c.user_id == user_id)
+        .order_by(table.c.rank.desc().nulls_last(), table.c.key).limit(limit)
+    ).all()
+    return [
+        dict(
+            name=row.name,
+            times_logged=row.count,
+            last_seen=row.last_date.isoformat() if row.last_date else None,
+            weight=round(decay(row.score, row.score_date, today), 3) if row.score_date else 0.0,
+            average={macro: round(getattr(row, macro) / row.count, 1) for macro in MACROS},
+        )
+        for row in rows
+    ]
+
+def compute_profiles(user_id=None):
+    computed = defaultdict(_new_bucket)
+    query = select(FoodEntry.user_id, FoodEntry.name, FoodEntry.date, *(getattr(FoodEntry, macro) for macro in MACROS))
+    if user_id is not None:
+        query = query.where(FoodEntry.user_id == user_id)
+    # Oldest first, so each profile keeps the latest spelling of its name.
+    for row in db.session.execute(query.order_by(FoodEntry.date, FoodEntry.id)):
+        _add(computed, row.user_id, row.name, row.date, lambda attr: row._mapping[attr], 1)
+    for bucket in computed.values():
+        bucket['score'], bucket['score_date'] = merge_score(bucket['dates'])
+    return computed
+
+def find_drift(user_id=None):
+    computed = compute_profiles(user_id)
+    query = select(FoodProfile)
+    if user_id is not None:
+        query = query.where(FoodProfile.user_id == user_id)
+    stored = {(r.user_id, r.key): r for r in db.session.scalars(query)}
+    drift = []
+    for key in sorted(set(computed) | set(stored)):
+        expected = computed.get(key)
+        actual = stored.get(key)
+        if expected is None or actual is None:
+            drift.append((key, 'missing' if actual is None else 'orphaned'))
+            continue
+        diffs = [
+            column for column in SUMS
+            if abs(getattr(actual, column) - expected[column]) > DRIFT_TOLERANCE * max(1.0, abs(expected[column]))
+        ]
+        # Compared as of the same day; a delete leaves score_date where it was.
+        score = decay(actual.score, actual.score_date, expected['score_date']) if actual.score_date else actual.score
+        if abs(score - expected['score']) > DRIFT_TOLERANCE * max(1.0, expected['score']):
+            diffs.append('score')
+        if actual.last_date != expected['last_date']:
+            diffs.append('last_date')
+        if diffs:
+            drift.append((key, ', '.join(diffs)))
+    return drift
+
+def rebuild_profiles(user_id=None):
+    computed = compute_profiles(user_id)
+    delete = FoodProfile.__table__.delete()
+    if user_id is not None:
+        delete = delete.where(FoodProfile.user_id == user_id)
+    db.session.execute(delete)
+    rows = [
+        dict(user_id=key[0], key=key[1], name=bucket['name'], last_date=bucket['last_date'],
+             score=bucket['score'], score_date=bucket['score_date'],
+             rank=score_rank(bucket['score'], bucket['score_date']),
+             **{column: bucket[column] for column in SUMS})
+        for key, bucket in computed.items()
+    ]
+    if rows:
+        db.session.execute(FoodProfile.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+def backfill_empty():
+    # Same as rollups.backfill_empty: create_all gives a database that
+    # predates this table an empty one.
+    if db.session.execute(select(FoodProfile.user_id).limit(1)).first() is not None:
+        return 0
+    if db.session.execute(select(FoodEntry.id).limit(1)).first() is None:
+        return 0
+    connection = db.session.connection(bind_arguments=dict(mapper=inspect(FoodProfile)))
+    if 'score_date' not in {column['name'] for column in inspect(connection).get_columns('food_profile')}:
+        # An older table; `flask db upgrade` rebuilds it with the new columns.
+        return 0
+    return rebuild_profiles()
+
+food_profiles_cli = AppGroup('food-profiles', help='Maintain the per-user FoodProfile table.')
+
+@food_profiles_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Only check one user.')
+def check_command(user_id):
+    drift = []
+    for _ in shards.each_shard(user_id):
+        drift.extend(find_drift(user_id))
+    for (uid, key), detail in drift:
+        click.echo(f'user {uid} {key!r}: {detail}')
+    if drift:
+        raise click.ClickException(f'{len(drift)} food profile(s) drifted from raw entries. Run `flask food-profiles rebuild`.')
+    click.echo('Food profiles match raw entries.')
+
+@food_profiles_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild one user.')
+def rebuild_command(user_id):
+    drifted = count = 0
+    for _ in shards.each_shard(user_id):
+        drifted += len(find_drift(user_id))
+        count += rebuild_profiles(user_id)
+    click.echo(f'Rebuilt {count} food profile(s); {drifted} had drifted.')
@@ -0,0 +1,314 @@
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+import json
+import os
+import queue
+import threading
+import time
+import weakref
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import event, func, or_, select, update
+from . import db
+from .models import OutboxJob
+from .shards import using_shard
+
+_executor = None
+_lock = threading.Lock()
+_pending = set()
+_futures = set()
+_timers = {}
+# Earliest monotonic time each throttled key may start again.
+_not_before = {}
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                    thread_name_prefix='fitit-job',
+                )
+    return _executor
+
+def submit(key, fn, *args, min_interval=0):
+    # Jobs with the same key coalesce while one is still queued; a job that has
+    # already started does not block a new one, so late writes are never lost.
+    # With min_interval a key starts at most that often: a job submitted
+    # sooner waits for the interval and picks up everything queued meanwhile.
+    app = current_app._get_current_object()
+    with _lock:
+        if key is not None and key in _pending:
+            return None
+        if key is not None:
+            _pending.add(key)
+        delay = _not_before.get(key, 0) - time.monotonic() if min_interval else 0
+
+    def run():
+        with _lock:
+            _pending.discard(key)
+            if min_interval:
+                now = time.monotonic()
+                for stale in [k for k, at in _not_before.items() if at <= now]:
+                    del _not_before[stale]
+                _not_before[key] = now + min_interval
+        with app.app_context():
+            try:
+                fn(*args)
+            except Exception:
+                app.logger.exception('Background job %s failed', key or getattr(fn, '__name__', fn))
+
+    if delay > 0:
+        timer = threading.Timer(delay, _submit_later, (run,))
+        timer.daemon = True
+        with _lock:
+            _timers[timer] = key
+        timer.start()
+        return timer
+    return _submit_now(run)
+
+def _submit_now(run):
+    future = get_executor().submit(run)
+    with _lock:
+        _futures.add(future)
+    future.add_done_callback(_forget)
+    return future
+
+def _submit_later(run):
+    with _lock:
+        _timers.pop(threading.current_thread(), None)
+    _submit_now(run)
+
+def _forget(future):
+    with _lock:
+        _futures.discard(future)
+
+def wait(timeout=None):
+    # Throttled jobs still waiting for their interval are not waited for.
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _lock:
+        futures = list(_futures)
+    if futures:
+        wait_futures(futures, timeout=timeout)
+    with _outbox_queue.all_tasks_done:
+        while _outbox_queue.unfinished_tasks:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            _outbox_queue.all_tasks_done.wait(remaining)
+
+def shutdown():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+        for timer, key in _timers.items():
+            timer.cancel()
+            _pending.discard(key)
+        _timers.clear()
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+# Durable post-commit work. enqueue() adds an OutboxJob row to the caller's
+# session, so a job commits or rolls back with the request's own writes. After
+# commit the row goes on a bounded in-memory queue served by a few worker
+# threads; a worker claims the row, runs its handler and deletes it in one
+# transaction. A full queue blocks the committing request for up to
+# QUEUE_PUT_TIMEOUT (backpressure) and then leaves the row for the sweep.
+# Rows left by a crash are replayed on a process's first request and
+# whenever the workers idle.
+
+QUEUE_PUT_TIMEOUT = 0.5
+CLAIM_TIMEOUT = 300
+SWEEP_INTERVAL = 30
+MAX_ATTEMPTS = 5
+
+HANDLERS = {}
+
+_outbox_queue = queue.Queue(maxsize=int(os.environ.get('JOB_QUEUE_SIZE', 256)))
+_outbox_apps = weakref.WeakSet()
+_outbox_workers = []
+_outbox_lock = threading.Lock()
+_outbox_stats = dict(enqueued=0, processed=0, failed=0, deferred=0, replayed=0, lag_ms_last=0.0, lag_ms_max=0.0)
+
+def handler(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+def enqueue(kind, payload):
+    job = OutboxJob(
+        kind=kind,
+        payload=json.dumps(payload, default=str, separators=(',', ':')),
+        created_at=time.time(),
+        attempts=0,
+    )
+    db.session.add(job)
+    return job
+
+def _count(name, amount=1):
+    with _outbox_lock:
+        _outbox_stats[name] += amount
+
+@event.listens_for(db.session, 'after_flush')
+def _note_outbox_jobs(session, flush_context):
+    ids = [obj.id for obj in session.new if isinstance(obj, OutboxJob)]
+    if ids:
+        session.info.setdefault('outbox_job_ids', []).extend(ids)
+
+@event.listens_for(db.session, 'after_commit')
+def _queue_committed_jobs(session):
+    ids = session.info.pop('outbox_job_ids', None)
+    if not ids:
+        return
+    app = current_app._get_current_object()
+    if app not in _outbox_apps:
+        # Not serving, e.g. a CLI command: the rows wait for a server's sweep.
+        return
+    for job_id in ids:
+        _count('enqueued')
+        try:
+            _outbox_queue.put((app, job_id), timeout=QUEUE_PUT_TIMEOUT)
+        except queue.Full:
+            # Still in the outbox table; the next sweep picks it up.
+            _count('deferred')
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_outbox_jobs(session, previous_transaction):
+    session.info.pop('outbox_job_ids', None)
+
+def _claim(job_id, now):
+    table = OutboxJob.__table__
+    claimed = db.session.execute(
+        update(table)
+        .where(table.c.id == job_id, or_(table.c.claimed_at.is_(None), table.c.claimed_at < now - CLAIM_TIMEOUT))
+        .values(claimed_at=now)
+    ).rowcount
+    db.session.commit()
+    return claimed == 1
+
+def run_job(app, job_id):
+    with app.app_context():
+        now = time.time()
+        if not _claim(job_id, now):
+            return
+        job = db.session.get(OutboxJob, job_id)
+        if job is None:
+            return
+        lag_ms = (now - job.created_at) * 1000
+        with _outbox_lock:
+            _outbox_stats['lag_ms_last'] = lag_ms
+            _outbox_stats['lag_ms_max'] = max(_outbox_stats['lag_ms_max'], lag_ms)
+        try:
+            payload = json.loads(job.payload)
+            with using_shard(payload.get('user_id')):
+                HANDLERS[job.kind](**payload)
+            db.session.delete(job)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            app.logger.exception('Outbox job %s (%s) failed', job_id, job.kind)
+            job = db.session.get(OutboxJob, job_id)
+            if job is not None:
+                job.attempts += 1
+                job.claimed_at = None
+                job.last_error = repr(exc)[:2000]
+                db.session.commit()
+            _count('failed')
+            return
+    _count('processed')
+
+def _worker():
+    while True:
+        try:
+            app, job_id = _outbox_queue.get(timeout=SWEEP_INTERVAL)
+        except queue.Empty:
+            for app in list(_outbox_apps):
+                replay(app, older_than=SWEEP_INTERVAL)
+            continue
+        try:
+            run_job(app, job_id)
+        except Exception:
+            app.logger.exception('Outbox worker could not run job %s', job_id)
+        finally:
+            _outbox_queue.task_done()
+
+def _start_workers(app):
+    _outbox_apps.add(app)
+    with _outbox_lock:
+        while len(_outbox_workers) < int(os.environ.get('JOB_QUEUE_WORKERS', 1)):
+            thread = threading.Thread(target=_worker, name=f'fitit-outbox-{len(_outbox_workers)}', daemon=True)
+            thread.start()
+            _outbox_workers.append(thread)
+
+def pending_ids(older_than=0):
+    table = OutboxJob.__table__
+    now = time.time()
+    return db.session.scalars(
+        select(table.c.id)
+        .where(table.c.attempts < MAX_ATTEMPTS, table.c.created_at <= now - older_than)
+        .where(or_(table.c.claimed_at.is_(None), table.c.claimed_at < now - CLAIM_TIMEOUT))
+        .order_by(table.c.created_at)
+    ).all()
+
+def replay(app, older_than=0):
+    # Queues outbox rows nobody is working on; stops early when the queue is full.
+    _start_workers(app)
+    with app.app_context():
+        ids = pending_ids(older_than)
+    queued = 0
+    for job_id in ids:
+        try:
+            _outbox_queue.put_nowait((app, job_id))
+        except queue.Full:
+            break
+        queued += 1
+    if queued:
+        _count('replayed', queued)
+    return queued
+
+def init_app(app):
+    # Workers start with the first request, so CLI commands and other
+    # processes that only build the app never run them.
+    @app.before_request
+    def _serve_outbox():
+        if app not in _outbox_apps:
+            replay(app)
+
+def outbox_stats():
+    with _outbox_lock:
+        stats = dict(_outbox_stats)
+    stats.update(
+        depth=_outbox_queue.qsize(),
+        capacity=_outbox_queue.maxsize,
+        workers=len(_outbox_workers),
+    )
+    return stats
+
+jobs_cli = AppGroup('jobs', help='Inspect and replay the background job outbox.')
+
+@jobs_cli.command('stats')
+def stats_command():
+    for name, value in outbox_stats().items():
+        click.echo(f'{name}: {value}')
+    table = OutboxJob.__table__
+    pending, oldest = db.session.execute(select(func.count(), func.min(table.c.created_at))).one()
+    dead = db.session.scalar(select(func.count()).select_from(table).where(table.c.attempts >= MAX_ATTEMPTS))
+    click.echo(f'outbox rows: {pending}')
+    click.echo(f'outbox oldest age s: {time.time() - oldest:.1f}' if oldest else 'outbox oldest age s: 0')
+    click.echo(f'outbox failed {MAX_ATTEMPTS}+ times: {dead}')
+
+@jobs_cli.command('replay')
+@click.option('--retry-failed', is_flag=True, help=f'Also retry jobs that failed {MAX_ATTEMPTS} times.')
+def replay_command(retry_failed):
+    if retry_failed:
+        table = OutboxJob.__table__
+        db.session.execute(update(table).where(table.c.attempts >= MAX_ATTEMPTS).values(attempts=0))
+        db.session.commit()
+    # Run inline: the CLI process exits before daemon workers would finish.
+    ids = pending_ids()
+    app = current_app._get_current_object()
+    for job_id in ids:
+        run_job(app, job_id)
+    click.echo(f'Ran {len(ids)} outbox job(s).')
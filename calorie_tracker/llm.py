@@ -0,0 +1,299 @@
+import asyncio
+import http.client
+import json
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+from .metrics import record_llm_time
+
+GEMINI_API_BASE = 'https://generativelanguage.googleapis.com'
+OPENAI_API_BASE = 'https://api.openai.com'
+
+class LLMError(Exception):
+    pass
+
+class CircuitOpenError(LLMError):
+    pass
+
+class ProviderBusyError(LLMError):
+    pass
+
+def gemini_url(model, api_key, method='generateContent', query=''):
+    base = os.environ.get('GEMINI_API_BASE', GEMINI_API_BASE).rstrip('/')
+    return f'{base}/v1beta/models/{model}:{method}?key={api_key}{query}'
+
+def openai_url(path='/v1/responses'):
+    return os.environ.get('OPENAI_API_BASE', OPENAI_API_BASE).rstrip('/') + path
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_after=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                return 'half_open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_after:
+                # Let one probe through; a failure re-opens the window.
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class _Host:
+    def __init__(self, scheme, netloc, max_idle, max_concurrency, background_concurrency, failure_threshold, reset_after):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.max_idle = max_idle
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        # Background work gets its own slots so it never takes a user's.
+        self.background_slots = threading.BoundedSemaphore(background_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_after)
+
+    def checkout(self, timeout):
+        with self.lock:
+            conn = self.idle.pop() if self.idle else None
+        if conn is None:
+            factory = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+            return factory(self.netloc, timeout=timeout), False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def checkin(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            conn.close()
+
+class LLMClient:
+    def __init__(self, max_idle=8, max_concurrency=4, background_concurrency=1, failure_threshold=5, reset_after=30.0,
+                 acquire_timeout=0.25):
+        self.max_idle = max_idle
+        self.max_concurrency = max_concurrency
+        self.background_concurrency = background_concurrency
+        self.acquire_timeout = acquire_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, scheme, netloc):
+        key = (scheme, netloc)
+        with self._lock:
+            host = self._hosts.get(key)
+            if host is None:
+                host = self._hosts[key] = _Host(scheme, netloc, self.max_idle, self.max_concurrency,
+                                                self.background_concurrency, self.failure_threshold, self.reset_after)
+            return host
+
+    def breaker_for(self, url):
+        parts = urlsplit(url)
+        return self._host(parts.scheme, parts.netloc).breaker
+
+    def _open(self, host, method, target, payload, headers, timeout):
+        # A pooled keep-alive socket may have been closed by the server;
+        # retry once on a fresh connection before counting a failure.
+        for attempt in range(2):
+            conn, reused = host.checkout(timeout)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                    # Headers and body go out in separate writes; without this a
+                    # kept-alive socket stalls on Nagle + delayed ACK every call.
+                    conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                conn.request(method, target, body=payload, headers=headers)
+                return conn, conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as exc:
+                conn.close()
+                if reused and attempt == 0:
+                    continue
+                raise LLMError(f'connection to {host.netloc} failed: {exc}') from exc
+            except (OSError, http.client.HTTPException) as exc:
+                conn.close()
+                raise LLMError(f'request to {host.netloc} failed: {exc}') from exc
+
+    def _release(self, host, conn, response):
+        if response.will_close:
+            conn.close()
+        else:
+            host.checkin(conn)
+
+    def _send(self, host, method, target, payload, headers, timeout):
+        conn, response = self._open(host, method, target, payload, headers, timeout)
+        try:
+            data = response.read()
+        except (OSError, http.client.HTTPException) as exc:
+            conn.close()
+            raise LLMError(f'reading from {host.netloc} failed: {exc}') from exc
+        self._release(host, conn, response)
+        return response.status, data
+
+    def _acquire(self, host, background=False):
+        if not host.breaker.allow():
+            raise CircuitOpenError(f'{host.netloc} is failing; skipping calls for now')
+        if background:
+            slots, limit, kind = host.background_slots, self.background_concurrency, 'background calls'
+        else:
+            slots, limit, kind = host.slots, self.max_concurrency, 'calls'
+        # A short wait rides out a burst; a host that stays full still fails fast.
+        if not slots.acquire(timeout=self.acquire_timeout):
+            raise ProviderBusyError(f'{host.netloc} already has {limit} {kind} in flight')
+        return slots
+
+    def post_json(self, url, body, headers=None, timeout=10, background=False):
+        parts = urlsplit(url)
+        host = self._host(parts.scheme, parts.netloc)
+        slots = self._acquire(host, background)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        request_headers = {'Content-Type': 'application/json', **(headers or {})}
+        started = time.perf_counter()
+        try:
+            status, data = self._send(host, 'POST', target, json.dumps(body).encode('utf-8'), request_headers, timeout)
+        except LLMError:
+            host.breaker.record_failure()
+            raise
+        finally:
+            slots.release()
+            record_llm_time(time.perf_counter() - started)
+        if status == 429 or status >= 500:
+            host.breaker.record_failure()
+            raise LLMError(f'{parts.netloc} returned HTTP {status}')
+        host.breaker.record_success()
+        if status >= 400:
+            raise LLMError(f'{parts.netloc} returned HTTP {status}')
+        try:
+            return json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as exc:
+            raise LLMError(f'{parts.netloc} returned invalid JSON') from exc
+
+    def stream_events(self, url, body, headers=None, timeout=30):
+        # Yields each server-sent event's data as parsed JSON. The connection
+        # and its concurrency slot are held until the stream ends or the caller
+        # stops iterating; a stream abandoned early closes its connection.
+        parts = urlsplit(url)
+        host = self._host(parts.scheme, parts.netloc)
+        slots = self._acquire(host)
+        target = parts.path + (f'?{parts.query}' if parts.query else '')
+        request_headers = {'Content-Type': 'application/json', 'Accept': 'text/event-stream', **(headers or {})}
+        conn = response = None
+        finished = False
+        started = time.perf_counter()
+        try:
+            try:
+                conn, response = self._open(host, 'POST', target, json.dumps(body).encode('utf-8'), request_headers, timeout)
+            except LLMError:
+                host.breaker.record_failure()
+                raise
+            if response.status == 429 or response.status >= 500:
+                host.breaker.record_failure()
+                raise LLMError(f'{parts.netloc} returned HTTP {response.status}')
+            if response.status >= 400:
+                host.breaker.record_success()
+                raise LLMError(f'{parts.netloc} returned HTTP {response.status}')
+            lines = []
+            while True:
+                try:
+                    line = response.readline()
+                except (OSError, http.client.HTTPException) as exc:
+                    host.breaker.record_failure()
+                    raise LLMError(f'stream from {parts.netloc} failed: {exc}') from exc
+                text = line.decode('utf-8', 'replace').rstrip('\r\n')
+                if text.startswith('data:'):
+                    lines.append(text[5:].removeprefix(' '))
+                elif not text and lines:
+                    data, lines = '\n'.join(lines), []
+                    if data == '[DONE]':
+                        continue
+                    try:
+                        yield json.loads(data)
+                    except json.JSONDecodeError as exc:
+                        raise LLMError(f'{parts.netloc} streamed invalid JSON') from exc
+                if not line:
+                    break
+            host.breaker.record_success()
+            finished = True
+        finally:
+            slots.release()
+            # Includes the gaps while the caller handles each event.
+            record_llm_time(time.perf_counter() - started)
+            if conn is not None:
+                if finished:
+                    self._release(host, conn, response)
+                else:
+                    conn.close()
+
+    async def post_json_async(self, url, body, headers=None, timeout=10):
+        return await asyncio.to_thread(self.post_json, url, body, headers, timeout)
+
+    async def gather_json(self, calls, return_exceptions=True):
+        return await asyncio.gather(
+            *(self.post_json_async(**call) for call in calls),
+            return_exceptions=return_exceptions,
+        )
+
+    def close(self):
+        with self._lock:
+            hosts = list(self._hosts.values())
+        for host in hosts:
+            host.close()
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(
+                    max_idle=int(os.environ.get('LLM_POOL_SIZE', 8)),
+                    max_concurrency=int(os.environ.get('LLM_MAX_CONCURRENCY', 4)),
+                    background_concurrency=int(os.environ.get('LLM_BACKGROUND_CONCURRENCY', 1)),
+                    failure_threshold=int(os.environ.get('LLM_FAILURE_THRESHOLD', 5)),
+                    reset_after=float(os.environ.get('LLM_CIRCUIT_RESET_SECONDS', 30)),
+                    acquire_timeout=float(os.environ.get('LLM_ACQUIRE_TIMEOUT_SECONDS', 0.25)),
+                )
+    return _client
+
+def reset_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
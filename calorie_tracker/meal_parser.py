@@ -0,0 +1,244 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import os
+import re
+import threading
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from . import db, shards
+from .food_index import MACRO_FIELDS, get_food_index
+from .models import ChatMessage
+
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+NUMBER_WORDS = {
+    'a': 1, 'an': 1, 'one': 1, 'two': 2, 'three': 3, 'four': 4, 'five': 5, 'six': 6,
+    'half': 0.5, 'half a': 0.5, 'a couple of': 2, 'couple of': 2, 'a few': 3,
+}
+UNIT_NAMES = {
+    'g': 'g', 'gm': 'g', 'gms': 'g', 'gram': 'g', 'grams': 'g', 'kg': 'kg',
+    'oz': 'oz', 'ounce': 'oz', 'ounces': 'oz', 'ml': 'ml',
+    'cup': 'cup', 'cups': 'cup',
+    'piece': 'count', 'pieces': 'count', 'pc': 'count', 'pcs': 'count', 'slice': 'count', 'slices': 'count',
+    'bowl': 'count', 'bowls': 'count', 'serving': 'count', 'servings': 'count', 'scoop': 'count',
+    'scoops': 'count', 'glass': 'count', 'glasses': 'count', 'plate': 'count', 'plates': 'count',
+}
+SIZE_FACTORS = {'small': 0.75, 'medium': 1.0, 'regular': 1.0, 'large': 1.25, 'big': 1.25, 'extra large': 1.5}
+GRAMS_PER_OZ = 28.35
+ML_PER_OZ = 29.57
+ML_PER_CUP = 240
+
+def _alternatives(words):
+    return '|'.join(sorted((re.escape(word) for word in words), key=len, reverse=True))
+
+# Quantity, size and unit written right before a food, e.g. "2 large", "200 g of", "a cup of".
+PORTION_PATTERN = re.compile(
+    rf'(?:\b(?P<qty>\d+(?:\.\d+)?|\d+/\d+|{_alternatives(NUMBER_WORDS)})\s*(?:x\s+)?)?'
+    rf'(?:\b(?P<size>{_alternatives(SIZE_FACTORS)})\s+)?'
+    rf'(?:(?:\b|(?<=\d))(?P<unit>{_alternatives(UNIT_NAMES)})\b\s*)?'
+    rf'(?:\bof\s+)?'
+    rf'(?:\b(?P<size_after>{_alternatives(SIZE_FACTORS)})\s+)?$'
+)
+# Written right after a food: "x2", "200 g", "(150 g)".
+SUFFIX_PATTERN = re.compile(r'\s*(?:x\s*(?P<times>\d+)\b|\(?(?P<qty>\d+(?:\.\d+)?)\s*(?P<unit>g|grams|oz|ml)\b\)?)')
+BASE_PORTION = re.compile(r'(\d+(?:\.\d+)?)\s*(g|oz|cup|scoop|piece|small|medium|large)\b')
+TOKEN_PATTERN = re.compile(r'[a-z]+|\d+(?:\.\d+)?')
+
+# Words that carry no food meaning in a logging message.
+STOPWORDS = frozenset('''
+    i i'm im ate eaten eat eating had have having just also then log logged please for at my usual usually
+    breakfast lunch dinner brunch snack snacks supper today tonight this morning afternoon evening night
+    a an the of and with plus some me it was is my meal drank drink got
+'''.split())
+
+# Corrections, questions and negations need the planner, which can see the day's entries.
+ESCALATE_PATTERN = re.compile(
+    r"\?|\b(?:remove|delete|undo|change|update|edit|fix|correct|actually|instead|replace|wrong|not|no|"
+    r"didn'?t|don'?t|bigger|larger|smaller|make it|make that|same as|another|more|less|how|what|why|"
+    r"should|could|can)\b"
+)
+
+def min_confidence():
+    return float(os.environ.get('MEAL_PARSER_MIN_CONFIDENCE', DEFAULT_MIN_CONFIDENCE))
+
+def enabled():
+    return os.environ.get('MEAL_PARSER', '1') != '0'
+
+def _quantity(text):
+    if not text:
+        return 1.0
+    if '/' in text:
+        top, bottom = text.split('/')
+        return float(top) / float(bottom) if float(bottom) else 1.0
+    if text in NUMBER_WORDS:
+        return float(NUMBER_WORDS[text])
+    return float(text)
+
+def _base_portion(name):
+    found = BASE_PORTION.search(name.lower())
+    if not found:
+        return 1.0, 'count'
+    amount, unit = float(found.group(1)), found.group(2)
+    if unit in SIZE_FACTORS:
+        return amount, unit
+    return amount, {'scoop': 'count', 'piece': 'count'}.get(unit, unit)
+
+def _unit_multiplier(qty, unit, base_amount, base_unit):
+    if unit == 'kg':
+        qty, unit = qty * 1000, 'g'
+    if unit in (None, 'count'):
+        return qty
+    if unit == base_unit:
+        return qty / base_amount
+    conversions = {
+        ('g', 'oz'): lambda: qty / (base_amount * GRAMS_PER_OZ),
+        ('oz', 'g'): lambda: qty * GRAMS_PER_OZ / base_amount,
+        ('oz', 'cup'): lambda: qty / (8 * base_amount),
+        ('cup', 'oz'): lambda: qty * 8 / base_amount,
+        ('ml', 'oz'): lambda: qty / (ML_PER_OZ * base_amount),
+        ('ml', 'cup'): lambda: qty / (ML_PER_CUP * base_amount),
+    }
+    convert = conversions.get((unit, base_unit))
+    return convert() if convert else None
+
+def _size_factor(size, base_unit):
+    if not size:
+        return 1.0
+    # "2 large eggs" against "whole egg, 1 large" is the reference portion itself.
+    return SIZE_FACTORS[size] / SIZE_FACTORS.get(base_unit, 1.0)
+
+def _candidate_spans(text, routine_foods):
+    spans = []
+    for food in routine_foods:
+        key = food['name'].strip().lower()
+        if not key:
+            continue
+        for found in re.finditer(rf'\b{re.escape(key)}\b', text):
+            spans.append((found.start(), found.end(), 0, dict(source='routine', food=food)))
+    index = get_food_index()
+    for start, end, alias, item_ids in index.alias_spans(text):
+        food = index.item(item_ids[0])
+        spans.append((start, end, 1, dict(source='reference', food=food)))
+        # Spelling out the dish ("burrito bowl with rice and chicken") is one
+        # food, not a bowl plus rice plus chicken.
+        dish = food['name'].split(',')[0].lower()
+        dish_end = start + len(dish)
+        if dish != alias and text.startswith(dish, start) and not text[dish_end:dish_end + 1].isalnum():
+            spans.append((start, dish_end, 1, dict(source='reference', food=food)))
+    # Longest first, then your own foods before the reference, then leftmost.
+    spans.sort(key=lambda span: (-(span[1] - span[0]), span[2], span[0]))
+    chosen = []
+    for span in spans:
+        if all(span[1] <= other[0] or span[0] >= other[1] for other in chosen):
+            chosen.append(span)
+    return sorted(chosen)
+
+def _content_tokens(text):
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in STOPWORDS]
+
+def parse_meal(text, routine_foods=()):
+    lower = re.sub(r'\s+', ' ', (text or '').lower()).strip()
+    if not lower or ESCALATE_PATTERN.search(lower):
+        return dict(items=[], confidence=0.0)
+    spans = _candidate_spans(lower, routine_foods or ())
+    if not spans:
+        return dict(items=[], confidence=0.0)
+
+    items = []
+    uncovered = []
+    cursor = 0
+    for start, end, _, match in spans:
+        prefix = lower[cursor:start]
+        if items and not prefix.strip():
+            # Two foods back to back ("banana smoothie") usually name one dish.
+            return dict(items=[], confidence=0.0)
+        portion = PORTION_PATTERN.search(prefix)
+        uncovered.append(prefix[:portion.start()])
+        suffix = SUFFIX_PATTERN.match(lower, end)
+        cursor = suffix.end() if suffix else end
+
+        food = match['food']
+        qty = _quantity(portion.group('qty'))
+        unit = UNIT_NAMES.get(portion.group('unit'))
+        size = portion.group('size') or portion.group('size_after')
+        if suffix and suffix.group('times'):
+            qty *= float(suffix.group('times'))
+        elif suffix:
+            qty, unit = float(suffix.group('qty')), UNIT_NAMES[suffix.group('unit')]
+
+        if match['source'] == 'routine':
+            base_amount, base_unit = 1.0, 'count'
+            macros = food['average']
+        else:
+            base_amount, base_unit = _base_portion(food['name'])
+            macros = food
+        multiplier = _unit_multiplier(qty, unit, base_amount, base_unit)
+        if multiplier is None or multiplier <= 0:
+            return dict(items=[], confidence=0.0)
+        multiplier *= _size_factor(size, base_unit)
+        items.append(dict(
+            name=food['name'],
+            source=match['source'],
+            multiplier=round(multiplier, 3),
+            **{field: round((macros.get(field) or 0) * multiplier, 1) for field in MACRO_FIELDS},
+        ))
+    uncovered.append(lower[cursor:])
+
+    total = len(_content_tokens(lower))
+    unknown = sum(len(_content_tokens(part)) for part in uncovered)
+    confidence = (total - unknown) / total if total else 0.0
+    return dict(items=items, confidence=round(confidence, 3))
+
+# Which path answered each coach turn: the local parser, a provider round
+# trip, or the built-in rules (water, steps, undo, canned replies).
+PATHS = ('local', 'llm', 'rules')
+LOCAL_INTENT = 'local_food_plan'
+
+_paths = Counter()
+_paths_lock = threading.Lock()
+
+def path_for_turn(intent, llm_calls):
+    if intent == LOCAL_INTENT:
+        return 'local'
+    return 'llm' if llm_calls else 'rules'
+
+def record_path(intent, llm_calls):
+    with _paths_lock:
+        _paths[path_for_turn(intent, llm_calls)] += 1
+
+def _offload_ratio(counts):
+    food_turns = counts.get('local', 0) + counts.get('llm', 0)
+    return round(counts.get('local', 0) / food_turns, 4) if food_turns else 0.0
+
+def path_stats():
+    with _paths_lock:
+        counts = {path: _paths[path] for path in PATHS}
+    return dict(counts, llm_offload_ratio=_offload_ratio(counts))
+
+def reset_path_stats():
+    with _paths_lock:
+        _paths.clear()
+
+meals_cli = AppGroup('meals', help='Inspect how Nibbly turns are served.')
+
+# Stored messages only keep the intent, and planner turns share intents with
+# some rule replies, so this counts food logs by intent rather than by path.
+@meals_cli.command('paths')
+@click.option('--days', type=int, default=7, show_default=True, help='Look back this many days.')
+def paths_command(days):
+    since = datetime.utcnow() - timedelta(days=days)
+    counts = Counter()
+    for _ in shards.each_shard():
+        rows = db.session.execute(
+            select(ChatMessage.intent, func.count())
+            .where(ChatMessage.role == 'assistant', ChatMessage.created_at >= since)
+            .group_by(ChatMessage.intent)
+        ).all()
+        for intent, count in rows:
+            counts[intent or 'chat'] += count
+    for intent, count in counts.most_common():
+        click.echo(f'{intent}: {count}')
+    food_logs = sum(counts[intent] for intent in (LOCAL_INTENT, 'agent_plan', 'ai_food_plan', 'reference_food_plan'))
+    share = counts[LOCAL_INTENT] / food_logs if food_logs else 0.0
+    click.echo(f'parsed locally: {share:.1%} of {food_logs} food and planner turns')
@@ -0,0 +1,214 @@
+from collections import Counter
+import os
+import threading
+import time
+from flask import g, has_app_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+# Opt-in per-endpoint timings. With METRICS unset nothing is hooked and the
+# record_* calls return straight away.
+def enabled():
+    return os.environ.get('METRICS', '0') == '1'
+
+SUB_BUCKET_BITS = 5
+
+# HDR-style log-linear buckets: every power of two is split into 32 steps,
+# so any recorded value is known to within ~3% and percentiles stay accurate
+# from microseconds to minutes without fixing the range up front.
+class Histogram:
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._buckets = Counter()
+
+    @staticmethod
+    def _key(units):
+        shift = max(0, units.bit_length() - SUB_BUCKET_BITS - 1)
+        return shift, units >> shift
+
+    def _upper(self, key):
+        shift, mantissa = key
+        return ((mantissa + 1) << shift) / self.scale
+
+    def record(self, value):
+        self._buckets[self._key(max(0, int(value * self.scale)))] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for key in sorted(self._buckets):
+            seen += self._buckets[key]
+            if seen >= rank:
+                return min(self._upper(key), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        keys = sorted(self._buckets)
+        counts, seen, i = [], 0, 0
+        for bound in bounds:
+            while i < len(keys) and self._upper(keys[i]) <= bound:
+                seen += self._buckets[keys[i]]
+                i += 1
+            counts.append(seen)
+        return counts
+
+# (name, help, scale, Prometheus bucket bounds); time in ms to the microsecond.
+TIME_BOUNDS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+SERIES = (
+    ('duration_ms', 'Time from the first before_request hook to the last after_request hook.', 1000, TIME_BOUNDS),
+    ('db_ms', 'Time spent in cursor.execute.', 1000, TIME_BOUNDS),
+    ('llm_ms', 'Time spent waiting on LLM provider calls.', 1000, TIME_BOUNDS),
+    ('json_ms', 'Time spent serializing JSON responses.', 1000, TIME_BOUNDS),
+    ('queries', 'SQL statements executed.', 1, (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+)
+
+_histograms = {}
+_responses = Counter()
+_lock = threading.Lock()
+
+def _timings():
+    return g.get('request_metrics') if has_app_context() else None
+
+def _add(name, seconds):
+    timings = _timings()
+    if timings is not None:
+        timings[name] += seconds * 1000
+
+def record_llm_time(seconds):
+    _add('llm_ms', seconds)
+
+def _before_cursor(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        _add('db_ms', time.perf_counter() - started)
+
+def install_db_timer(engine):
+    if not event.contains(engine, 'before_cursor_execute', _before_cursor):
+        event.listen(engine, 'before_cursor_execute', _before_cursor)
+        event.listen(engine, 'after_cursor_execute', _after_cursor)
+
+class TimedJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            _add('json_ms', time.perf_counter() - started)
+
+def _start_request():
+    if request.path.startswith('/api/'):
+        g.request_metrics = dict(started=time.perf_counter(), db_ms=0.0, llm_ms=0.0, json_ms=0.0)
+
+def _finish_request(response):
+    timings = g.pop('request_metrics', None)
+    if timings is None:
+        return response
+    from .turn import query_count
+    values = dict(timings, duration_ms=(time.perf_counter() - timings['started']) * 1000, queries=query_count())
+    endpoint = request.endpoint or 'unmatched'
+    with _lock:
+        for name, _, scale, _ in SERIES:
+            key = (name, endpoint, request.method)
+            histogram = _histograms.get(key)
+            if histogram is None:
+                histogram = _histograms[key] = Histogram(scale)
+            histogram.record(values[name])
+        _responses[(endpoint, request.method, response.status_code)] += 1
+    # Streamed bodies are still running here; their numbers cover the setup only.
+    response.headers['Server-Timing'] = ', '.join((
+        f"db;dur={values['db_ms']:.1f};desc=\"{values['queries']} queries\"",
+        f"llm;dur={values['llm_ms']:.1f}",
+        f"json;dur={values['json_ms']:.1f}",
+        f"total;dur={values['duration_ms']:.1f}",
+    ))
+    return response
+
+def init_metrics(app):
+    if not enabled():
+        return
+    app.json = TimedJSONProvider(app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+def endpoint_stats():
+    with _lock:
+        return {
+            (name, endpoint, method): dict(
+                count=h.count, mean=round(h.total / h.count, 3) if h.count else 0.0,
+                p50=h.percentile(0.5), p95=h.percentile(0.95), p99=h.percentile(0.99), max=h.max,
+            )
+            for (name, endpoint, method), h in _histograms.items()
+        }
+
+def reset_metrics():
+    with _lock:
+        _histograms.clear()
+        _responses.clear()
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+def _gauges(lines, prefix, stats, kind='gauge', **labels):
+    for key, value in stats.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            continue
+        name = f'{prefix}_{key}'
+        lines.append(f'# TYPE {name} {kind}')
+        lines.append(f'{name}{_labels(**labels) if labels else ""} {_number(value)}')
+
+def render_prometheus():
+    from .cache import get_cache
+    from .compression import compression_stats
+    from .jobs import outbox_stats
+    from .meal_parser import path_stats
+
+    lines = []
+    with _lock:
+        for name, help_text, _, bounds in SERIES:
+            metric = f'fitit_http_request_{name}'
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} histogram')
+            for (series, endpoint, method), histogram in sorted(_histograms.items()):
+                if series != name:
+                    continue
+                labels = dict(endpoint=endpoint, method=method)
+                for bound, count in zip(bounds, histogram.cumulative(bounds)):
+                    lines.append(f'{metric}_bucket{_labels(**labels, le=bound)} {count}')
+                lines.append(f'{metric}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+                lines.append(f'{metric}_sum{_labels(**labels)} {_number(histogram.total)}')
+                lines.append(f'{metric}_count{_labels(**labels)} {histogram.count}')
+        lines.append('# TYPE fitit_http_responses_total counter')
+        for (endpoint, method, status), count in sorted(_responses.items()):
+            lines.append(f'fitit_http_responses_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    cache = get_cache().stats()
+    _gauges(lines, 'fitit_ai_cache', cache, backend=cache.get('backend', ''))
+    paths = path_stats()
+    lines.append('# TYPE fitit_nibbly_turns_total counter')
+    for path, count in paths.items():
+        if path != 'llm_offload_ratio':
+            lines.append(f'fitit_nibbly_turns_total{_labels(path=path)} {count}')
+    _gauges(lines, 'fitit_nibbly', dict(llm_offload_ratio=paths['llm_offload_ratio']))
+    _gauges(lines, 'fitit_outbox', outbox_stats())
+    lines.append('# TYPE fitit_compression_bytes_total counter')
+    for encoding, stats in sorted(compression_stats().items()):
+        lines.append(f'fitit_compression_bytes_total{_labels(encoding=encoding, direction="in")} {stats["bytes_in"]}')
+        lines.append(f'fitit_compression_bytes_total{_labels(encoding=encoding, direction="out")} {stats["bytes_out"]}')
+    return '\n'.join(lines) + '\n'
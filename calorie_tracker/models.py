@@ -1,7 +1,7 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
-from . import db, login_manager
+from . import db, login_manager, shards
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -23,6 +23,11 @@ class User(UserMixin, db.Model):
     step_goal = db.Column(db.Integer, default=10000)
     sleep_goal = db.Column(db.Float, default=8.0)
     calories_burnt_goal = db.Column(db.Integer, default=300)
+    # Which database holds this user's entries; see shards.py. Deferred and
+    # left to the server default, so with sharding off no statement names the
+    # column and a database that predates its migration keeps working.
+    shard = db.deferred(db.Column(db.Integer, nullable=False, server_default='0'))
+    __mapper_args__ = {'eager_defaults': False}
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password, method='pbkdf2:sha256')
@@ -32,7 +37,11 @@ class User(UserMixin, db.Model):
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    query = User.query
+    if shards.enabled():
+        # Every request routes by it, so load it with the user.
+        query = query.options(db.undefer(User.shard))
+    return query.get(int(user_id))
 
 class FoodEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -46,6 +55,7 @@ class FoodEntry(db.Model):
     fat = db.Column(db.Float, default=0)
     sugar = db.Column(db.Float, default=0)
     user = db.relationship('User', backref=db.backref('food_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_food_entry_user_date', 'user_id', 'date', 'id'),)
 
 class WaterEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -53,6 +63,7 @@ class WaterEntry(db.Model):
     date = db.Column(db.Date, nullable=False)
     amount_ml = db.Column(db.Integer, nullable=False)
     user = db.relationship('User', backref=db.backref('water_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_water_entry_user_date', 'user_id', 'date', 'id'),)
 
 class WeightEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -60,6 +71,7 @@ class WeightEntry(db.Model):
     date = db.Column(db.Date, nullable=False)
     weight_kg = db.Column(db.Float, nullable=False)
     user = db.relationship('User', backref=db.backref('weight_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_weight_entry_user_date', 'user_id', 'date', 'id'),)
 
 class StepEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -67,6 +79,7 @@ class StepEntry(db.Model):
     date = db.Column(db.Date, nullable=False)
     steps = db.Column(db.Integer, nullable=False)
     user = db.relationship('User', backref=db.backref('step_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_step_entry_user_date', 'user_id', 'date', 'id'),)
 
 class SleepEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,6 +89,7 @@ class SleepEntry(db.Model):
     sleep_time = db.Column(db.Time, nullable=True)
     wake_time = db.Column(db.Time, nullable=True)
     user = db.relationship('User', backref=db.backref('sleep_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_sleep_entry_user_date', 'user_id', 'date', 'id'),)
 
 class CaloriesBurntEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -83,6 +97,7 @@ class CaloriesBurntEntry(db.Model):
     date = db.Column(db.Date, nullable=False)
     calories_burnt = db.Column(db.Integer, nullable=False)
     user = db.relationship('User', backref=db.backref('calories_burnt_entries', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_calories_burnt_entry_user_date', 'user_id', 'date', 'id'),)
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -92,6 +107,7 @@ class ChatMessage(db.Model):
     intent = db.Column(db.String(50), nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user = db.relationship('User', backref=db.backref('chat_messages', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_chat_message_user_created', 'user_id', 'created_at', 'id'),)
 
 class UserMemory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -112,6 +128,7 @@ class AgentActionLog(db.Model):
     result = db.Column(db.Text, nullable=True)
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     user = db.relationship('User', backref=db.backref('agent_actions', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_agent_action_log_user_created', 'user_id', 'created_at', 'id'),)
 
 class Friendship(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -125,6 +142,7 @@ class Friendship(db.Model):
     __table_args__ = (
         db.UniqueConstraint('requester_id', 'receiver_id', name='uq_friendship_pair'),
         db.CheckConstraint('requester_id != receiver_id', name='ck_friendship_not_self'),
+        db.Index('ix_friendship_receiver', 'receiver_id', 'requester_id'),
     )
 
 class FriendPrivacy(db.Model):
@@ -140,3 +158,73 @@ class FriendPrivacy(db.Model):
     show_food_names = db.Column(db.Boolean, nullable=False, default=False)
     updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
     user = db.relationship('User', backref=db.backref('friend_privacy', uselist=False, cascade='all, delete-orphan'))
+
+class DailyRollup(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    calories = db.Column(db.Float, nullable=False, default=0)
+    carbs = db.Column(db.Float, nullable=False, default=0)
+    protein = db.Column(db.Float, nullable=False, default=0)
+    fat = db.Column(db.Float, nullable=False, default=0)
+    sugar = db.Column(db.Float, nullable=False, default=0)
+    water = db.Column(db.Integer, nullable=False, default=0)
+    steps = db.Column(db.Integer, nullable=False, default=0)
+    sleep = db.Column(db.Float, nullable=False, default=0)
+    calories_burnt = db.Column(db.Integer, nullable=False, default=0)
+    user = db.relationship('User', backref=db.backref('daily_rollups', lazy=True, cascade='all, delete-orphan'))
+
+class FoodProfile(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    key = db.Column(db.String(100), primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    calories = db.Column(db.Float, nullable=False, default=0)
+    protein = db.Column(db.Float, nullable=False, default=0)
+    carbs = db.Column(db.Float, nullable=False, default=0)
+    fat = db.Column(db.Float, nullable=False, default=0)
+    sugar = db.Column(db.Float, nullable=False, default=0)
+    score = db.Column(db.Float, nullable=False, default=0)
+    score_date = db.Column(db.Date, nullable=True)
+    rank = db.Column(db.Float, nullable=True)
+    last_date = db.Column(db.Date, nullable=True)
+    user = db.relationship('User', backref=db.backref('food_profiles', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_food_profile_user_rank', 'user_id', 'rank'),)
+
+class UserSearchTerm(db.Model):
+    term = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    rank = db.Column(db.SmallInteger, nullable=False)
+    sort_name = db.Column(db.String(80), nullable=False)
+    user = db.relationship('User', backref=db.backref('search_terms', lazy=True, cascade='all, delete-orphan'))
+    __table_args__ = (db.Index('ix_user_search_term_rank', 'term', 'rank', 'sort_name', 'user_id'),)
+
+class CacheEntry(db.Model):
+    key = db.Column(db.String(160), primary_key=True)
+    scope = db.Column(db.String(64), nullable=False)
+    value = db.Column(db.Text, nullable=False)
+    expires_at = db.Column(db.Float, nullable=False)
+    used_at = db.Column(db.Float, nullable=False)
+    __table_args__ = (
+        db.Index('ix_cache_entry_scope', 'scope'),
+        db.Index('ix_cache_entry_used_at', 'used_at'),
+    )
+
+class OutboxJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.Float, nullable=False)
+    claimed_at = db.Column(db.Float, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+    __table_args__ = (db.Index('ix_outbox_job_created_at', 'created_at'),)
+
+class ResourceVersion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    resource = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Backfill(db.Model):
+    # One row per derived table that has been filled from existing data.
+    name = db.Column(db.String(64), primary_key=True)
+    completed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,180 @@
+from collections import defaultdict
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db, shards
+from .models import FoodEntry, WaterEntry, StepEntry, SleepEntry, CaloriesBurntEntry, DailyRollup
+from .utils import TOTAL_METRICS
+
+# Rollup metric -> entry column, per entry model.
+ROLLUP_SOURCES = {
+    FoodEntry: dict(calories='calories', carbs='carbs', protein='protein', fat='fat', sugar='sugar'),
+    WaterEntry: dict(water='amount_ml'),
+    StepEntry: dict(steps='steps'),
+    SleepEntry: dict(sleep='duration_hours'),
+    CaloriesBurntEntry: dict(calories_burnt='calories_burnt'),
+}
+
+DRIFT_TOLERANCE = 0.01
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    pass
+
+# Load the previous value on set even when the attribute was expired, so the
+# flush hook can always subtract what an update or delete replaced.
+for _model, _columns in ROLLUP_SOURCES.items():
+    for _attr in ('user_id', 'date', *_columns.values()):
+        event.listen(getattr(_model, _attr), 'set', _keep_old_value, active_history=True)
+
+def _committed_value(state, attr):
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return state.attrs[attr].value
+
+def _add(deltas, user_id, date_, columns, values, sign):
+    if user_id is None or date_ is None:
+        return
+    bucket = deltas[(user_id, date_)]
+    for metric, attr in columns.items():
+        bucket[metric] += sign * (values(attr) or 0)
+
+def collect_deltas(session):
+    deltas = defaultdict(lambda: dict.fromkeys(TOTAL_METRICS, 0))
+    for obj in session.new:
+        columns = ROLLUP_SOURCES.get(type(obj))
+        if columns:
+            _add(deltas, obj.user_id, obj.date, columns, lambda attr: getattr(obj, attr), 1)
+    for obj in session.deleted:
+        columns = ROLLUP_SOURCES.get(type(obj))
+        if columns:
+            state = inspect(obj)
+            _add(deltas, _committed_value(state, 'user_id'), _committed_value(state, 'date'), columns,
+                 lambda attr: _committed_value(state, attr), -1)
+    for obj in session.dirty:
+        columns = ROLLUP_SOURCES.get(type(obj))
+        if not columns:
+            continue
+        state = inspect(obj)
+        if not any(state.attrs[attr].history.has_changes() for attr in ('user_id', 'date', *columns.values())):
+            continue
+        _add(deltas, _committed_value(state, 'user_id'), _committed_value(state, 'date'), columns,
+             lambda attr: _committed_value(state, attr), -1)
+        _add(deltas, obj.user_id, obj.date, columns, lambda attr: getattr(obj, attr), 1)
+    return deltas
+
+def apply_deltas(connection, deltas):
+    rows = []
+    for (user_id, date_), bucket in deltas.items():
+        if any(bucket.values()):
+            rows.append(dict(user_id=user_id, date=date_, **bucket))
+    if not rows:
+        return
+    table = DailyRollup.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'date'],
+            set_={metric: table.c[metric] + statement.excluded[metric] for metric in TOTAL_METRICS},
+        )
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.user_id == row['user_id'], table.c.date == row['date'])
+            .values({metric: table.c[metric] + row[metric] for metric in TOTAL_METRICS})
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert().values(**row))
+
+@event.listens_for(db.session, 'after_flush')
+def _update_rollups(session, flush_context):
+    deltas = collect_deltas(session)
+    if deltas:
+        for connection, group in shards.connections(session, deltas):
+            apply_deltas(connection, group)
+
+def compute_rollups(user_id=None):
+    computed = defaultdict(lambda: dict.fromkeys(TOTAL_METRICS, 0))
+    for model, columns in ROLLUP_SOURCES.items():
+        query = select(model.user_id, model.date, *(
+            func.coalesce(func.sum(getattr(model, attr)), 0).label(metric) for metric, attr in columns.items()
+        )).group_by(model.user_id, model.date)
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        for row in db.session.execute(query):
+            bucket = computed[(row.user_id, row.date)]
+            for metric in columns:
+                bucket[metric] = row._mapping[metric]
+    return computed
+
+def find_drift(user_id=None):
+    computed = compute_rollups(user_id)
+    query = select(DailyRollup)
+    if user_id is not None:
+        query = query.where(DailyRollup.user_id == user_id)
+    stored = {(r.user_id, r.date): {m: getattr(r, m) for m in TOTAL_METRICS} for r in db.session.scalars(query)}
+    zero = dict.fromkeys(TOTAL_METRICS, 0)
+    drift = []
+    for key in sorted(set(computed) | set(stored)):
+        expected = computed.get(key, zero)
+        actual = stored.get(key, zero)
+        diffs = {
+            metric: (actual[metric], expected[metric])
+            for metric in TOTAL_METRICS
+            if abs((actual[metric] or 0) - (expected[metric] or 0)) > DRIFT_TOLERANCE
+        }
+        if diffs:
+            drift.append((key, diffs))
+    return drift
+
+def rebuild_rollups(user_id=None):
+    computed = compute_rollups(user_id)
+    delete = DailyRollup.__table__.delete()
+    if user_id is not None:
+        delete = delete.where(DailyRollup.user_id == user_id)
+    db.session.execute(delete)
+    rows = [dict(user_id=key[0], date=key[1], **values) for key, values in computed.items()]
+    if rows:
+        db.session.execute(DailyRollup.__table__.insert(), rows)
+    db.session.commit()
+    return len(rows)
+
+def backfill_empty():
+    # create_all gives a database that predates this table an empty one;
+    # without its rows every total before today would read as zero.
+    if db.session.execute(select(DailyRollup.user_id).limit(1)).first() is not None:
+        return 0
+    if not any(db.session.execute(select(model.id).limit(1)).first() for model in ROLLUP_SOURCES):
+        return 0
+    return rebuild_rollups()
+
+rollups_cli = AppGroup('rollups', help='Maintain the DailyRollup totals table.')
+
+@rollups_cli.command('check')
+@click.option('--user-id', type=int, default=None, help='Only check one user.')
+def check_command(user_id):
+    drift = []
+    for _ in shards.each_shard(user_id):
+        drift.extend(find_drift(user_id))
+    for (uid, date_), diffs in drift:
+        detail = ', '.join(f'{metric} stored={actual} expected={expected}' for metric, (actual, expected) in diffs.items())
+        click.echo(f'user {uid} {date_.isoformat()}: {detail}')
+    if drift:
+        raise click.ClickException(f'{len(drift)} rollup day(s) drifted from raw entries. Run `flask rollups rebuild`.')
+    click.echo('Rollups match raw entries.')
+
+@rollups_cli.command('rebuild')
+@click.option('--user-id', type=int, default=None, help='Only rebuild one user.')
+def rebuild_command(user_id):
+    drifted = count = 0
+    for _ in shards.each_shard(user_id):
+        drifted += len(find_drift(user_id))
+        count += rebuild_rollups(user_id)
+    click.echo(f'Rebuilt {count} rollup day(s); {drifted} had drifted.')
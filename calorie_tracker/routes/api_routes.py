@@ -1,19 +1,33 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, g, jsonify, request, stream_with_context
 from flask_login import login_user, logout_user, current_user, login_required
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import joinedload
 from datetime import datetime, date, timedelta
 import json
 import os
 import re
-import urllib.error
-import urllib.request
 from .. import db
+from .. import bulk
 from ..models import (
     User, FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry,
     CaloriesBurntEntry, ChatMessage, UserMemory, AgentActionLog,
     Friendship, FriendPrivacy
 )
-from ..utils import get_daily_totals, get_health_metrics, get_user_goals
+from ..cache import changed_days, context_digest, get_cache, scope_for
+from ..entries import ENTRY_MODELS, EntryError, entry_values
+from ..food_index import get_food_index
+from ..food_profile import top_foods
+from ..jobs import enqueue as enqueue_job, handler as job_handler, submit as submit_job
+from ..llm import LLMError, gemini_url, openai_url, get_client as llm_client
+from .. import meal_parser, metrics, shards
+from ..routing import read_only
+from ..search import search_user_ids
+from ..turn import count_llm_call, invalidate as invalidate_turn, llm_calls, memoized
+from ..utils import (
+    TOTAL_METRICS, get_daily_totals, get_health_metrics, get_range_totals, get_user_goals,
+    get_users_daily_totals, history_period
+)
+from ..versions import ENTRIES, FRIENDS, USER, conditional
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -105,65 +119,180 @@ def _serialize_friendship(friendship):
         created_at=friendship.created_at.isoformat(),
     )
 
-def _accepted_friendships(user_id):
-    return Friendship.query.filter(
-        Friendship.status == 'accepted',
+FRIENDSHIP_PAGE_SIZE = 200
+MAX_FRIENDSHIP_PAGE_SIZE = 500
+
+def _friendships_query(user_id, statuses):
+    return Friendship.query.options(
+        joinedload(Friendship.requester),
+        joinedload(Friendship.receiver),
+    ).filter(
         or_(Friendship.requester_id == user_id, Friendship.receiver_id == user_id),
-    ).order_by(Friendship.updated_at.desc(), Friendship.id.desc()).all()
-
-def _friend_metric_summary(user, selected):
-    privacy = _ensure_friend_privacy(user.id)
-    totals = get_daily_totals(user.id, selected)
-    payload = dict(user=_public_user(user), date=selected.isoformat(), shared=_serialize_friend_privacy(privacy))
-    if privacy.show_calories:
-        payload['calories'] = round(totals.get('calories', 0), 1)
-        payload['calorie_goal'] = user.calorie_goal
-    if privacy.show_macros:
-        payload['macros'] = dict(
-            protein=round(totals.get('protein', 0), 1),
-            carbs=round(totals.get('carbs', 0), 1),
-            fat=round(totals.get('fat', 0), 1),
-        )
-        payload['macro_goals'] = dict(
-            protein=user.protein_goal,
-            carbs=user.carbs_goal,
-            fat=user.fat_goal,
+        Friendship.status.in_(statuses),
+    ).order_by(Friendship.updated_at.desc(), Friendship.id.desc())
+
+def _parse_friendship_cursor(value):
+    try:
+        updated_at, friendship_id = value.rsplit(',', 1)
+        return datetime.fromisoformat(updated_at), int(friendship_id)
+    except ValueError:
+        raise ValueError('Invalid cursor') from None
+
+def _friendship_cursor(friendship):
+    return f"{friendship.updated_at.isoformat()},{friendship.id}"
+
+def _paginate_friendships(query):
+    # Paging is opt-in: without limit or after every friendship comes back,
+    # so clients that never follow next_after still see all of them.
+    limit, after = request.args.get('limit'), request.args.get('after')
+    if limit is None and after is None:
+        return query.all(), None
+    try:
+        limit = FRIENDSHIP_PAGE_SIZE if limit is None else int(limit)
+    except ValueError:
+        raise ValueError('limit must be a whole number') from None
+    limit = min(max(limit, 1), MAX_FRIENDSHIP_PAGE_SIZE)
+    if after is not None:
+        updated_at, friendship_id = _parse_friendship_cursor(after)
+        query = query.filter(or_(
+            Friendship.updated_at < updated_at,
+            and_(Friendship.updated_at == updated_at, Friendship.id < friendship_id),
+        ))
+    page = query.limit(limit + 1).all()
+    next_after = _friendship_cursor(page[limit - 1]) if len(page) > limit else None
+    return page[:limit], next_after
+
+def _default_friend_privacy(user_id):
+    # Never added to the session: column defaults only apply on insert, so
+    # they are copied here.
+    defaults = {
+        column.name: column.default.arg
+        for column in FriendPrivacy.__table__.columns if column.name.startswith('show_')
+    }
+    return FriendPrivacy(user_id=user_id, **defaults)
+
+def _friend_privacy_map(user_ids):
+    # A read path, possibly on the replica: users without a row get the
+    # defaults instead of one being inserted.
+    privacy = {p.user_id: p for p in FriendPrivacy.query.filter(FriendPrivacy.user_id.in_(user_ids)).all()}
+    for user_id in user_ids:
+        if user_id not in privacy:
+            privacy[user_id] = _default_friend_privacy(user_id)
+    return privacy
+
+def _latest_weights(user_ids):
+    if not user_ids:
+        return {}
+    ranked = select(
+        WeightEntry.user_id,
+        WeightEntry.weight_kg,
+        func.row_number().over(
+            partition_by=WeightEntry.user_id,
+            order_by=(WeightEntry.date.desc(), WeightEntry.id.desc()),
+        ).label('rank'),
+    ).where(WeightEntry.user_id.in_(user_ids)).subquery()
+    rows = db.session.execute(select(ranked.c.user_id, ranked.c.weight_kg).where(ranked.c.rank == 1)).all()
+    return {row.user_id: row.weight_kg for row in rows}
+
+def _recent_food_names(user_ids, selected, limit=5):
+    if not user_ids:
+        return {}
+    ranked = select(
+        FoodEntry.user_id,
+        FoodEntry.id,
+        FoodEntry.name,
+        FoodEntry.calories,
+        func.row_number().over(partition_by=FoodEntry.user_id, order_by=FoodEntry.id.desc()).label('rank'),
+    ).where(FoodEntry.user_id.in_(user_ids), FoodEntry.date == selected).subquery()
+    rows = db.session.execute(
+        select(ranked.c.user_id, ranked.c.id, ranked.c.name, ranked.c.calories)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.user_id, ranked.c.id.desc())
+    ).all()
+    foods = {}
+    for row in rows:
+        foods.setdefault(row.user_id, []).append(dict(id=row.id, name=row.name, calories=row.calories))
+    return foods
+
+@read_only
+def _friend_metric_summaries(users, selected):
+    user_ids = list(dict.fromkeys(u.id for u in users))
+    privacy_map = _friend_privacy_map(user_ids)
+    weight_ids = {uid for uid in user_ids if privacy_map[uid].show_weight}
+    food_ids = {uid for uid in user_ids if privacy_map[uid].show_food_names}
+
+    def read_shard(shard_user_ids):
+        return (
+            get_users_daily_totals(shard_user_ids, selected),
+            _latest_weights([uid for uid in shard_user_ids if uid in weight_ids]),
+            _recent_food_names([uid for uid in shard_user_ids if uid in food_ids], selected),
         )
-    if privacy.show_water:
-        payload['water'] = int(totals.get('water', 0))
-        payload['water_goal'] = user.water_goal
-    if privacy.show_steps:
-        payload['steps'] = int(totals.get('steps', 0))
-        payload['step_goal'] = user.step_goal
-    if privacy.show_sleep:
-        payload['sleep'] = round(totals.get('sleep', 0), 1)
-        payload['sleep_goal'] = user.sleep_goal
-    if privacy.show_weight:
-        latest_weight = (WeightEntry.query.filter_by(user_id=user.id)
-                         .order_by(WeightEntry.date.desc(), WeightEntry.id.desc()).first())
-        payload['weight_kg'] = round(latest_weight.weight_kg, 1) if latest_weight else None
-    if privacy.show_food_names:
-        payload['foods'] = [
-            dict(id=e.id, name=e.name, calories=e.calories)
-            for e in FoodEntry.query.filter_by(user_id=user.id, date=selected)
-                                    .order_by(FoodEntry.id.desc()).limit(5).all()
-        ]
-    return payload
+
+    # The same reads on every shard at once. The caller is first in users, so
+    # their shard is read in this thread.
+    totals_map, weights, foods = {}, {}, {}
+    for shard_totals, shard_weights, shard_foods in shards.fan_out(shards.group_by_shard(user_ids), read_shard):
+        totals_map.update(shard_totals)
+        weights.update(shard_weights)
+        foods.update(shard_foods)
+    summaries = {}
+    for user in users:
+        privacy = privacy_map[user.id]
+        totals = totals_map[user.id]
+        payload = dict(user=_public_user(user), date=selected.isoformat(), shared=_serialize_friend_privacy(privacy))
+        if privacy.show_calories:
+            payload['calories'] = round(totals.get('calories', 0), 1)
+            payload['calorie_goal'] = user.calorie_goal
+        if privacy.show_macros:
+            payload['macros'] = dict(
+                protein=round(totals.get('protein', 0), 1),
+                carbs=round(totals.get('carbs', 0), 1),
+                fat=round(totals.get('fat', 0), 1),
+            )
+            payload['macro_goals'] = dict(
+                protein=user.protein_goal,
+                carbs=user.carbs_goal,
+                fat=user.fat_goal,
+            )
+        if privacy.show_water:
+            payload['water'] = int(totals.get('water', 0))
+            payload['water_goal'] = user.water_goal
+        if privacy.show_steps:
+            payload['steps'] = int(totals.get('steps', 0))
+            payload['step_goal'] = user.step_goal
+        if privacy.show_sleep:
+            payload['sleep'] = round(totals.get('sleep', 0), 1)
+            payload['sleep_goal'] = user.sleep_goal
+        if privacy.show_weight:
+            latest_weight = weights.get(user.id)
+            payload['weight_kg'] = round(latest_weight, 1) if latest_weight is not None else None
+        if privacy.show_food_names:
+            payload['foods'] = foods.get(user.id, [])
+        summaries[user.id] = payload
+    return summaries
 
 def _number_before(words, text, default=None):
     pattern = rf'(\d+(?:\.\d+)?)\s*(?:{"|".join(words)})'
     found = re.search(pattern, text)
     return float(found.group(1)) if found else default
 
+def _memory_rows(user_id):
+    return memoized(('memory_rows', user_id), lambda: {
+        m.key: m for m in UserMemory.query.filter_by(user_id=user_id).all()
+    }, orm=True)
+
 def _remember(user_id, key, value):
-    memory = UserMemory.query.filter_by(user_id=user_id, key=key).first()
+    # The turn's memory rows stay current, so this needs no lookup per key.
+    rows = _memory_rows(user_id)
+    memory = rows.get(key)
     if memory:
         memory.value = value
     else:
-        db.session.add(UserMemory(user_id=user_id, key=key, value=value))
+        memory = rows[key] = UserMemory(user_id=user_id, key=key, value=value)
+        db.session.add(memory)
 
 def _memory_map(user_id):
-    return {m.key: m.value for m in UserMemory.query.filter_by(user_id=user_id).all()}
+    return {key: memory.value for key, memory in _memory_rows(user_id).items()}
 
 def _latest_entry(model, user_id):
     return model.query.filter_by(user_id=user_id).order_by(model.date.desc(), model.id.desc()).first()
@@ -172,13 +301,13 @@ def _agent_result(ok_, message, **data):
     return {'ok': ok_, 'message': message, **data}
 
 def _log_agent_tool(tool, request_data, result):
-    db.session.add(AgentActionLog(
-        user_id=current_user.id,
-        agent='nibbly',
+    # Written by the coach_turn job after the turn commits.
+    g.setdefault('agent_tool_logs', []).append(dict(
         tool=tool,
         status='ok' if result.get('ok') else 'blocked',
         request=json.dumps(request_data, default=str, separators=(',', ':'))[:2000],
         result=json.dumps(result, default=str, separators=(',', ':'))[:2000],
+        created_at=datetime.utcnow().isoformat(),
     ))
 
 def _entry_snapshot(entry):
@@ -191,54 +320,8 @@ def _entry_snapshot(entry):
         sugar=entry.sugar,
     )
 
-MACRO_REFERENCE = [
-    dict(name='cooked white rice, 1 cup', aliases=('rice', 'white rice'), calories=205, protein=4.3, carbs=44.5, fat=0.4, sugar=0.1),
-    dict(name='cooked brown rice, 1 cup', aliases=('brown rice',), calories=218, protein=4.5, carbs=45.8, fat=1.6, sugar=0.7),
-    dict(name='cooked basmati rice, 1 cup', aliases=('basmati', 'basmati rice'), calories=210, protein=4.4, carbs=45.6, fat=0.5, sugar=0.1),
-    dict(name='cooked pasta, 1 cup', aliases=('pasta', 'noodles'), calories=220, protein=8.1, carbs=43.2, fat=1.3, sugar=0.8),
-    dict(name='wheat chapati, 1 medium', aliases=('chapati', 'roti'), calories=120, protein=3.1, carbs=18.0, fat=3.7, sugar=0.8),
-    dict(name='idli, 1 piece', aliases=('idli',), calories=58, protein=2.0, carbs=12.0, fat=0.4, sugar=0.2),
-    dict(name='plain dosa, 1 medium', aliases=('dosa',), calories=168, protein=3.8, carbs=29.0, fat=3.7, sugar=0.9),
-    dict(name='cooked oatmeal, 1 cup', aliases=('oatmeal', 'oats'), calories=166, protein=5.9, carbs=28.1, fat=3.6, sugar=0.6),
-    dict(name='whole egg, 1 large', aliases=('egg', 'eggs'), calories=72, protein=6.3, carbs=0.4, fat=4.8, sugar=0.2),
-    dict(name='grilled chicken breast, 100 g', aliases=('chicken', 'chicken breast', 'grilled chicken'), calories=165, protein=31.0, carbs=0.0, fat=3.6, sugar=0.0),
-    dict(name='salmon, cooked, 100 g', aliases=('salmon',), calories=206, protein=22.1, carbs=0.0, fat=12.4, sugar=0.0),
-    dict(name='tofu, firm, 100 g', aliases=('tofu',), calories=144, protein=17.3, carbs=2.8, fat=8.7, sugar=0.6),
-    dict(name='paneer, 100 g', aliases=('paneer',), calories=321, protein=21.4, carbs=3.6, fat=25.0, sugar=2.6),
-    dict(name='cooked chickpeas, 1 cup', aliases=('chickpeas', 'chana'), calories=269, protein=14.5, carbs=45.0, fat=4.2, sugar=7.9),
-    dict(name='cooked lentils, 1 cup', aliases=('lentils', 'dal', 'dhal'), calories=230, protein=17.9, carbs=39.9, fat=0.8, sugar=3.6),
-    dict(name='banana, 1 medium', aliases=('banana',), calories=105, protein=1.3, carbs=27.0, fat=0.4, sugar=14.4),
-    dict(name='apple, 1 medium', aliases=('apple',), calories=95, protein=0.5, carbs=25.1, fat=0.3, sugar=18.9),
-    dict(name='whole milk, 1 cup', aliases=('milk', 'whole milk'), calories=149, protein=7.7, carbs=11.7, fat=7.9, sugar=12.3),
-    dict(name='plain greek yogurt, 170 g', aliases=('greek yogurt', 'yogurt', 'curd'), calories=100, protein=17.3, carbs=6.1, fat=0.7, sugar=5.7),
-    dict(name='whey protein shake, 1 scoop', aliases=('protein shake', 'whey', 'shake'), calories=120, protein=24.0, carbs=3.0, fat=1.5, sugar=1.0),
-    dict(name='brewed coffee, 12 oz', aliases=('coffee', 'black coffee'), calories=5, protein=0.3, carbs=0.0, fat=0.0, sugar=0.0),
-    dict(name='latte with whole milk, 16 oz', aliases=('latte', 'cold coffee', 'iced coffee'), calories=190, protein=10.0, carbs=18.0, fat=9.0, sugar=17.0),
-    dict(name='smoothie, fruit and yogurt, 16 oz', aliases=('smoothie',), calories=300, protein=10.0, carbs=55.0, fat=4.0, sugar=40.0),
-    dict(name='tonkotsu ramen bowl', aliases=('tonkotsu', 'ramen', 'tonkotsu ramen'), calories=650, protein=28.0, carbs=70.0, fat=28.0, sugar=5.0),
-    dict(name='burrito bowl with rice and chicken', aliases=('burrito bowl', 'chipotle bowl'), calories=700, protein=42.0, carbs=78.0, fat=24.0, sugar=6.0),
-]
-
 def _macro_reference_context(prompt='', limit=8):
-    terms = set(re.findall(r'[a-z][a-z0-9]+', (prompt or '').lower()))
-    scored = []
-    for item in MACRO_REFERENCE:
-        aliases = set(item['aliases']) | {item['name'].lower()}
-        score = 0
-        for alias in aliases:
-            alias_terms = set(re.findall(r'[a-z][a-z0-9]+', alias))
-            if alias in (prompt or '').lower():
-                score += 4
-            score += len(terms & alias_terms)
-        if score:
-            scored.append((score, item))
-    if not scored:
-        scored = [(1, item) for item in MACRO_REFERENCE[:limit]]
-    scored.sort(key=lambda pair: (-pair[0], pair[1]['name']))
-    return [
-        {key: value for key, value in item.items() if key != 'aliases'}
-        for _, item in scored[:limit]
-    ]
+    return get_food_index().reference_context(prompt, limit)
 
 def _scaled_macro(item, multiplier):
     return dict(
@@ -260,13 +343,8 @@ def _fallback_food_plan_from_reference(prompt):
     elif any(word in lower for word in ('small', 'smaller', 'half')):
         portion_multiplier = 0.75
 
-    for item in MACRO_REFERENCE:
-        matched_alias = None
-        for alias in sorted(item['aliases'], key=len, reverse=True):
-            if re.search(rf'\b{re.escape(alias)}\b', lower):
-                matched_alias = alias
-                break
-        if not matched_alias or item['name'] in used_names:
+    for item, matched_alias in get_food_index().match_aliases(lower):
+        if item['name'] in used_names:
             continue
 
         multiplier = portion_multiplier
@@ -290,8 +368,30 @@ def _fallback_food_plan_from_reference(prompt):
         'operations': operations[:4],
     }
 
+def _local_food_plan(text, selected):
+    if not meal_parser.enabled():
+        return None
+    routine = _routine_food_context(current_user.id, selected).get('common_foods', [])
+    parsed = meal_parser.parse_meal(text, routine)
+    if not parsed['items'] or parsed['confidence'] < meal_parser.min_confidence():
+        return None
+    tool_calls = []
+    labels = []
+    for item in parsed['items'][:4]:
+        # The macros are already scaled; the name stays the reference one so
+        # every portion of a food shares one FoodProfile row.
+        args = {field: item[field] for field in ('name', 'calories', 'protein', 'carbs', 'fat', 'sugar')}
+        tool_calls.append({'tool': 'create_food', 'args': args})
+        multiplier = item['multiplier']
+        labels.append(item['name'] if multiplier == 1 else f"{item['name']} (x{multiplier:g})")
+    names = ', '.join(labels[:3])
+    return {
+        'reply': f"Logged {names}. Adjust it if the portion was different.",
+        'tool_calls': tool_calls,
+    }
+
 def _local_contextual_reply(selected):
-    totals = get_daily_totals(current_user.id, selected)
+    totals = _turn_totals(current_user.id, selected)
     goals = get_user_goals(current_user)
     missing = []
     for label, total_key, goal_key, unit in (
@@ -347,6 +447,7 @@ def _restore_last_food_undo():
             fat=float(fat),
             sugar=float(sugar),
         ))
+        invalidate_turn(*FOOD_READS)
         return f"Restored {name}."
     if entry and entry.user_id == current_user.id:
         entry.name = name
@@ -355,11 +456,15 @@ def _restore_last_food_undo():
         entry.carbs = float(carbs)
         entry.fat = float(fat)
         entry.sugar = float(sugar)
+        invalidate_turn(*FOOD_READS)
         return f"Undid the last change to {name}."
     return None
 
-def _food_context(selected):
-    entries = FoodEntry.query.filter_by(user_id=current_user.id, date=selected).order_by(FoodEntry.id).all()
+def _food_context(user_id, selected):
+    return memoized(('foods', user_id, selected), lambda: _load_food_context(user_id, selected))
+
+def _load_food_context(user_id, selected):
+    entries = FoodEntry.query.filter_by(user_id=user_id, date=selected).order_by(FoodEntry.id).all()
     return [
         dict(
             id=e.id,
@@ -373,47 +478,20 @@ def _food_context(selected):
         for e in entries
     ]
 
+@read_only
 def _routine_food_context(user_id, selected):
+    return memoized(('routine_foods', user_id, selected), lambda: _load_routine_food_context(user_id, selected))
+
+def _load_routine_food_context(user_id, selected):
     start = selected - timedelta(days=30)
     entries = (FoodEntry.query.filter(
         FoodEntry.user_id == user_id,
         FoodEntry.date >= start,
         FoodEntry.date <= selected,
-    ).order_by(FoodEntry.date.desc(), FoodEntry.id.desc()).limit(80).all())
-
-    grouped = {}
-    for entry in entries:
-        key = entry.name.strip().lower()
-        item = grouped.setdefault(key, dict(
-            name=entry.name,
-            count=0,
-            calories=0.0,
-            protein=0.0,
-            carbs=0.0,
-            fat=0.0,
-            sugar=0.0,
-        ))
-        item['count'] += 1
-        item['calories'] += entry.calories
-        item['protein'] += entry.protein
-        item['carbs'] += entry.carbs
-        item['fat'] += entry.fat
-        item['sugar'] += entry.sugar
-
-    common = sorted(grouped.values(), key=lambda item: (-item['count'], item['name']))[:12]
-    for item in common:
-        count = item.pop('count')
-        item['times_logged'] = count
-        item['average'] = dict(
-            calories=round(item.pop('calories') / count, 1),
-            protein=round(item.pop('protein') / count, 1),
-            carbs=round(item.pop('carbs') / count, 1),
-            fat=round(item.pop('fat') / count, 1),
-            sugar=round(item.pop('sugar') / count, 1),
-        )
+    ).order_by(FoodEntry.date.desc(), FoodEntry.id.desc()).limit(20).all())
 
     return dict(
-        common_foods=common,
+        common_foods=top_foods(user_id, 12, today=selected),
         recent_foods=[
             dict(
                 date=e.date.isoformat(),
@@ -424,11 +502,15 @@ def _routine_food_context(user_id, selected):
                 fat=e.fat,
                 sugar=e.sugar,
             )
-            for e in entries[:20]
+            for e in entries
         ],
     )
 
+@read_only
 def _recent_chat_context(user_id, limit=12):
+    return memoized(('chat', user_id, limit), lambda: _load_recent_chat_context(user_id, limit))
+
+def _load_recent_chat_context(user_id, limit):
     messages = (ChatMessage.query.filter_by(user_id=user_id)
                 .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
                 .limit(limit).all())
@@ -448,26 +530,32 @@ def _looks_like_food_or_correction(prompt):
     )
     return any(re.search(rf'\b{re.escape(word)}\b', prompt) for word in keywords)
 
-def _planner_context(selected, prompt=''):
-    recent_actions = (AgentActionLog.query.filter_by(user_id=current_user.id, agent='nibbly')
-                      .order_by(AgentActionLog.created_at.desc(), AgentActionLog.id.desc())
-                      .limit(10).all())
+def _turn_totals(user_id, selected):
+    return memoized(('totals', user_id, selected), lambda: get_daily_totals(user_id, selected))
+
+def _recent_agent_actions(user_id):
+    return memoized(('agent_actions', user_id), lambda: [
+        dict(tool=a.tool, status=a.status, result=a.result)
+        for a in (AgentActionLog.query.filter_by(user_id=user_id, agent='nibbly')
+                  .order_by(AgentActionLog.created_at.desc(), AgentActionLog.id.desc())
+                  .limit(10).all())
+    ])
+
+@read_only
+def _planner_context(user, selected, prompt=''):
     return dict(
         date=selected.isoformat(),
         date_label='today' if selected == date.today() else selected.strftime('%b %d, %Y'),
-        user=dict(id=current_user.id, name=current_user.profile_name or current_user.username),
-        goals=get_user_goals(current_user),
-        today_totals=get_daily_totals(current_user.id, selected),
-        today_foods=_food_context(selected),
-        routine_foods=_routine_food_context(current_user.id, selected),
-        recent_chat=_recent_chat_context(current_user.id),
+        user=dict(id=user.id, name=user.profile_name or user.username),
+        goals=get_user_goals(user),
+        today_totals=_turn_totals(user.id, selected),
+        today_foods=_food_context(user.id, selected),
+        routine_foods=_routine_food_context(user.id, selected),
+        recent_chat=_recent_chat_context(user.id),
         macro_reference=_macro_reference_context(prompt),
-        memories=_memory_map(current_user.id),
+        memories=_memory_map(user.id),
         allowed_tools=sorted(AGENT_TOOLS.keys()) if 'AGENT_TOOLS' in globals() else [],
-        recent_agent_actions=[
-            dict(tool=a.tool, status=a.status, result=a.result)
-            for a in recent_actions
-        ],
+        recent_agent_actions=_recent_agent_actions(user.id),
     )
 
 def _planner_instructions():
@@ -504,39 +592,95 @@ def _gemini_output_text(payload):
                 parts.append(part['text'])
     return ''.join(parts)
 
-def _ask_gemini_food_planner(prompt, selected):
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if not api_key:
-        return None, 'missing_key'
+DEFAULT_GEMINI_MODEL = 'gemini-2.5-flash'
+DEFAULT_OPENAI_MODEL = 'gpt-4.1-mini'
+
+def _gemini_model():
+    return os.environ.get('GEMINI_MODEL', DEFAULT_GEMINI_MODEL)
+
+def _openai_model():
+    return os.environ.get('OPENAI_MODEL', DEFAULT_OPENAI_MODEL)
 
-    model = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
-    body = {
+def _gemini_body(instructions, payload, temperature):
+    return {
         'contents': [{
             'role': 'user',
-            'parts': [{
-                'text': (
-                    f"{_planner_instructions()}\n\n"
-                    f"Input JSON:\n{json.dumps({'context': _planner_context(selected, prompt), 'message': prompt})}"
-                )
-            }],
+            'parts': [{'text': f"{instructions}\n\nInput JSON:\n{json.dumps(payload)}"}],
         }],
         'generationConfig': {
-            'temperature': 0.2,
+            'temperature': temperature,
             'responseMimeType': 'application/json',
         },
     }
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}'
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(body).encode('utf-8'),
-        headers={'Content-Type': 'application/json'},
-        method='POST',
+
+def _gemini_json(instructions, payload, temperature, timeout, background=False):
+    model = _gemini_model()
+    count_llm_call()
+    response = llm_client().post_json(
+        gemini_url(model, os.environ['GEMINI_API_KEY']), _gemini_body(instructions, payload, temperature),
+        timeout=timeout, background=background,
+    )
+    return json.loads(_clean_json_text(_gemini_output_text(response)))
+
+REPLY_FIELD = re.compile(r'"reply"\s*:\s*"')
+
+def _partial_reply(text):
+    # The "reply" string of a JSON object that is still arriving, decoded as far
+    # as it goes; an escape cut off mid-way waits for the next chunk.
+    found = REPLY_FIELD.search(text)
+    if not found:
+        return ''
+    raw = []
+    i = found.end()
+    while i < len(text) and text[i] != '"':
+        step = 1
+        if text[i] == '\\':
+            step = 6 if text[i + 1:i + 2] == 'u' else 2
+            if i + step > len(text):
+                break
+        raw.append(text[i:i + step])
+        i += step
+    try:
+        reply = json.loads('"' + ''.join(raw) + '"')
+    except ValueError:
+        return ''
+    if reply and '\ud800' <= reply[-1] <= '\udbff':
+        reply = reply[:-1]
+    return reply
+
+def _stream_reply(events, text_of):
+    # Yields ('token', text) as the reply field streams in, then returns the parsed object.
+    text = ''
+    sent = ''
+    for event in events:
+        text += text_of(event)
+        reply = _partial_reply(text)
+        if len(reply) > len(sent) and reply.startswith(sent):
+            yield 'token', dict(text=reply[len(sent):])
+            sent = reply
+    return json.loads(_clean_json_text(text))
+
+def _gemini_json_stream(instructions, payload, temperature, timeout):
+    model = _gemini_model()
+    count_llm_call()
+    events = llm_client().stream_events(
+        gemini_url(model, os.environ['GEMINI_API_KEY'], method='streamGenerateContent', query='&alt=sse'),
+        _gemini_body(instructions, payload, temperature), timeout=timeout,
+    )
+    return (yield from _stream_reply(events, _gemini_output_text))
+
+def _ask_gemini_food_planner(prompt, selected, stream=False):
+    if not os.environ.get('GEMINI_API_KEY'):
+        return None, 'missing_key'
+    request_args = (
+        _planner_instructions(),
+        {'context': _planner_context(current_user, selected, prompt), 'message': prompt},
+        0.2, 12,
     )
     try:
-        with urllib.request.urlopen(req, timeout=12) as res:
-            payload = json.loads(res.read().decode('utf-8'))
-        return json.loads(_clean_json_text(_gemini_output_text(payload))), None
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError) as exc:
+        plan = (yield from _gemini_json_stream(*request_args)) if stream else _gemini_json(*request_args)
+        return plan, None
+    except (LLMError, json.JSONDecodeError, ValueError) as exc:
         return {'reply': f"I couldn't reach Gemini right now: {exc}", 'operations': [{'type': 'ask'}]}, 'ai_error'
 
 def _openai_output_text(payload):
@@ -549,41 +693,69 @@ def _openai_output_text(payload):
                 parts.append(content['text'])
     return ''.join(parts)
 
-def _ask_ai_food_planner(prompt, selected):
+def _configured_providers():
+    providers = []
     if os.environ.get('GEMINI_API_KEY'):
-        return _ask_gemini_food_planner(prompt, selected)
+        providers.append(('gemini', _gemini_model()))
+    if os.environ.get('OPENAI_API_KEY'):
+        providers.append(('openai', _openai_model()))
+    return providers
 
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if not api_key:
-        return None, 'missing_key'
-    model = os.environ.get('OPENAI_MODEL', 'gpt-4.1-mini')
-    body = {
-        'model': model,
+def _openai_body(instructions, content, temperature):
+    return {
+        'model': _openai_model(),
         'input': [
-            {'role': 'system', 'content': _planner_instructions()},
-            {'role': 'user', 'content': json.dumps({'context': _planner_context(selected, prompt), 'message': prompt})},
+            {'role': 'system', 'content': instructions},
+            {'role': 'user', 'content': json.dumps(content)},
         ],
-        'temperature': 0.2,
+        'temperature': temperature,
     }
-    req = urllib.request.Request(
-        'https://api.openai.com/v1/responses',
-        data=json.dumps(body).encode('utf-8'),
-        headers={
-            'Authorization': f'Bearer {api_key}',
-            'Content-Type': 'application/json',
-        },
-        method='POST',
+
+def _openai_json(instructions, content, temperature, timeout):
+    count_llm_call()
+    response = llm_client().post_json(
+        openai_url(), _openai_body(instructions, content, temperature),
+        headers={'Authorization': f"Bearer {os.environ['OPENAI_API_KEY']}"},
+        timeout=timeout,
+    )
+    return json.loads(_clean_json_text(_openai_output_text(response)))
+
+def _openai_stream_text(event):
+    if event.get('type') == 'response.output_text.delta':
+        return event.get('delta') or ''
+    if event.get('type') in ('error', 'response.failed'):
+        raise LLMError(f"OpenAI stream failed: {event.get('message') or event.get('type')}")
+    return ''
+
+def _openai_json_stream(instructions, content, temperature, timeout):
+    count_llm_call()
+    events = llm_client().stream_events(
+        openai_url(), dict(_openai_body(instructions, content, temperature), stream=True),
+        headers={'Authorization': f"Bearer {os.environ['OPENAI_API_KEY']}"},
+        timeout=timeout,
+    )
+    return (yield from _stream_reply(events, _openai_stream_text))
+
+def _ask_ai_food_planner(prompt, selected, stream=False):
+    if os.environ.get('GEMINI_API_KEY'):
+        return (yield from _ask_gemini_food_planner(prompt, selected, stream))
+
+    if not os.environ.get('OPENAI_API_KEY'):
+        return None, 'missing_key'
+    request_args = (
+        _planner_instructions(),
+        {'context': _planner_context(current_user, selected, prompt), 'message': prompt},
+        0.2, 12,
     )
     try:
-        with urllib.request.urlopen(req, timeout=12) as res:
-            payload = json.loads(res.read().decode('utf-8'))
-        return json.loads(_clean_json_text(_openai_output_text(payload))), None
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError) as exc:
+        plan = (yield from _openai_json_stream(*request_args)) if stream else _openai_json(*request_args)
+        return plan, None
+    except (LLMError, json.JSONDecodeError, ValueError) as exc:
         return {'reply': f"I couldn't reach the AI planner right now: {exc}", 'operations': [{'type': 'ask'}]}, 'ai_error'
 
-def _fallback_suggestions(selected):
-    today_foods = _food_context(selected)
-    routine = _routine_food_context(current_user.id, selected)
+def _fallback_suggestions(user, selected):
+    today_foods = _food_context(user.id, selected)
+    routine = _routine_food_context(user.id, selected)
     suggestions = []
     if today_foods:
         latest = today_foods[-1]['name']
@@ -593,16 +765,15 @@ def _fallback_suggestions(selected):
         ])
     for food in routine.get('common_foods', [])[:3]:
         suggestions.append(f"Log {food['name']}")
-    totals = get_daily_totals(current_user.id, selected)
-    goals = get_user_goals(current_user)
+    totals = _turn_totals(user.id, selected)
+    goals = get_user_goals(user)
     if totals.get('water', 0) < goals.get('water_goal', 0):
         suggestions.append("Log water")
     return list(dict.fromkeys(suggestions))[:5]
 
-def _ask_ai_suggestions(selected):
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if not api_key:
-        return _fallback_suggestions(selected)
+def _ask_ai_suggestions(user, selected, background=False):
+    if not os.environ.get('GEMINI_API_KEY'):
+        return None
 
     instructions = (
         "Create 4 short, useful chat suggestion chips for a nutrition logging assistant. "
@@ -612,42 +783,78 @@ def _ask_ai_suggestions(selected):
         "Prefer concrete examples such as logging a recent food, correcting a portion, removing an item, or adding water. "
         "Return only JSON: {\"suggestions\":[\"...\"]}. Keep each suggestion under 42 characters."
     )
-    model = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
-    body = {
-        'contents': [{
-            'role': 'user',
-            'parts': [{
-                'text': f"{instructions}\n\nInput JSON:\n{json.dumps(_planner_context(selected))}"
-            }],
-        }],
-        'generationConfig': {
-            'temperature': 0.35,
-            'responseMimeType': 'application/json',
-        },
-    }
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}'
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(body).encode('utf-8'),
-        headers={'Content-Type': 'application/json'},
-        method='POST',
-    )
     try:
-        with urllib.request.urlopen(req, timeout=8) as res:
-            payload = json.loads(res.read().decode('utf-8'))
-        result = json.loads(_clean_json_text(_gemini_output_text(payload)))
+        result = _gemini_json(instructions, _planner_context(user, selected), temperature=0.35, timeout=8,
+                              background=background)
         suggestions = result.get('suggestions') if isinstance(result, dict) else None
         if isinstance(suggestions, list):
             cleaned = [str(item).strip()[:60] for item in suggestions if str(item).strip()]
             if cleaned:
                 return cleaned[:5]
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError):
-        return _fallback_suggestions(selected)
-    return _fallback_suggestions(selected)
+    except (LLMError, json.JSONDecodeError, ValueError):
+        return None
+    return None
 
-def _ask_ai_general_reply(prompt, selected):
-    api_key = os.environ.get('GEMINI_API_KEY')
-    if not api_key:
+SUGGESTION_TTL = 24 * 3600
+FALLBACK_SUGGESTION_TTL = 300
+
+def _suggestions_key(user_id, selected):
+    return f'suggestions:{user_id}:{selected.isoformat()}'
+
+def _precompute_suggestions():
+    return os.environ.get('SUGGESTIONS_PRECOMPUTE', '1') != '0'
+
+def _suggestions_debounce():
+    return float(os.environ.get('SUGGESTIONS_DEBOUNCE_SECONDS', 300))
+
+def _refresh_suggestions(user_id, selected):
+    user = db.session.get(User, user_id)
+    if user is None:
+        return
+    with shards.using_shard(user_id):
+        suggestions = _ask_ai_suggestions(user, selected, background=True)
+        ttl = SUGGESTION_TTL
+        if suggestions is None:
+            suggestions = _fallback_suggestions(user, selected)
+            if os.environ.get('GEMINI_API_KEY'):
+                ttl = FALLBACK_SUGGESTION_TTL
+    # Not scoped to the day's entries: after a write the previous chips keep
+    # being served until this refresh replaces them.
+    get_cache().set(_suggestions_key(user_id, selected), suggestions, f'suggestions:{user_id}', ttl=ttl)
+
+def _schedule_suggestions(user_id, selected):
+    if _precompute_suggestions():
+        # Every entry write and coach turn lands here; a burst of them is one
+        # provider call per interval, not one each.
+        submit_job(_suggestions_key(user_id, selected), _refresh_suggestions, user_id, selected,
+                   min_interval=_suggestions_debounce())
+
+def _cached_suggestions(selected):
+    if not _precompute_suggestions():
+        return _ask_ai_suggestions(current_user, selected) or _fallback_suggestions(current_user, selected)
+    cached = get_cache().get(_suggestions_key(current_user.id, selected))
+    if cached is not None:
+        return cached
+    _schedule_suggestions(current_user.id, selected)
+    return _fallback_suggestions(current_user, selected)
+
+@event.listens_for(db.session, 'after_flush')
+def _note_suggestion_days(session, flush_context):
+    days = changed_days(session)
+    if days:
+        session.info.setdefault('suggestion_days', set()).update(days)
+
+@event.listens_for(db.session, 'after_commit')
+def _refresh_changed_suggestions(session):
+    for user_id, day in session.info.pop('suggestion_days', ()):
+        _schedule_suggestions(user_id, day)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _forget_suggestion_days(session, previous_transaction):
+    session.info.pop('suggestion_days', None)
+
+def _ask_ai_general_reply(prompt, selected, stream=False):
+    if not os.environ.get('GEMINI_API_KEY'):
         return None
 
     instructions = (
@@ -658,30 +865,9 @@ def _ask_ai_general_reply(prompt, selected):
         "Do not claim medical certainty. Return only JSON: {\"reply\":\"...\",\"memories\":[{\"key\":\"...\",\"value\":\"...\"}]}. "
         "Keep replies short enough for a mobile chat bubble."
     )
-    model = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
-    body = {
-        'contents': [{
-            'role': 'user',
-            'parts': [{
-                'text': f"{instructions}\n\nInput JSON:\n{json.dumps({'context': _planner_context(selected, prompt), 'message': prompt})}"
-            }],
-        }],
-        'generationConfig': {
-            'temperature': 0.35,
-            'responseMimeType': 'application/json',
-        },
-    }
-    url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}'
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(body).encode('utf-8'),
-        headers={'Content-Type': 'application/json'},
-        method='POST',
-    )
+    request_args = (instructions, {'context': _planner_context(current_user, selected, prompt), 'message': prompt}, 0.35, 10)
     try:
-        with urllib.request.urlopen(req, timeout=10) as res:
-            payload = json.loads(res.read().decode('utf-8'))
-        result = json.loads(_clean_json_text(_gemini_output_text(payload)))
+        result = (yield from _gemini_json_stream(*request_args)) if stream else _gemini_json(*request_args)
         if not isinstance(result, dict) or not result.get('reply'):
             return None
         memories = result.get('memories') if isinstance(result.get('memories'), list) else []
@@ -689,10 +875,10 @@ def _ask_ai_general_reply(prompt, selected):
             if isinstance(memory, dict) and memory.get('key') and memory.get('value'):
                 _remember(current_user.id, str(memory['key'])[:80], str(memory['value'])[:500])
         return str(result['reply'])[:800]
-    except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError):
+    except (LLMError, json.JSONDecodeError, ValueError):
         return None
 
-def _fallback_dashboard_insights(totals, goals, metrics):
+def _fallback_dashboard_insights(totals, goals, health):
     def as_float(value):
         try:
             return float(value)
@@ -700,12 +886,12 @@ def _fallback_dashboard_insights(totals, goals, metrics):
             return None
 
     insights = []
-    bmi = as_float(metrics.get('bmi'))
-    bmi_status = metrics.get('bmi_status')
-    ideal_min = as_float(metrics.get('ideal_weight_min_kg'))
-    ideal_max = as_float(metrics.get('ideal_weight_max_kg'))
-    target_weight = as_float(metrics.get('ideal_weight_target_kg'))
-    weight_delta = as_float(metrics.get('weight_delta_to_target_kg'))
+    bmi = as_float(health.get('bmi'))
+    bmi_status = health.get('bmi_status')
+    ideal_min = as_float(health.get('ideal_weight_min_kg'))
+    ideal_max = as_float(health.get('ideal_weight_max_kg'))
+    target_weight = as_float(health.get('ideal_weight_target_kg'))
+    weight_delta = as_float(health.get('weight_delta_to_target_kg'))
 
     if bmi is not None:
         insights.append(
@@ -779,14 +965,14 @@ def _fallback_dashboard_insights(totals, goals, metrics):
 
     return list(dict.fromkeys(insights))[:10]
 
-def _ask_ai_dashboard_insights(selected, totals, goals, metrics):
-    fallback = _fallback_dashboard_insights(totals, goals, metrics)
+def _ask_ai_dashboard_insights(selected, totals, goals, health):
+    fallback = _fallback_dashboard_insights(totals, goals, health)
     context = dict(
         date=selected.isoformat(),
         user=dict(name=current_user.profile_name or current_user.username),
         totals=totals,
         goals=goals,
-        health_metrics=metrics,
+        health_metrics=health,
         routine_foods=_routine_food_context(current_user.id, selected),
         memories=_memory_map(current_user.id),
         fallback_examples=fallback,
@@ -801,60 +987,42 @@ def _ask_ai_dashboard_insights(selected, totals, goals, metrics):
         "Return only JSON: {\"insights\":[\"...\"]}."
     )
 
+    providers = _configured_providers()
+    if not providers:
+        return fallback
+
+    # Only provider answers are cached; the local fallback is cheap and should
+    # not hide a provider that has recovered.
+    cache = get_cache()
+    cache_key = f"insights:{current_user.id}:{selected.isoformat()}:{context_digest(instructions, context, providers)}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
     if os.environ.get('GEMINI_API_KEY'):
-        model = os.environ.get('GEMINI_MODEL', 'gemini-2.5-flash')
-        body = {
-            'contents': [{
-                'role': 'user',
-                'parts': [{'text': f"{instructions}\n\nInput JSON:\n{json.dumps(context)}"}],
-            }],
-            'generationConfig': {'temperature': 0.55, 'responseMimeType': 'application/json'},
-        }
-        url = f'https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={os.environ["GEMINI_API_KEY"]}'
-        req = urllib.request.Request(
-            url,
-            data=json.dumps(body).encode('utf-8'),
-            headers={'Content-Type': 'application/json'},
-            method='POST',
-        )
         try:
-            with urllib.request.urlopen(req, timeout=8) as res:
-                payload = json.loads(res.read().decode('utf-8'))
-            result = json.loads(_clean_json_text(_gemini_output_text(payload)))
+            result = _gemini_json(instructions, context, temperature=0.55, timeout=8)
             insights = result.get('insights') if isinstance(result, dict) else None
             if isinstance(insights, list):
                 cleaned = [str(item).strip()[:180] for item in insights if str(item).strip()]
                 if cleaned:
-                    return list(dict.fromkeys(cleaned))[:9]
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError):
+                    cleaned = list(dict.fromkeys(cleaned))[:9]
+                    cache.set(cache_key, cleaned, scope_for(current_user.id, selected))
+                    return cleaned
+        except (LLMError, json.JSONDecodeError, ValueError):
             pass
 
-    api_key = os.environ.get('OPENAI_API_KEY')
-    if api_key:
-        body = {
-            'model': os.environ.get('OPENAI_MODEL', 'gpt-4.1-mini'),
-            'input': [
-                {'role': 'system', 'content': instructions},
-                {'role': 'user', 'content': json.dumps(context)},
-            ],
-            'temperature': 0.55,
-        }
-        req = urllib.request.Request(
-            'https://api.openai.com/v1/responses',
-            data=json.dumps(body).encode('utf-8'),
-            headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
-            method='POST',
-        )
+    if os.environ.get('OPENAI_API_KEY'):
         try:
-            with urllib.request.urlopen(req, timeout=8) as res:
-                payload = json.loads(res.read().decode('utf-8'))
-            result = json.loads(_clean_json_text(_openai_output_text(payload)))
+            result = _openai_json(instructions, context, temperature=0.55, timeout=8)
             insights = result.get('insights') if isinstance(result, dict) else None
             if isinstance(insights, list):
                 cleaned = [str(item).strip()[:180] for item in insights if str(item).strip()]
                 if cleaned:
-                    return list(dict.fromkeys(cleaned))[:9]
-        except (urllib.error.URLError, urllib.error.HTTPError, TimeoutError, json.JSONDecodeError, ValueError):
+                    cleaned = list(dict.fromkeys(cleaned))[:9]
+                    cache.set(cache_key, cleaned, scope_for(current_user.id, selected))
+                    return cleaned
+        except (LLMError, json.JSONDecodeError, ValueError):
             pass
 
     return fallback
@@ -979,7 +1147,7 @@ def _tool_remember_user_fact(args, selected):
     return _agent_result(True, f"Remembered {key}.", type='memory', operation='upsert', key=key)
 
 def _tool_read_today_logs(args, selected):
-    return _agent_result(True, 'Read selected date logs.', type='read', logs=_food_context(selected), totals=get_daily_totals(current_user.id, selected))
+    return _agent_result(True, 'Read selected date logs.', type='read', logs=_food_context(current_user.id, selected), totals=_turn_totals(current_user.id, selected))
 
 def _tool_ask_clarification(args, selected):
     question = str(args.get('question') or 'I need a bit more detail.').strip()[:500]
@@ -1001,6 +1169,21 @@ AGENT_TOOLS = {
     'ask_clarification': _tool_ask_clarification,
 }
 
+# Memoized turn reads each tool can change; memories and agent actions are
+# kept current by _remember; agent actions are only written after the turn.
+FOOD_READS = ('foods', 'routine_foods', 'totals')
+TOOL_INVALIDATES = {
+    'create_food': FOOD_READS,
+    'update_food': FOOD_READS,
+    'delete_food': FOOD_READS,
+    'log_water': ('totals',),
+    'update_water': ('totals',),
+    'delete_latest_water': ('totals',),
+    'log_steps': ('totals',),
+    'update_steps': ('totals',),
+    'delete_latest_steps': ('totals',),
+}
+
 LEGACY_OPERATION_TO_TOOL = {
     'create_food': 'create_food',
     'update_food': 'update_food',
@@ -1040,7 +1223,8 @@ def _normalize_tool_calls(plan):
         normalized.append({'tool': tool, 'args': args})
     return normalized
 
-def _execute_agent_plan(plan, selected):
+def _run_agent_plan(plan, selected):
+    # Yields ('tool', ...) as each tool finishes; returns (reply, intent, action).
     tool_calls = _normalize_tool_calls(plan)
     if not tool_calls:
         return plan.get('reply', 'I need a clearer instruction.'), 'agent_ask', None
@@ -1056,8 +1240,11 @@ def _execute_agent_plan(plan, selected):
                 result = AGENT_TOOLS[tool](args, selected)
             except (KeyError, TypeError, ValueError):
                 result = _agent_result(False, f"{tool} received invalid input.")
+        if result.get('ok'):
+            invalidate_turn(*TOOL_INVALIDATES.get(tool, ()))
         _log_agent_tool(tool or 'unknown', args, result)
         results.append({'tool': tool, 'result': result})
+        yield 'tool', {'tool': tool, 'result': result}
 
     blocked = [item['result']['message'] for item in results if not item['result'].get('ok')]
     succeeded = [item for item in results if item['result'].get('ok')]
@@ -1071,22 +1258,29 @@ def _execute_agent_plan(plan, selected):
     }
     return reply, 'agent_plan', action
 
-def _learn_from_interaction(message, selected, intent, action):
-    _remember(current_user.id, 'last_coach_message', message[:500])
+@job_handler('coach_turn')
+def _record_coach_turn(user_id, message, intent, action, tool_logs, memories=None):
+    db.session.add_all(
+        AgentActionLog(user_id=user_id, agent='nibbly', **dict(log, created_at=datetime.fromisoformat(log['created_at'])))
+        for log in tool_logs
+    )
+    # Jobs queued before memories were part of the payload work them out here.
+    if memories is None:
+        memories = _learned_memories(user_id, message, intent, action)
+    for key, value in memories.items():
+        _remember(user_id, key, value)
 
-    routine = _routine_food_context(current_user.id, selected)
-    common = routine.get('common_foods', [])[:6]
-    if common:
-        _remember(current_user.id, 'common_foods_summary', json.dumps(common, separators=(',', ':'))[:1200])
+def _learned_memories(user_id, message, intent, action):
+    learned = {'last_coach_message': message[:500]}
 
     primary = action.get('primary') if action and action.get('type') == 'agent' else action
     if primary and primary.get('type') == 'food':
         food_id = primary.get('id')
         entry = FoodEntry.query.get(food_id) if food_id else None
         if not entry:
-            entry = _latest_entry(FoodEntry, current_user.id)
+            entry = _latest_entry(FoodEntry, user_id)
         if entry:
-            _remember(current_user.id, 'last_food_log', json.dumps(dict(
+            learned['last_food_log'] = json.dumps(dict(
                 name=entry.name,
                 calories=entry.calories,
                 protein=entry.protein,
@@ -1094,12 +1288,13 @@ def _learn_from_interaction(message, selected, intent, action):
                 fat=entry.fat,
                 sugar=entry.sugar,
                 operation=primary.get('operation'),
-            ), separators=(',', ':'))[:700])
+            ), separators=(',', ':'))[:700]
 
     if intent in ('log_water', 'update_water', 'delete_water'):
-        _remember(current_user.id, 'last_hydration_action', message[:300])
+        learned['last_hydration_action'] = message[:300]
     elif intent in ('log_steps', 'update_steps', 'delete_steps'):
-        _remember(current_user.id, 'last_steps_action', message[:300])
+        learned['last_steps_action'] = message[:300]
+    return learned
 
 def _apply_ai_food_plan(plan, selected):
     operations = plan.get('operations') if isinstance(plan, dict) else None
@@ -1156,10 +1351,13 @@ def _apply_ai_food_plan(plan, selected):
             action = {'type': 'memory'}
             changed = True
 
+    if changed:
+        invalidate_turn(*FOOD_READS)
     reply = plan.get('reply') or ('Updated your food log.' if changed else 'I need a bit more detail.')
     return reply, 'ai_food_plan', action
 
-def _assistant_reply(message, selected):
+def _assistant_turn(message, selected, stream=False):
+    # Yields progress events for streaming; returns (reply, intent, action).
     text = (message or '').strip()
     lower = text.lower()
     memories = _memory_map(current_user.id)
@@ -1176,22 +1374,28 @@ def _assistant_reply(message, selected):
             'reply': f"I'll remember that: {value}.",
             'tool_calls': [{'tool': 'remember_user_fact', 'args': {'key': 'preference', 'value': value}}],
         }
-        return _execute_agent_plan(plan, selected)
+        return (yield from _run_agent_plan(plan, selected))
+
+    # Plain meal logs are parsed here; the planner only sees what the parser is unsure of.
+    local_plan = _local_food_plan(text, selected)
+    if local_plan:
+        reply, intent, action = yield from _run_agent_plan(local_plan, selected)
+        return reply, 'local_food_plan', action
 
     if _looks_like_food_or_correction(lower):
-        plan, error = _ask_ai_food_planner(text, selected)
+        plan, error = yield from _ask_ai_food_planner(text, selected, stream)
         if error == 'ai_error':
             fallback_plan = _fallback_food_plan_from_reference(text)
             if fallback_plan:
-                reply, intent, action = _execute_agent_plan(fallback_plan, selected)
+                reply, intent, action = yield from _run_agent_plan(fallback_plan, selected)
                 return reply, 'reference_food_plan', action
         if plan:
-            reply, intent, action = _execute_agent_plan(plan, selected)
+            reply, intent, action = yield from _run_agent_plan(plan, selected)
             return reply, intent, action
         if error == 'missing_key':
             fallback_plan = _fallback_food_plan_from_reference(text)
             if fallback_plan:
-                reply, intent, action = _execute_agent_plan(fallback_plan, selected)
+                reply, intent, action = yield from _run_agent_plan(fallback_plan, selected)
                 return reply, 'reference_food_plan', action
             return (
                 "AI food understanding is not configured yet. Add GEMINI_API_KEY or OPENAI_API_KEY on the server, "
@@ -1209,47 +1413,68 @@ def _assistant_reply(message, selected):
         if liters is not None and amount is None:
             amount = liters * 1000
         if is_delete:
-            return _execute_agent_plan({
+            return (yield from _run_agent_plan({
                 'reply': None,
                 'tool_calls': [{'tool': 'delete_latest_water', 'args': {}}],
-            }, selected)
+            }, selected))
         if is_update:
             if amount:
-                return _execute_agent_plan({
+                return (yield from _run_agent_plan({
                     'reply': f"Updated your latest water entry to {int(amount)} ml.",
                     'tool_calls': [{'tool': 'update_water', 'args': {'amount_ml': int(amount)}}],
-                }, selected)
+                }, selected))
         if amount:
-            return _execute_agent_plan({
+            return (yield from _run_agent_plan({
                 'reply': f"Logged {int(amount)} ml of water.",
                 'tool_calls': [{'tool': 'log_water', 'args': {'amount_ml': int(amount)}}],
-            }, selected)
+            }, selected))
 
     if any(w in lower for w in ('steps', 'walked')):
         steps = _number_before(['steps'], lower)
         if is_delete:
-            return _execute_agent_plan({
+            return (yield from _run_agent_plan({
                 'reply': None,
                 'tool_calls': [{'tool': 'delete_latest_steps', 'args': {}}],
-            }, selected)
+            }, selected))
         if is_update:
             if steps:
-                return _execute_agent_plan({
+                return (yield from _run_agent_plan({
                     'reply': f"Updated your latest steps entry to {int(steps)} steps.",
                     'tool_calls': [{'tool': 'update_steps', 'args': {'steps': int(steps)}}],
-                }, selected)
+                }, selected))
         if steps:
-            return _execute_agent_plan({
+            return (yield from _run_agent_plan({
                 'reply': f"Logged {int(steps)} steps.",
                 'tool_calls': [{'tool': 'log_steps', 'args': {'steps': int(steps)}}],
-            }, selected)
+            }, selected))
 
-    ai_reply = _ask_ai_general_reply(text, selected)
+    ai_reply = yield from _ask_ai_general_reply(text, selected, stream)
     if ai_reply:
         return ai_reply, 'ai_chat', action
 
     return _local_contextual_reply(selected), intent, action
 
+def _drain(steps):
+    while True:
+        try:
+            next(steps)
+        except StopIteration as done:
+            return done.value
+
+def _assistant_reply(message, selected):
+    return _drain(_assistant_turn(message, selected))
+
+# Metrics
+
+@api_bp.route('/_metrics')
+def metrics_endpoint():
+    if not metrics.enabled():
+        return err('Not found', 404)
+    token = os.environ.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return err('Unauthorized', 401)
+    return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
 # Auth
 
 @api_bp.route('/auth/me')
@@ -1303,6 +1528,7 @@ def logout():
 
 @api_bp.route('/dashboard')
 @login_required
+@conditional(ENTRIES, USER)
 def dashboard():
     date_str = request.args.get('date', date.today().isoformat())
     try:
@@ -1311,7 +1537,7 @@ def dashboard():
         selected = date.today()
     totals = get_daily_totals(current_user.id, selected)
     goals = get_user_goals(current_user)
-    metrics = get_health_metrics(current_user, totals)
+    health = get_health_metrics(current_user, totals)
     last_weight = (WeightEntry.query.filter_by(user_id=current_user.id)
                    .order_by(WeightEntry.date.desc()).first())
     weight_kg = last_weight.weight_kg if last_weight else None
@@ -1322,8 +1548,8 @@ def dashboard():
                      .order_by(SleepEntry.date.desc()).limit(14).all())
     sleep_entries.reverse()
     return ok(
-        totals=totals, goals=goals, metrics=metrics,
-        insights=_fallback_dashboard_insights(totals, goals, metrics),
+        totals=totals, goals=goals, metrics=health,
+        insights=_fallback_dashboard_insights(totals, goals, health),
         weight_kg=weight_kg,
         weight_lbs=round(weight_kg * 2.20462, 1) if weight_kg else None,
         chart=dict(
@@ -1340,8 +1566,60 @@ def dashboard_insights():
     selected = _parse_query_date()
     totals = get_daily_totals(current_user.id, selected)
     goals = get_user_goals(current_user)
-    metrics = get_health_metrics(current_user, totals)
-    return ok(insights=_ask_ai_dashboard_insights(selected, totals, goals, metrics))
+    health = get_health_metrics(current_user, totals)
+    return ok(insights=_ask_ai_dashboard_insights(selected, totals, goals, health))
+
+HISTORY_BUCKETS = ('day', 'week', 'month')
+MAX_HISTORY_DAYS = 366 * 5
+
+@api_bp.route('/history')
+@login_required
+def history():
+    try:
+        end = datetime.strptime(request.args.get('end') or date.today().isoformat(), '%Y-%m-%d').date()
+        start = datetime.strptime(request.args.get('start') or (end - timedelta(days=6)).isoformat(), '%Y-%m-%d').date()
+    except ValueError:
+        return err('Dates must use YYYY-MM-DD')
+    if start > end:
+        return err('start must be on or before end')
+    if (end - start).days + 1 > MAX_HISTORY_DAYS:
+        return err(f'History ranges are limited to {MAX_HISTORY_DAYS} days')
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in HISTORY_BUCKETS:
+        return err(f"bucket must be one of: {', '.join(HISTORY_BUCKETS)}")
+    requested = [m.strip() for m in (request.args.get('metrics') or '').split(',') if m.strip()]
+    unknown = [m for m in requested if m not in TOTAL_METRICS]
+    if unknown:
+        return err(f"Unknown metrics: {', '.join(unknown)}")
+    series = tuple(dict.fromkeys(requested)) or TOTAL_METRICS
+
+    totals = get_range_totals(current_user.id, start, end, series)
+    periods, days = [], []
+    values = {metric: [] for metric in series}
+    zero = (0,) * len(series)
+    day = start
+    while day <= end:
+        period = history_period(day, bucket)
+        if not periods or periods[-1] != period:
+            periods.append(period)
+            days.append(0)
+            for metric in series:
+                values[metric].append(0)
+        days[-1] += 1
+        for metric, value in zip(series, totals.get(day, zero)):
+            values[metric][-1] += value or 0
+        day += timedelta(days=1)
+
+    payload = dict(
+        start=start.isoformat(),
+        end=end.isoformat(),
+        bucket=bucket,
+        periods=periods,
+        values={metric: [round(v, 1) for v in points] for metric, points in values.items()},
+    )
+    if bucket != 'day':
+        payload['days'] = days
+    return ok(payload)
 
 # Coach chat
 
@@ -1367,7 +1645,7 @@ def coach_history():
         greeting=greeting,
         memories=memories,
         ai_provider=ai_provider,
-        suggestions=_ask_ai_suggestions(selected),
+        suggestions=_cached_suggestions(selected),
         messages=[
             dict(id=m.id, role=m.role, content=m.content, intent=m.intent,
                  created_at=m.created_at.isoformat())
@@ -1375,23 +1653,31 @@ def coach_history():
         ],
     )
 
-@api_bp.route('/coach/message', methods=['POST'])
-@login_required
-def coach_message():
+def _coach_turn_input():
     payload = request.get_json() or {}
     message = (payload.get('message') or '').strip()
     selected = _resolve_message_date(message, _parse_selected_date(payload))
     future_error = _future_date_error(selected)
     if future_error:
-        return future_error
+        return None, None, future_error
     if not message:
-        return err('Message is required')
-
-    user_message = ChatMessage(user_id=current_user.id, role='user', content=message)
-    db.session.add(user_message)
-
-    reply, intent, action = _assistant_reply(message, selected)
-    _learn_from_interaction(message, selected, intent, action)
+        return None, None, err('Message is required')
+    return message, selected, None
+
+def _start_coach_turn(message):
+    db.session.add(ChatMessage(user_id=current_user.id, role='user', content=message))
+    invalidate_turn('chat')
+
+def _finish_coach_turn(message, selected, reply, intent, action):
+    meal_parser.record_path(intent, llm_calls())
+    # Action logs and learned memories are not needed for the reply; they
+    # commit with the turn as one outbox job and are written off the request.
+    # The response already includes what the turn learned.
+    learned = _learned_memories(current_user.id, message, intent, action)
+    enqueue_job('coach_turn', dict(
+        user_id=current_user.id, message=message, intent=intent, action=action,
+        tool_logs=g.pop('agent_tool_logs', []), memories=learned,
+    ))
     assistant_message = ChatMessage(
         user_id=current_user.id,
         role='assistant',
@@ -1400,8 +1686,9 @@ def coach_message():
     )
     db.session.add(assistant_message)
     db.session.commit()
+    _schedule_suggestions(current_user.id, selected)
 
-    return ok(
+    return dict(
         reply=dict(
             id=assistant_message.id,
             role='assistant',
@@ -1410,13 +1697,66 @@ def coach_message():
             created_at=assistant_message.created_at.isoformat(),
         ),
         action=action,
-        memories=_memory_map(current_user.id),
+        memories={**_memory_map(current_user.id), **learned},
     )
 
+@api_bp.route('/coach/message', methods=['POST'])
+@login_required
+def coach_message():
+    message, selected, error = _coach_turn_input()
+    if error:
+        return error
+    _start_coach_turn(message)
+    reply, intent, action = _assistant_reply(message, selected)
+    return ok(**_finish_coach_turn(message, selected, reply, intent, action))
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+# Same turn as /coach/message, sent as server-sent events while it runs:
+# "start" at once, "token" pieces of the reply as the provider streams them,
+# "tool" as each agent tool finishes, then "done" with the body /coach/message
+# would return. Tokens are a preview; "done" carries the stored reply.
+@api_bp.route('/coach/message/stream', methods=['POST'])
+@login_required
+def coach_message_stream():
+    message, selected, error = _coach_turn_input()
+    if error:
+        return error
+
+    # The view's session is torn down once it returns, so the whole turn,
+    # including the user's message, runs inside the generator.
+    @stream_with_context
+    def events():
+        yield _sse('start', dict(date=selected.isoformat()))
+        try:
+            _start_coach_turn(message)
+            turn = _assistant_turn(message, selected, stream=True)
+            while True:
+                try:
+                    event, data = next(turn)
+                except StopIteration as done:
+                    reply, intent, action = done.value
+                    break
+                yield _sse(event, data)
+            result = _finish_coach_turn(message, selected, reply, intent, action)
+        except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Streamed coach turn failed')
+            yield _sse('error', dict(error='Nibbly could not finish that message.'))
+            return
+        yield _sse('done', result)
+
+    return Response(events(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+    })
+
 # Entries
 
 @api_bp.route('/entries')
 @login_required
+@conditional(ENTRIES)
 def get_entries():
     date_str = request.args.get('date', date.today().isoformat())
     try:
@@ -1448,161 +1788,104 @@ def get_entries():
                                                    .order_by(CaloriesBurntEntry.id.desc()).all()],
     ))
 
+def _entry_payload():
+    d = request.get_json(silent=True)
+    if not isinstance(d, dict):
+        raise EntryError('Send the entry as a JSON object')
+    return d
+
+def _create_entry(entry_type):
+    try:
+        values = entry_values(entry_type, _entry_payload())
+    except EntryError as exc:
+        return err(str(exc))
+    entry = ENTRY_MODELS[entry_type](user_id=current_user.id, **values)
+    db.session.add(entry); db.session.commit()
+    return ok(id=entry.id), 201
+
 @api_bp.route('/entries/food', methods=['POST'])
 @login_required
 def add_food():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    time_val = None
-    if d.get('time'):
-        try: time_val = datetime.strptime(d['time'], '%H:%M').time()
-        except ValueError: pass
-    entry = FoodEntry(user_id=current_user.id, date=selected, name=d['name'],
-                      calories=float(d['calories']), time=time_val,
-                      protein=float(d.get('protein') or 0), carbs=float(d.get('carbs') or 0),
-                      fat=float(d.get('fat') or 0), sugar=float(d.get('sugar') or 0))
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('food')
 
 @api_bp.route('/entries/water', methods=['POST'])
 @login_required
 def add_water():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    entry = WaterEntry(user_id=current_user.id, date=selected, amount_ml=int(d['amount_ml']))
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('water')
 
 @api_bp.route('/entries/weight', methods=['POST'])
 @login_required
 def add_weight():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    weight = float(d['weight_kg'])
-    if d.get('unit') == 'lbs': weight *= 0.453592
-    entry = WeightEntry(user_id=current_user.id, date=selected, weight_kg=weight)
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('weight')
 
 @api_bp.route('/entries/steps', methods=['POST'])
 @login_required
 def add_steps():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    entry = StepEntry(user_id=current_user.id, date=selected, steps=int(d['steps']))
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('steps')
 
 @api_bp.route('/entries/sleep', methods=['POST'])
 @login_required
 def add_sleep():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    sleep_time = datetime.strptime(d['sleep_time'], '%H:%M').time()
-    wake_time = datetime.strptime(d['wake_time'], '%H:%M').time()
-    start = datetime.combine(selected, sleep_time)
-    end = datetime.combine(selected, wake_time)
-    if end <= start: end += timedelta(days=1)
-    duration = (end - start).total_seconds() / 3600
-    entry = SleepEntry(user_id=current_user.id, date=selected, duration_hours=duration,
-                       sleep_time=sleep_time, wake_time=wake_time)
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('sleep')
 
 @api_bp.route('/entries/calories_burnt', methods=['POST'])
 @login_required
 def add_calories_burnt():
-    d = request.get_json()
-    selected = datetime.strptime(d.get('date', date.today().isoformat()), '%Y-%m-%d').date()
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    entry = CaloriesBurntEntry(user_id=current_user.id, date=selected,
-                               calories_burnt=int(d['calories_burnt']))
-    db.session.add(entry); db.session.commit()
-    return ok(id=entry.id), 201
+    return _create_entry('calories_burnt')
+
+BULK_FORMATS = {
+    'application/x-ndjson': 'ndjson', 'application/ndjson': 'ndjson', 'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+@api_bp.route('/entries/bulk', methods=['POST'])
+@login_required
+def bulk_import_entries():
+    if request.mimetype not in BULK_FORMATS:
+        return err('Send entries as application/x-ndjson or text/csv', 415)
+    result = bulk.import_rows(current_user.id, bulk.read_rows(request.stream, request.mimetype))
+    return ok(result)
+
+@api_bp.route('/entries/export')
+@login_required
+def export_entries():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in ('ndjson', 'csv'):
+        return err('format must be ndjson or csv')
+    try:
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start') else None
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else None
+    except ValueError:
+        return err('Dates must use YYYY-MM-DD')
+    rows = (bulk.export_csv if fmt == 'csv' else bulk.export_ndjson)(current_user.id, start, end)
+    return Response(
+        stream_with_context(rows),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename=fitit-entries.{fmt}'},
+    )
 
 @api_bp.route('/entries/<entry_type>/<int:entry_id>', methods=['PUT'])
 @login_required
 def update_entry(entry_type, entry_id):
-    d = request.get_json() or {}
-    model_map = dict(food=FoodEntry, water=WaterEntry, weight=WeightEntry,
-                     steps=StepEntry, sleep=SleepEntry, calories_burnt=CaloriesBurntEntry)
-    model = model_map.get(entry_type)
+    model = ENTRY_MODELS.get(entry_type)
     if not model:
         return err('Invalid entry type')
     entry = model.query.get_or_404(entry_id)
     if entry.user_id != current_user.id:
         return err('Unauthorized', 403)
-
-    selected = _parse_selected_date(d)
-    future_error = _future_date_error(selected)
-    if future_error:
-        return future_error
-    entry.date = selected
-
     try:
-        if entry_type == 'food':
-            time_val = None
-            if d.get('time'):
-                time_val = datetime.strptime(d['time'], '%H:%M').time()
-            entry.name = (d.get('name') or '').strip()
-            if not entry.name:
-                return err('Food name is required')
-            entry.calories = float(d.get('calories') or 0)
-            entry.protein = float(d.get('protein') or 0)
-            entry.carbs = float(d.get('carbs') or 0)
-            entry.fat = float(d.get('fat') or 0)
-            entry.sugar = float(d.get('sugar') or 0)
-            entry.time = time_val
-        elif entry_type == 'water':
-            entry.amount_ml = int(d['amount_ml'])
-        elif entry_type == 'weight':
-            weight = float(d['weight_kg'])
-            if d.get('unit') == 'lbs':
-                weight *= 0.453592
-            entry.weight_kg = weight
-        elif entry_type == 'steps':
-            entry.steps = int(d['steps'])
-        elif entry_type == 'sleep':
-            sleep_time = datetime.strptime(d['sleep_time'], '%H:%M').time()
-            wake_time = datetime.strptime(d['wake_time'], '%H:%M').time()
-            start = datetime.combine(selected, sleep_time)
-            end = datetime.combine(selected, wake_time)
-            if end <= start:
-                end += timedelta(days=1)
-            entry.sleep_time = sleep_time
-            entry.wake_time = wake_time
-            entry.duration_hours = (end - start).total_seconds() / 3600
-        elif entry_type == 'calories_burnt':
-            entry.calories_burnt = int(d['calories_burnt'])
-    except (KeyError, TypeError, ValueError):
-        return err('Invalid entry data')
-
+        values = entry_values(entry_type, _entry_payload())
+    except EntryError as exc:
+        return err(str(exc))
+    for field, value in values.items():
+        setattr(entry, field, value)
     db.session.commit()
     return ok(message='Updated')
 
 @api_bp.route('/entries/<entry_type>/<int:entry_id>', methods=['DELETE'])
 @login_required
 def delete_entry(entry_type, entry_id):
-    model_map = dict(food=FoodEntry, water=WaterEntry, weight=WeightEntry,
-                     steps=StepEntry, sleep=SleepEntry, calories_burnt=CaloriesBurntEntry)
-    model = model_map.get(entry_type)
+    model = ENTRY_MODELS.get(entry_type)
     if not model: return err('Invalid entry type')
     entry = model.query.get_or_404(entry_id)
     if entry.user_id != current_user.id: return err('Unauthorized', 403)
@@ -1613,6 +1896,7 @@ def delete_entry(entry_type, entry_id):
 
 @api_bp.route('/goals', methods=['GET'])
 @login_required
+@conditional(USER)
 def get_goals():
     return ok(get_user_goals(current_user))
 
@@ -1630,17 +1914,19 @@ def update_goals():
 
 @api_bp.route('/friends')
 @login_required
+@conditional(FRIENDS)
 def friends_index():
-    _ensure_friend_privacy(current_user.id)
-    friendships = Friendship.query.filter(
-        or_(Friendship.requester_id == current_user.id, Friendship.receiver_id == current_user.id),
-        Friendship.status.in_(('pending', 'accepted')),
-    ).order_by(Friendship.updated_at.desc(), Friendship.id.desc()).all()
+    privacy = _ensure_friend_privacy(current_user.id)
+    try:
+        friendships, next_after = _paginate_friendships(_friendships_query(current_user.id, ('pending', 'accepted')))
+    except ValueError as exc:
+        return err(str(exc))
     return ok(
         friends=[_serialize_friendship(f) for f in friendships if f.status == 'accepted'],
         incoming=[_serialize_friendship(f) for f in friendships if f.status == 'pending' and f.receiver_id == current_user.id],
         outgoing=[_serialize_friendship(f) for f in friendships if f.status == 'pending' and f.requester_id == current_user.id],
-        privacy=_serialize_friend_privacy(_ensure_friend_privacy(current_user.id)),
+        privacy=_serialize_friend_privacy(privacy),
+        next_after=next_after,
     )
 
 @api_bp.route('/friends/search')
@@ -1649,17 +1935,23 @@ def friends_search():
     query = (request.args.get('q') or '').strip()
     if len(query) < 2:
         return ok(results=[])
-    users = (User.query.filter(
-        User.id != current_user.id,
-        or_(
-            User.username.ilike(f'%{query}%'),
-            User.profile_name.ilike(f'%{query}%'),
-            User.email.ilike(f'%{query}%'),
-        )
-    ).order_by(User.username.asc()).limit(12).all())
+    user_ids = search_user_ids(query, exclude_user_id=current_user.id)
+    if not user_ids:
+        return ok(results=[])
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+    friendships = {}
+    for friendship in Friendship.query.filter(or_(
+        and_(Friendship.requester_id == current_user.id, Friendship.receiver_id.in_(user_ids)),
+        and_(Friendship.receiver_id == current_user.id, Friendship.requester_id.in_(user_ids)),
+    )).all():
+        other_id = friendship.receiver_id if friendship.requester_id == current_user.id else friendship.requester_id
+        friendships[other_id] = friendship
     results = []
-    for user in users:
-        friendship = _friendship_between(current_user.id, user.id)
+    for user_id in user_ids:
+        user = users.get(user_id)
+        if not user:
+            continue
+        friendship = friendships.get(user_id)
         relation = None
         if friendship and friendship.status != 'declined':
             relation = dict(
@@ -1728,17 +2020,25 @@ def remove_friendship(friendship_id):
 @login_required
 def friends_activity():
     selected = _parse_query_date()
-    friendships = _accepted_friendships(current_user.id)
+    try:
+        friendships, next_after = _paginate_friendships(_friendships_query(current_user.id, ('accepted',)))
+    except ValueError as exc:
+        return err(str(exc))
+    pairs = [
+        (friendship, friendship.receiver if friendship.requester_id == current_user.id else friendship.requester)
+        for friendship in friendships
+    ]
+    summaries = _friend_metric_summaries([current_user] + [friend for _, friend in pairs], selected)
     friends = []
-    for friendship in friendships:
-        friend = friendship.receiver if friendship.requester_id == current_user.id else friendship.requester
-        summary = _friend_metric_summary(friend, selected)
+    for friendship, friend in pairs:
+        summary = dict(summaries[friend.id])
         summary['friendship_id'] = friendship.id
         friends.append(summary)
-    return ok(date=selected.isoformat(), mine=_friend_metric_summary(current_user, selected), friends=friends)
+    return ok(date=selected.isoformat(), mine=summaries[current_user.id], friends=friends, next_after=next_after)
 
 @api_bp.route('/privacy/friends', methods=['GET'])
 @login_required
+@conditional(FRIENDS)
 def get_friend_privacy():
     return ok(_serialize_friend_privacy(_ensure_friend_privacy(current_user.id)))
 
@@ -1761,6 +2061,7 @@ def update_friend_privacy():
 
 @api_bp.route('/profile', methods=['GET'])
 @login_required
+@conditional(USER)
 def get_profile():
     u = current_user
     return ok(username=u.username, profile_name=u.profile_name, email=u.email,
@@ -0,0 +1,100 @@
+import os
+import time
+from functools import wraps
+from flask import g, has_request_context, request, session as cookie_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from . import shards
+
+# With READ_DATABASE_URL set, plain SELECTs from GET requests and from
+# functions marked @read_only go to the "replica" bind. Everything else,
+# including flushes, session.connection() and locking reads, goes to the
+# primary. The first write in a request pins the rest of it to the primary,
+# and the user's next READ_AFTER_WRITE_SECONDS of requests follow, so nobody
+# reads back older data than they just wrote while the replica catches up.
+REPLICA = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+WROTE_AT = '_db_wrote_at'
+
+def replica_url():
+    return os.environ.get('READ_DATABASE_URL') or None
+
+def read_after_write_seconds():
+    return float(os.environ.get('READ_AFTER_WRITE_SECONDS', 5))
+
+def pin_to_primary():
+    if has_request_context():
+        g.db_pinned = True
+
+def _recently_wrote():
+    wrote_at = cookie_session.get(WROTE_AT)
+    return wrote_at is not None and time.time() - wrote_at < read_after_write_seconds()
+
+def _route_to_replica():
+    if not has_request_context() or g.get('db_pinned'):
+        return False
+    if not g.get('db_read_only') and request.method not in READ_METHODS:
+        return False
+    return not _recently_wrote()
+
+def _plain_select(clause):
+    return getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None
+
+class RoutingSession(Session):
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        if shards.enabled():
+            # Flushes pick a connection per object, from its user_id.
+            self.connection_callable = self._shard_connection
+
+    def _shard_connection(self, mapper, instance):
+        return self.connection(bind_arguments=dict(mapper=mapper, shard=shards.instance_shard(mapper, instance)))
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        engines = self._db.engines
+        shard = kwargs.pop('shard', None)
+        if bind is None and shard is None and shards.enabled():
+            shard = shards.statement_shard(mapper, clause)
+        if bind is None and shard:
+            return engines[shards.bind_key(shard)]
+        # Shard 0 is the primary, so it carries on as if unsharded.
+        if bind is None and REPLICA in engines:
+            if not self._flushing and _plain_select(clause) and _route_to_replica():
+                return engines[REPLICA]
+            if not _plain_select(clause):
+                # session.connection(), DML or text(): assume it writes.
+                pin_to_primary()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _tag_shard(orm_execute_state):
+    if orm_execute_state.is_select and shards.enabled():
+        shards.tag_select(orm_execute_state)
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _place_new_users(session, flush_context, instances):
+    shards.place_new_users(session)
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _pin_after_flush(session, flush_context):
+    pin_to_primary()
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _note_write(session):
+    if has_request_context() and g.get('db_pinned') and REPLICA in session._db.engines:
+        cookie_session[WROTE_AT] = time.time()
+
+def read_only(fn):
+    # Marks a read that may use the replica even inside a POST, unless the
+    # request has already written.
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not has_request_context():
+            return fn(*args, **kwargs)
+        outer = g.get('db_read_only', False)
+        g.db_read_only = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            g.db_read_only = outer
+    return wrapper
@@ -0,0 +1,138 @@
+import re
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from . import db
+from .models import Backfill, User, UserSearchTerm
+
+MAX_TERM_LENGTH = 32
+MIN_TERM_LENGTH = 2
+
+# Lower rank sorts first.
+RANK_EXACT_USERNAME = 0
+RANK_USERNAME = 1
+RANK_PROFILE_NAME = 2
+RANK_EMAIL = 3
+
+SEARCHED_FIELDS = ('username', 'profile_name', 'email')
+
+def normalize(text):
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+def _prefixes(text):
+    text = text[:MAX_TERM_LENGTH]
+    return (text[:size] for size in range(MIN_TERM_LENGTH, len(text) + 1))
+
+def _words(text):
+    return [word for word in re.split(r'[^a-z0-9]+', text) if word]
+
+def search_terms(username, profile_name, email):
+    username, profile_name, email = normalize(username), normalize(profile_name), normalize(email)
+    terms = {}
+
+    def add(term, rank):
+        if len(term) >= MIN_TERM_LENGTH and rank < terms.get(term, 99):
+            terms[term] = rank
+
+    for source, rank in ((username, RANK_USERNAME), (profile_name, RANK_PROFILE_NAME), (email, RANK_EMAIL)):
+        if not source:
+            continue
+        for term in _prefixes(source):
+            add(term, rank)
+        for word in _words(source.split('@')[0]):
+            for term in _prefixes(word):
+                add(term, rank)
+    if username:
+        add(username[:MAX_TERM_LENGTH], RANK_EXACT_USERNAME)
+    return terms
+
+def search_rows(user_id, username, profile_name, email):
+    sort_name = normalize(username)[:80]
+    return [
+        dict(term=term, user_id=user_id, rank=rank, sort_name=sort_name)
+        for term, rank in search_terms(username, profile_name, email).items()
+    ]
+
+def index_users(connection, users):
+    table = UserSearchTerm.__table__
+    user_ids = [user.id for user in users]
+    connection.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+    rows = [row for user in users for row in search_rows(user.id, user.username, user.profile_name, user.email)]
+    if rows:
+        connection.execute(table.insert(), rows)
+
+@event.listens_for(db.session, 'after_flush')
+def _update_search_index(session, flush_context):
+    changed = [obj for obj in session.new if isinstance(obj, User)]
+    changed.extend(
+        obj for obj in session.dirty
+        if isinstance(obj, User) and any(inspect(obj).attrs[f].history.has_changes() for f in SEARCHED_FIELDS)
+    )
+    if changed:
+        index_users(session.connection(), changed)
+
+def search_user_ids(query, exclude_user_id=None, limit=12):
+    needle = normalize(query)
+    if len(needle) < MIN_TERM_LENGTH:
+        return []
+    return _lookup_user_ids(needle, exclude_user_id, limit)
+
+def _lookup_user_ids(needle, exclude_user_id, limit):
+    statement = (select(UserSearchTerm.user_id)
+                 .where(UserSearchTerm.term == needle[:MAX_TERM_LENGTH])
+                 .order_by(UserSearchTerm.rank, UserSearchTerm.sort_name, UserSearchTerm.user_id))
+    if exclude_user_id is not None:
+        statement = statement.where(UserSearchTerm.user_id != exclude_user_id)
+    if len(needle) <= MAX_TERM_LENGTH:
+        return list(db.session.scalars(statement.limit(limit)))
+
+    # Terms are truncated, so longer queries re-check the full prefix.
+    matches = []
+    for batch in db.session.execute(statement.join(User)
+                                    .add_columns(User.username, User.profile_name, User.email)).partitions(200):
+        for user_id, *fields in batch:
+            if any(normalize(value).startswith(needle) for value in fields if value):
+                matches.append(user_id)
+                if len(matches) == limit:
+                    return matches
+    return matches
+
+def reindex_all(batch_size=1000):
+    connection = db.session.connection()
+    connection.execute(UserSearchTerm.__table__.delete())
+    count = 0
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        if not users:
+            break
+        index_users(connection, users)
+        count += len(users)
+        last_id = users[-1].id
+        db.session.expunge_all()
+    db.session.commit()
+    return count
+
+BACKFILL = 'user_search_term'
+
+def backfill_index():
+    # The migration fills the index, but a database that only ever ran
+    # create_all has users with no terms; index everyone once.
+    if db.session.get(Backfill, BACKFILL) is not None:
+        return None
+    count = reindex_all()
+    db.session.add(Backfill(name=BACKFILL))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process starting at the same time got there first.
+        db.session.rollback()
+    return count
+
+search_cli = AppGroup('search', help='Maintain the user search index.')
+
+@search_cli.command('reindex')
+def reindex_command():
+    count = reindex_all()
+    click.echo(f'Indexed {count} user(s).')
@@ -0,0 +1,361 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import os
+import threading
+import click
+from flask import current_app, g, has_app_context, has_request_context
+from flask.cli import AppGroup
+from flask_login import current_user
+from sqlalchemy import func, inspect, select
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.sql.util import find_tables
+
+# With SHARD_URLS set, each user's entries, chat, memories, action log and
+# the rollups and food profiles derived from them live on one shard: shard 0
+# is the primary database and SHARD_URLS lists shards 1..N. User.shard is the
+# directory. Users, friendships, privacy, search terms, resource versions,
+# the cache and the outbox stay global on the primary, and no query joins the
+# two groups, so a statement's tables decide whether it needs a shard at all.
+RAW_TABLES = (
+    'food_entry', 'water_entry', 'weight_entry', 'step_entry', 'sleep_entry', 'calories_burnt_entry',
+    'chat_message', 'user_memory', 'agent_action_log',
+)
+DERIVED_TABLES = ('daily_rollup', 'food_profile')
+SHARDED_TABLES = frozenset(RAW_TABLES + DERIVED_TABLES)
+MOVE_BATCH_SIZE = 1000
+
+class ShardError(RuntimeError):
+    pass
+
+def shard_urls():
+    return [url.strip() for url in os.environ.get('SHARD_URLS', '').split(',') if url.strip()]
+
+def enabled():
+    return bool(os.environ.get('SHARD_URLS', '').strip())
+
+def shard_count():
+    return 1 + len(shard_urls())
+
+def bind_key(shard):
+    # Shard 0 is the default bind, so it keeps the replica and the pragmas.
+    return None if shard == 0 else f'shard{shard}'
+
+def shard_binds(engine_options):
+    return {bind_key(i): dict(url=url, **engine_options(url)) for i, url in enumerate(shard_urls(), 1)}
+
+def fanout_workers():
+    return int(os.environ.get('SHARD_FANOUT_WORKERS', 8))
+
+def shard_of(user_id):
+    if not enabled():
+        return 0
+    # Memoized per app context only, so a move is seen by the next request.
+    directory = g.setdefault('shard_directory', {}) if has_app_context() else {}
+    shard = directory.get(user_id)
+    if shard is None:
+        from . import db
+        from .models import User
+        user = db.session.get(User, user_id)
+        if user is None or user.shard is None:
+            raise ShardError(f'User {user_id} has no shard.')
+        shard = directory[user_id] = user.shard
+    return shard
+
+def current_shard():
+    shard = g.get('shard') if has_app_context() else None
+    if shard is not None:
+        return shard
+    if has_request_context() and current_user.is_authenticated:
+        return shard_of(current_user.id)
+    raise ShardError('Per-user tables need a shard: call this inside using_shard(user_id).')
+
+@contextmanager
+def using_shard(user_id=None, shard=None):
+    if shard is None and user_id is not None:
+        shard = shard_of(user_id)
+    outer = g.get('shard')
+    g.shard = shard
+    try:
+        yield shard
+    finally:
+        g.shard = outer
+
+def statement_shard(mapper, clause):
+    names = set()
+    if mapper is not None:
+        names.add(mapper.local_table.name)
+    if clause is not None:
+        names.update(table.name for table in find_tables(clause, include_crud=True))
+    sharded = names & SHARDED_TABLES
+    if not sharded:
+        return None
+    if sharded != names:
+        raise ShardError(f"Cannot join per-user tables with global ones: {', '.join(sorted(names))}")
+    return current_shard()
+
+# Rows from shard k > 0 carry k as their identity token, so equal ids on two
+# shards stay two objects in one session, and a refresh goes back to the row's
+# own shard. Shard 0 keeps the plain token, as before sharding.
+def instance_shard(mapper, instance):
+    if mapper.local_table.name not in SHARDED_TABLES:
+        return None
+    state = inspect(instance)
+    if state.key is not None and state.key[2] is not None:
+        return state.key[2]
+    shard = shard_of(instance.user_id)
+    if shard:
+        state.identity_token = shard
+    return shard
+
+def tag_select(orm_execute_state):
+    shard = orm_execute_state.load_options._identity_token
+    if shard is None:
+        shard = statement_shard(orm_execute_state.bind_arguments.get('mapper'), orm_execute_state.statement)
+    if shard:
+        orm_execute_state.bind_arguments['shard'] = shard
+        orm_execute_state.update_execution_options(identity_token=shard)
+
+def connections(session, keyed):
+    # Splits a dict keyed by (user_id, ...) into one group per shard, paired
+    # with the session's connection to that shard.
+    if not enabled():
+        return [(session.connection(), keyed)]
+    groups = defaultdict(dict)
+    for key, value in keyed.items():
+        groups[shard_of(key[0])][key] = value
+    return [(session.connection(bind_arguments=dict(shard=shard)), group) for shard, group in groups.items()]
+
+def place_new_users(session):
+    if not enabled():
+        return
+    from .models import User
+    new = [obj for obj in session.new if isinstance(obj, User) and obj.shard is None]
+    if not new:
+        return
+    counts = dict.fromkeys(range(shard_count()), 0)
+    for shard, count in session.execute(select(User.shard, func.count()).group_by(User.shard)):
+        if shard in counts:
+            counts[shard] = count
+    for user in new:
+        user.shard = min(counts, key=counts.get)
+        counts[user.shard] += 1
+
+def create_shard_tables(engine):
+    # Shards hold no user table, so their copies skip the foreign keys.
+    from . import db
+    with engine.begin() as connection:
+        existing = set(inspect(connection).get_table_names())
+        for name in sorted(SHARDED_TABLES):
+            table = db.metadata.tables[name]
+            if name not in existing:
+                connection.execute(CreateTable(table, include_foreign_key_constraints=[]))
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+def group_by_shard(user_ids):
+    groups = {}
+    for user_id in user_ids:
+        groups.setdefault(shard_of(user_id), []).append(user_id)
+    return groups
+
+_executor = None
+_lock = threading.Lock()
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=fanout_workers(), thread_name_prefix='fitit-shard')
+    return _executor
+
+def reset_executor():
+    global _executor
+    with _lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+def fan_out(groups, fn):
+    # Calls fn(user_ids) once per shard group and returns the results in
+    # group order. The first group runs in the calling thread, so it keeps the
+    # request and its replica routing; the others run on the pool at the same
+    # time, each in its own app context and therefore its own session.
+    # SHARD_FANOUT_WORKERS=0 runs every group here, one after another.
+    items = list(groups.items())
+    if len(items) < 2 or fanout_workers() < 1:
+        results = []
+        for shard, user_ids in items:
+            with using_shard(shard=shard):
+                results.append(fn(user_ids))
+        return results
+    app = current_app._get_current_object()
+
+    def run(shard, user_ids):
+        with app.app_context(), using_shard(shard=shard):
+            return fn(user_ids)
+
+    futures = [get_executor().submit(run, shard, user_ids) for shard, user_ids in items[1:]]
+    shard, user_ids = items[0]
+    with using_shard(shard=shard):
+        results = [fn(user_ids)]
+    return results + [future.result() for future in futures]
+
+def each_shard(user_id=None):
+    # For CLI commands: runs the loop body on the user's shard, or once per shard.
+    for shard in ([shard_of(user_id)] if user_id is not None else range(shard_count())):
+        with using_shard(shard=shard):
+            yield shard
+
+def _engine(shard):
+    from . import db
+    return db.engines[bind_key(shard)]
+
+def _copy_rows(source, target, table, user_id, after_id):
+    # New ids on the target: the source's ids may already be taken there.
+    columns = [column for column in table.columns if column.name != 'id']
+    last_id = after_id
+    while True:
+        rows = source.execute(
+            select(table).where(table.c.user_id == user_id, table.c.id > last_id)
+            .order_by(table.c.id).limit(MOVE_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return last_id
+        target.execute(table.insert(), [{column.name: row._mapping[column.name] for column in columns} for row in rows])
+        last_id = rows[-1].id
+
+def _copy_user(source, target, user_id, after_ids):
+    from . import db
+    with _engine(source).connect() as source_connection, _engine(target).begin() as target_connection:
+        return {
+            name: _copy_rows(source_connection, target_connection, db.metadata.tables[name], user_id, after_ids[name])
+            for name in RAW_TABLES
+        }
+
+def move_user(user_id, target):
+    from . import db
+    from .cache import get_cache, scope_for
+    from .food_profile import rebuild_profiles
+    from .models import FoodEntry, User, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry
+    from .rollups import rebuild_rollups
+    from .versions import ENTRIES, bump
+    if not enabled():
+        raise ShardError('Set SHARD_URLS to move users between shards.')
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise ShardError(f'No user {user_id}.')
+    source = user.shard
+    if not 0 <= target < shard_count():
+        raise ShardError(f'Shard {target} does not exist; there are {shard_count()}.')
+    if source == target:
+        raise ShardError(f'User {user_id} is already on shard {target}.')
+
+    # Copy, flip the directory, then copy again: rows written to the source
+    # while the first copy ran are picked up by id. Edits to rows that were
+    # already copied are not, so move users while they are idle.
+    copied = _copy_user(source, target, user_id, dict.fromkeys(RAW_TABLES, 0))
+    user.shard = target
+    db.session.commit()
+    g.pop('shard_directory', None)
+    copied = _copy_user(source, target, user_id, copied)
+    with using_shard(shard=target):
+        rebuild_rollups(user_id)
+        rebuild_profiles(user_id)
+
+    moved = {}
+    days = set()
+    with _engine(source).begin() as connection:
+        for model in (FoodEntry, WaterEntry, WeightEntry, StepEntry, SleepEntry, CaloriesBurntEntry):
+            days.update(connection.scalars(select(model.date).where(model.user_id == user_id).distinct()))
+        for name in sorted(SHARDED_TABLES):
+            table = db.metadata.tables[name]
+            moved[name] = connection.execute(table.delete().where(table.c.user_id == user_id)).rowcount
+    # Same rows, new ids: clients holding entry ids must refetch.
+    with db.engine.begin() as connection:
+        get_cache().invalidate_scopes({scope_for(user_id, day) for day in days}, connection)
+        bump(connection, {(user_id, ENTRIES)})
+    return source, moved
+
+def row_counts(shard):
+    from . import db
+    with _engine(shard).connect() as connection:
+        return {
+            name: connection.execute(select(func.count()).select_from(db.metadata.tables[name])).scalar()
+            for name in RAW_TABLES
+        }
+
+def user_loads(shard):
+    # Raw rows per user on one shard, the measure rebalancing evens out.
+    from . import db
+    loads = defaultdict(int)
+    with _engine(shard).connect() as connection:
+        for name in RAW_TABLES:
+            table = db.metadata.tables[name]
+            for user_id, count in connection.execute(select(table.c.user_id, func.count()).group_by(table.c.user_id)):
+                loads[user_id] += count
+    return loads
+
+def plan_moves(max_moves):
+    # Greedy: move the largest user from the heaviest shard to the lightest
+    # one while that still narrows the gap between them.
+    from . import db
+    from .models import User
+    placed = dict(db.session.execute(select(User.id, User.shard)).all())
+    loads = {shard: {} for shard in range(shard_count())}
+    for shard in loads:
+        for user_id, count in user_loads(shard).items():
+            if placed.get(user_id) == shard:
+                loads[shard][user_id] = count
+    moves = []
+    while len(moves) < max_moves:
+        totals = {shard: sum(users.values()) for shard, users in loads.items()}
+        heavy = max(totals, key=totals.get)
+        light = min(totals, key=totals.get)
+        gap = totals[heavy] - totals[light]
+        candidates = [(count, user_id) for user_id, count in loads[heavy].items() if 0 < count < gap]
+        if not candidates:
+            break
+        count, user_id = max(candidates)
+        loads[light][user_id] = loads[heavy].pop(user_id)
+        moves.append((user_id, heavy, light, count))
+    return moves
+
+shards_cli = AppGroup('shards', help='Inspect and rebalance per-user data shards.')
+
+@shards_cli.command('stats')
+def stats_command():
+    from . import db
+    from .models import User
+    if not enabled():
+        raise click.ClickException('Sharding is off: set SHARD_URLS.')
+    users = dict(db.session.execute(select(User.shard, func.count()).group_by(User.shard)).all())
+    for shard in range(shard_count()):
+        counts = row_counts(shard)
+        detail = ', '.join(f'{name}={count}' for name, count in counts.items() if count)
+        click.echo(f'shard {shard}: {users.get(shard, 0)} users, {sum(counts.values())} rows' + (f' ({detail})' if detail else ''))
+
+@shards_cli.command('move')
+@click.argument('user_id', type=int)
+@click.argument('target', type=int)
+def move_command(user_id, target):
+    try:
+        source, moved = move_user(user_id, target)
+    except ShardError as exc:
+        raise click.ClickException(str(exc))
+    click.echo(f'Moved user {user_id} from shard {source} to shard {target}: {sum(moved.values())} rows.')
+
+@shards_cli.command('rebalance')
+@click.option('--max-moves', type=int, default=10, show_default=True, help='Stop after this many moves.')
+@click.option('--dry-run', is_flag=True, help='Only print the planned moves.')
+def rebalance_command(max_moves, dry_run):
+    if not enabled():
+        raise click.ClickException('Set SHARD_URLS to rebalance.')
+    moves = plan_moves(max_moves)
+    for user_id, source, target, count in moves:
+        click.echo(f'user {user_id}: shard {source} -> {target} ({count} rows)')
+        if not dry_run:
+            move_user(user_id, target)
+    if not moves:
+        click.echo('Shards are balanced.')
@@ -0,0 +1,156 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import click
+from flask import Response, abort, request
+from flask.cli import AppGroup
+
+from .compression import brotli, compressible, negotiate
+
+REACT_BUILD = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
+
+# Vite names bundles `assets/<name>-<content hash>.<ext>`, so their bytes never
+# change under the same URL and browsers can keep them for a year.
+HASHED_NAME = re.compile(r'(^|/)assets/.+-[A-Za-z0-9_-]{8,}\.[a-z0-9]+$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+COMPRESS_MIN_BYTES = 1024
+# A variant has to save at least this share of the bytes to be worth a Vary.
+COMPRESS_MIN_SAVING = 0.1
+ENCODINGS = ('br', 'gzip')
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def compress(data, encoding):
+    if encoding == 'gzip':
+        # mtime=0 keeps the bytes, and so the ETag, stable across restarts.
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+class Asset:
+    def __init__(self, path, data, mimetype, mtime, sidecars=None):
+        self.path = path
+        self.mimetype = mimetype
+        self.mtime = mtime
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self.cache_control = IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE
+        self.variants = {None: data}
+        if not compressible(mimetype) or len(data) < COMPRESS_MIN_BYTES:
+            return
+        for encoding in ENCODINGS:
+            body = (sidecars or {}).get(encoding) or compress(data, encoding)
+            if body is not None and len(body) <= len(data) * (1 - COMPRESS_MIN_SAVING):
+                self.variants[encoding] = body
+
+    def etag(self, encoding):
+        # Each encoding is a different representation, so it gets its own strong tag.
+        return self.digest if encoding is None else f'{self.digest}-{encoding}'
+
+class Manifest:
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        if not os.path.isdir(root):
+            return
+        for directory, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(tuple(SUFFIXES.values())):
+                    continue
+                full = os.path.join(directory, name)
+                path = os.path.relpath(full, root).replace(os.sep, '/')
+                self.assets[path] = self._load(full, path)
+
+    def _load(self, full, path):
+        with open(full, 'rb') as handle:
+            data = handle.read()
+        # Variants written by `flask assets compress` at build time are used as-is.
+        sidecars = {}
+        for encoding, suffix in SUFFIXES.items():
+            if os.path.exists(full + suffix):
+                with open(full + suffix, 'rb') as handle:
+                    sidecars[encoding] = handle.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        return Asset(path, data, mimetype, os.path.getmtime(full), sidecars)
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def stats(self):
+        counts = dict(files=len(self.assets), immutable=0, identity_bytes=0)
+        for encoding in ENCODINGS:
+            counts[f'{encoding}_files'] = 0
+            counts[f'{encoding}_bytes'] = 0
+        for asset in self.assets.values():
+            counts['immutable'] += asset.cache_control == IMMUTABLE
+            counts['identity_bytes'] += len(asset.variants[None])
+            for encoding in ENCODINGS:
+                if encoding in asset.variants:
+                    counts[f'{encoding}_files'] += 1
+                    counts[f'{encoding}_bytes'] += len(asset.variants[encoding])
+        return counts
+
+_manifest = None
+_manifest_lock = threading.Lock()
+
+def get_manifest():
+    global _manifest
+    if _manifest is None:
+        with _manifest_lock:
+            if _manifest is None:
+                _manifest = Manifest(os.environ.get('REACT_BUILD_DIR') or REACT_BUILD)
+    return _manifest
+
+def reset_manifest():
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
+
+def asset_response(asset):
+    encoding = negotiate(request.accept_encodings, asset.variants)
+    response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if compressible(asset.mimetype):
+        response.headers['Vary'] = 'Accept-Encoding'
+    response.set_etag(asset.etag(encoding))
+    response.last_modified = asset.mtime
+    response.headers['Cache-Control'] = asset.cache_control
+    return response.make_conditional(request)
+
+def serve_asset(path):
+    manifest = get_manifest()
+    asset = manifest.get(path) if path else None
+    if asset is None:
+        # Client-side routes all load the app shell.
+        asset = manifest.get('index.html')
+    if asset is None:
+        abort(404)
+    return asset_response(asset)
+
+assets_cli = AppGroup('assets', help='Inspect and precompress the React build.')
+
+@assets_cli.command('compress')
+def compress_command():
+    root = os.environ.get('REACT_BUILD_DIR') or REACT_BUILD
+    written = 0
+    for asset in Manifest(root).assets.values():
+        for encoding, body in asset.variants.items():
+            if encoding is None:
+                continue
+            with open(os.path.join(root, asset.path) + SUFFIXES[encoding], 'wb') as handle:
+                handle.write(body)
+            written += 1
+    if brotli is None:
+        click.echo('brotli is not installed; only gzip variants were written.')
+    click.echo(f'Wrote {written} precompressed file(s) under {root}.')
+    reset_manifest()
+
+@assets_cli.command('stats')
+def stats_command():
+    for key, value in get_manifest().stats().items():
+        click.echo(f'{key}: {value}')
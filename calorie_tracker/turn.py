@@ -0,0 +1,78 @@
+from flask import g, has_app_context
+from sqlalchemy import event
+from . import db
+
+# Memoized reads for one request, keyed by (name, *args). Writers drop the
+# names they touch with invalidate(); everything else is reused for the rest of
+# the request. Values holding ORM objects are also dropped when the session
+# commits or rolls back, since those objects are expired from then on.
+class TurnContext:
+    def __init__(self):
+        self._values = {}
+        self._orm_keys = set()
+        self.loads = 0
+        self.hits = 0
+
+    def get(self, key, loader, orm=False):
+        if key in self._values:
+            self.hits += 1
+            return self._values[key]
+        value = self._values[key] = loader()
+        if orm:
+            self._orm_keys.add(key)
+        self.loads += 1
+        return value
+
+    def invalidate(self, *names):
+        for key in [key for key in self._values if key[0] in names]:
+            del self._values[key]
+            self._orm_keys.discard(key)
+
+    def drop_orm(self):
+        for key in self._orm_keys:
+            self._values.pop(key, None)
+        self._orm_keys.clear()
+
+def turn_context():
+    if not has_app_context():
+        return TurnContext()
+    context = g.get('turn_context')
+    if context is None:
+        context = g.turn_context = TurnContext()
+    return context
+
+def memoized(key, loader, orm=False):
+    return turn_context().get(key, loader, orm)
+
+def invalidate(*names):
+    if has_app_context() and g.get('turn_context') is not None:
+        g.turn_context.invalidate(*names)
+
+@event.listens_for(db.session, 'after_commit')
+@event.listens_for(db.session, 'after_soft_rollback')
+def _drop_orm_values(session, *args):
+    if has_app_context() and g.get('turn_context') is not None:
+        g.turn_context.drop_orm()
+
+def reset_turn():
+    g.pop('turn_context', None)
+    g.query_count = 0
+    g.llm_calls = 0
+
+def query_count():
+    return g.get('query_count', 0) if has_app_context() else 0
+
+def llm_calls():
+    return g.get('llm_calls', 0) if has_app_context() else 0
+
+def count_llm_call():
+    if has_app_context():
+        g.llm_calls = g.get('llm_calls', 0) + 1
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def install_query_counter(engine):
+    if not event.contains(engine, 'before_cursor_execute', _count_query):
+        event.listen(engine, 'before_cursor_execute', _count_query)
@@ -1,23 +1,69 @@
 from datetime import date, timedelta
-from .models import FoodEntry, WaterEntry, StepEntry, SleepEntry, CaloriesBurntEntry, WeightEntry
+from sqlalchemy import bindparam, func, literal, select, union_all
+from . import db
+from .routing import read_only
+from .models import FoodEntry, WaterEntry, StepEntry, SleepEntry, CaloriesBurntEntry, WeightEntry, DailyRollup
 
+TOTAL_METRICS = ('calories', 'carbs', 'protein', 'fat', 'sugar', 'water', 'steps', 'sleep', 'calories_burnt')
+
+def _totals_select(model, **columns):
+    return select(*(
+        func.coalesce(func.sum(columns[metric]), 0).label(metric) if metric in columns
+        else literal(0, literal_execute=True).label(metric)
+        for metric in TOTAL_METRICS
+    )).where(model.user_id == bindparam('user_id'), model.date == bindparam('date'))
+
+_daily_parts = union_all(
+    _totals_select(FoodEntry, calories=FoodEntry.calories, carbs=FoodEntry.carbs,
+                   protein=FoodEntry.protein, fat=FoodEntry.fat, sugar=FoodEntry.sugar),
+    _totals_select(WaterEntry, water=WaterEntry.amount_ml),
+    _totals_select(StepEntry, steps=StepEntry.steps),
+    _totals_select(SleepEntry, sleep=SleepEntry.duration_hours),
+    _totals_select(CaloriesBurntEntry, calories_burnt=CaloriesBurntEntry.calories_burnt),
+).subquery()
+DAILY_TOTALS_QUERY = select(*(func.sum(_daily_parts.c[metric]).label(metric) for metric in TOTAL_METRICS))
+
+ROLLUP_QUERY = select(*(getattr(DailyRollup, metric) for metric in TOTAL_METRICS)).where(
+    DailyRollup.user_id == bindparam('user_id'), DailyRollup.date == bindparam('date'))
+
+def aggregate_daily_totals(user_id, date_):
+    row = db.session.execute(DAILY_TOTALS_QUERY, dict(user_id=user_id, date=date_)).one()
+    return {metric: row._mapping[metric] or 0 for metric in TOTAL_METRICS}
+
+@read_only
 def get_daily_totals(user_id, date_):
-    food_entries = FoodEntry.query.filter_by(user_id=user_id, date=date_).all()
-    water_entries = WaterEntry.query.filter_by(user_id=user_id, date=date_).all()
-    step_entries = StepEntry.query.filter_by(user_id=user_id, date=date_).all()
-    sleep_entries = SleepEntry.query.filter_by(user_id=user_id, date=date_).all()
-    calories_burnt_entries = CaloriesBurntEntry.query.filter_by(user_id=user_id, date=date_).all()
-    return {
-        'calories': sum(e.calories for e in food_entries),
-        'carbs': sum(e.carbs for e in food_entries),
-        'protein': sum(e.protein for e in food_entries),
-        'fat': sum(e.fat for e in food_entries),
-        'sugar': sum(e.sugar for e in food_entries),
-        'water': sum(e.amount_ml for e in water_entries),
-        'steps': sum(e.steps for e in step_entries),
-        'sleep': sum(e.duration_hours for e in sleep_entries),
-        'calories_burnt': sum(e.calories_burnt for e in calories_burnt_entries)
-    }
+    row = db.session.execute(ROLLUP_QUERY, dict(user_id=user_id, date=date_)).first()
+    if row is None:
+        return dict.fromkeys(TOTAL_METRICS, 0)
+    return dict(row._mapping)
+
+@read_only
+def get_users_daily_totals(user_ids, date_):
+    rows = db.session.execute(
+        select(DailyRollup.user_id, *(getattr(DailyRollup, metric) for metric in TOTAL_METRICS))
+        .where(DailyRollup.user_id.in_(user_ids), DailyRollup.date == date_)
+    ).all()
+    totals = {uid: dict.fromkeys(TOTAL_METRICS, 0) for uid in user_ids}
+    for row in rows:
+        totals[row[0]] = dict(zip(TOTAL_METRICS, row[1:]))
+    return totals
+
+@read_only
+def get_range_totals(user_id, start, end, metrics=TOTAL_METRICS):
+    rows = db.session.execute(
+        select(DailyRollup.date, *(getattr(DailyRollup, metric) for metric in metrics))
+        .where(DailyRollup.user_id == user_id, DailyRollup.date >= start, DailyRollup.date <= end)
+        .order_by(DailyRollup.date)
+    ).all()
+    return {row[0]: row[1:] for row in rows}
+
+def history_period(day, bucket):
+    if bucket == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    if bucket == 'month':
+        return day.strftime('%Y-%m')
+    return day.isoformat()
 
 def get_health_metrics(user, totals):
     from datetime import date
@@ -0,0 +1,118 @@
+from collections import defaultdict
+from datetime import date
+from functools import wraps
+from itertools import chain
+from flask import make_response, request
+from flask_login import current_user
+from sqlalchemy import event, inspect, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from . import db
+from .cache import SCOPED_MODELS, context_digest
+from .models import FriendPrivacy, Friendship, ResourceVersion, User
+from .rollups import _committed_value
+
+# Per-user counters bumped in the same transaction as any write to what they
+# cover, so a GET can tell from one small row whether its last answer still
+# holds without running the queries behind it.
+ENTRIES = 'entries'
+USER = 'user'
+FRIENDS = 'friends'
+
+# Friend lists show each friend's names, so renames reach their friends too.
+PUBLIC_USER_FIELDS = ('username', 'profile_name')
+
+def changed_resources(session):
+    changed = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, SCOPED_MODELS):
+            changed.add((obj.user_id, ENTRIES))
+            if obj not in session.new:
+                changed.add((_committed_value(inspect(obj), 'user_id'), ENTRIES))
+        elif isinstance(obj, User):
+            if obj in session.dirty and not session.is_modified(obj):
+                continue
+            changed.add((obj.id, USER))
+        elif isinstance(obj, Friendship):
+            changed.update(((obj.requester_id, FRIENDS), (obj.receiver_id, FRIENDS)))
+        elif isinstance(obj, FriendPrivacy):
+            changed.add((obj.user_id, FRIENDS))
+    return {(user_id, resource) for user_id, resource in changed if user_id is not None}
+
+def renamed_user_ids(session):
+    return [
+        obj.id for obj in session.dirty
+        if isinstance(obj, User) and any(inspect(obj).attrs[f].history.has_changes() for f in PUBLIC_USER_FIELDS)
+    ]
+
+def friend_ids(connection, user_ids):
+    table = Friendship.__table__
+    rows = connection.execute(
+        select(table.c.requester_id, table.c.receiver_id)
+        .where(or_(table.c.requester_id.in_(user_ids), table.c.receiver_id.in_(user_ids)))
+    )
+    return {user_id for row in rows for user_id in row}
+
+def bump(connection, changed):
+    rows = [dict(user_id=user_id, resource=resource, version=1) for user_id, resource in sorted(changed)]
+    if not rows:
+        return
+    table = ResourceVersion.__table__
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=['user_id', 'resource'],
+            set_=dict(version=table.c.version + 1),
+        )
+        connection.execute(statement, rows)
+        return
+    for row in rows:
+        updated = connection.execute(
+            table.update()
+            .where(table.c.user_id == row['user_id'], table.c.resource == row['resource'])
+            .values(version=table.c.version + 1)
+        )
+        if not updated.rowcount:
+            connection.execute(table.insert().values(**row))
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_versions(session, flush_context):
+    changed = changed_resources(session)
+    renamed = renamed_user_ids(session)
+    if renamed:
+        changed.update((user_id, FRIENDS) for user_id in friend_ids(session.connection(), renamed) | set(renamed))
+    if changed:
+        bump(session.connection(), changed)
+
+def current_versions(user_id, resources):
+    found = defaultdict(int)
+    found.update(db.session.execute(
+        select(ResourceVersion.resource, ResourceVersion.version)
+        .where(ResourceVersion.user_id == user_id, ResourceVersion.resource.in_(resources))
+    ).all())
+    return [found[resource] for resource in resources]
+
+def resource_etag(user_id, resources):
+    # Defaults like "today" change the answer without a write, so they are part of the tag.
+    versions = current_versions(user_id, resources)
+    args = sorted(request.args.items(multi=True))
+    return context_digest(request.path, user_id, resources, versions, args, date.today())[:24]
+
+def conditional(*resources):
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = resource_etag(current_user.id, resources)
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Browsers keep the body but check back every time.
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return wrapper
+    return decorator
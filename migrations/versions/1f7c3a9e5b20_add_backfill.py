@@ -0,0 +1,34 @@
+"""add backfill markers for derived tables
+
+Revision ID: 1f7c3a9e5b20
+Revises: e6b2d8a4c193
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1f7c3a9e5b20'
+down_revision = 'e6b2d8a4c193'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('backfill'):
+        backfill = op.create_table(
+            'backfill',
+            sa.Column('name', sa.String(length=64), nullable=False),
+            sa.Column('completed_at', sa.DateTime(), nullable=False),
+            sa.PrimaryKeyConstraint('name'),
+        )
+        # 8c1e0a6f2b47 already filled user_search_term from existing users.
+        op.bulk_insert(backfill, [{'name': 'user_search_term', 'completed_at': datetime.utcnow()}])
+
+
+def downgrade():
+    op.drop_table('backfill')
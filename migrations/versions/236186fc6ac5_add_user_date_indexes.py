@@ -0,0 +1,40 @@
+"""add composite user/date indexes to entry tables
+
+Revision ID: 236186fc6ac5
+Revises: 
+Create Date: 2026-10-18 09:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '236186fc6ac5'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Tables are still created by db.create_all(), which also creates these
+# indexes on fresh databases, so every create/drop is guarded.
+INDEXES = (
+    ('ix_food_entry_user_date', 'food_entry', ['user_id', 'date', 'id']),
+    ('ix_water_entry_user_date', 'water_entry', ['user_id', 'date', 'id']),
+    ('ix_weight_entry_user_date', 'weight_entry', ['user_id', 'date', 'id']),
+    ('ix_step_entry_user_date', 'step_entry', ['user_id', 'date', 'id']),
+    ('ix_sleep_entry_user_date', 'sleep_entry', ['user_id', 'date', 'id']),
+    ('ix_calories_burnt_entry_user_date', 'calories_burnt_entry', ['user_id', 'date', 'id']),
+    ('ix_chat_message_user_created', 'chat_message', ['user_id', 'created_at', 'id']),
+    ('ix_agent_action_log_user_created', 'agent_action_log', ['user_id', 'created_at', 'id']),
+    ('ix_friendship_receiver', 'friendship', ['receiver_id', 'requester_id']),
+)
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        op.create_index(name, table, columns, unique=False, if_not_exists=True)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
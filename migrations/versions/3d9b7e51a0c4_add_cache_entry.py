@@ -0,0 +1,37 @@
+"""add cache_entry for shared AI response caching
+
+Revision ID: 3d9b7e51a0c4
+Revises: 8c1e0a6f2b47
+Create Date: 2026-10-18 11:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9b7e51a0c4'
+down_revision = '8c1e0a6f2b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('cache_entry'):
+        op.create_table(
+            'cache_entry',
+            sa.Column('key', sa.String(length=160), nullable=False),
+            sa.Column('scope', sa.String(length=64), nullable=False),
+            sa.Column('value', sa.Text(), nullable=False),
+            sa.Column('expires_at', sa.Float(), nullable=False),
+            sa.Column('used_at', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('key'),
+        )
+    op.create_index('ix_cache_entry_scope', 'cache_entry', ['scope'], unique=False, if_not_exists=True)
+    op.create_index('ix_cache_entry_used_at', 'cache_entry', ['used_at'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_cache_entry_used_at', table_name='cache_entry', if_exists=True)
+    op.drop_index('ix_cache_entry_scope', table_name='cache_entry', if_exists=True)
+    op.drop_table('cache_entry')
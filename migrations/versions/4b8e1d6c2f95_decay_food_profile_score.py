@@ -0,0 +1,92 @@
+"""store food_profile.score decayed to score_date, ranked by rank
+
+Revision ID: 4b8e1d6c2f95
+Revises: 1f7c3a9e5b20
+Create Date: 2026-10-18 19:45:00.000000
+
+"""
+from collections import defaultdict
+from datetime import date
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e1d6c2f95'
+down_revision = '1f7c3a9e5b20'
+branch_labels = None
+depends_on = None
+
+# Same weighting as calorie_tracker.food_profile, frozen for this migration.
+EPOCH = date(2026, 1, 1)
+HALF_LIFE_DAYS = 30
+MAX_HALF_LIVES = 512
+MACROS = ('calories', 'protein', 'carbs', 'fat', 'sugar')
+
+
+def _entries(bind):
+    rows = bind.execute(sa.text(
+        'SELECT user_id, name, date, calories, protein, carbs, fat, sugar FROM food_entry ORDER BY date, id'
+    ))
+    for row in rows:
+        key = (row.name or '').strip().lower()[:100]
+        if key:
+            yield key, row, row.date if isinstance(row.date, date) else date.fromisoformat(str(row.date)[:10])
+
+
+def upgrade():
+    bind = op.get_bind()
+    columns = {column['name'] for column in sa.inspect(bind).get_columns('food_profile')}
+    with op.batch_alter_table('food_profile') as batch_op:
+        if 'score_date' not in columns:
+            batch_op.add_column(sa.Column('score_date', sa.Date(), nullable=True))
+        if 'rank' not in columns:
+            batch_op.add_column(sa.Column('rank', sa.Float(), nullable=True))
+    op.drop_index('ix_food_profile_user_score', table_name='food_profile', if_exists=True)
+    op.create_index('ix_food_profile_user_rank', 'food_profile', ['user_id', 'rank'], unique=False, if_not_exists=True)
+
+    # Rebuilt rather than converted: create_all may have left it empty.
+    op.execute('DELETE FROM food_profile')
+    profiles = defaultdict(lambda: dict(dict.fromkeys(('count', *MACROS), 0), dates=[], last_date=None))
+    for key, row, entry_date in _entries(bind):
+        profile = profiles[(row.user_id, key)]
+        profile['name'] = row.name.strip()[:100]
+        profile['count'] += 1
+        for macro in MACROS:
+            profile[macro] += getattr(row, macro) or 0
+        profile['dates'].append(entry_date)
+        profile['last_date'] = entry_date
+    rows = []
+    for (user_id, key), profile in profiles.items():
+        dates = profile.pop('dates')
+        score_date = max(dates)
+        score = sum(2.0 ** ((day - score_date).days / HALF_LIFE_DAYS) for day in dates)
+        rank = math.log2(score) + (score_date - EPOCH).days / HALF_LIFE_DAYS
+        rows.append(dict(user_id=user_id, key=key, score=score, score_date=score_date, rank=rank, **profile))
+    if rows:
+        table = sa.table('food_profile', *(sa.column(name) for name in (
+            'user_id', 'key', 'name', 'count', *MACROS, 'score', 'score_date', 'rank', 'last_date',
+        )))
+        op.bulk_insert(table, rows)
+
+
+def downgrade():
+    # Back to one additive 2 ** (days since EPOCH / HALF_LIFE_DAYS) per entry.
+    bind = op.get_bind()
+    scores = defaultdict(float)
+    for key, row, entry_date in _entries(bind):
+        scores[(row.user_id, key)] += 2.0 ** min((entry_date - EPOCH).days / HALF_LIFE_DAYS, MAX_HALF_LIVES)
+    table = sa.table('food_profile', sa.column('user_id'), sa.column('key'), sa.column('score'))
+    statement = table.update().where(
+        table.c.user_id == sa.bindparam('b_user_id'), table.c.key == sa.bindparam('b_key'),
+    ).values(score=sa.bindparam('b_score'))
+    rows = [dict(b_user_id=user_id, b_key=key, b_score=score) for (user_id, key), score in scores.items()]
+    if rows:
+        bind.execute(statement, rows)
+    op.drop_index('ix_food_profile_user_rank', table_name='food_profile', if_exists=True)
+    with op.batch_alter_table('food_profile') as batch_op:
+        batch_op.drop_column('rank')
+        batch_op.drop_column('score_date')
+    op.create_index('ix_food_profile_user_score', 'food_profile', ['user_id', 'score'], unique=False, if_not_exists=True)
@@ -0,0 +1,76 @@
+"""add food_profile and backfill it from food entries
+
+Revision ID: 5a2c8e9d1f36
+Revises: 3d9b7e51a0c4
+Create Date: 2026-10-18 13:20:00.000000
+
+"""
+from collections import defaultdict
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a2c8e9d1f36'
+down_revision = '3d9b7e51a0c4'
+branch_labels = None
+depends_on = None
+
+# Same weighting as calorie_tracker.food_profile, frozen for this migration.
+EPOCH = date(2020, 1, 1)
+HALF_LIFE_DAYS = 30
+MACROS = ('calories', 'protein', 'carbs', 'fat', 'sugar')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('food_profile'):
+        op.create_table(
+            'food_profile',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('key', sa.String(length=100), nullable=False),
+            sa.Column('name', sa.String(length=100), nullable=False),
+            sa.Column('count', sa.Integer(), nullable=False),
+            sa.Column('calories', sa.Float(), nullable=False),
+            sa.Column('protein', sa.Float(), nullable=False),
+            sa.Column('carbs', sa.Float(), nullable=False),
+            sa.Column('fat', sa.Float(), nullable=False),
+            sa.Column('sugar', sa.Float(), nullable=False),
+            sa.Column('score', sa.Float(), nullable=False),
+            sa.Column('last_date', sa.Date(), nullable=True),
+            sa.PrimaryKeyConstraint('user_id', 'key'),
+        )
+    op.create_index('ix_food_profile_user_score', 'food_profile', ['user_id', 'score'], unique=False, if_not_exists=True)
+
+    # The score needs pow(), which SQLite may not have, so backfill in Python.
+    op.execute('DELETE FROM food_profile')
+    profiles = defaultdict(lambda: dict(dict.fromkeys(('count', 'score', *MACROS), 0), last_date=None))
+    entries = bind.execute(sa.text(
+        'SELECT user_id, name, date, calories, protein, carbs, fat, sugar FROM food_entry ORDER BY date, id'
+    ))
+    for row in entries:
+        key = (row.name or '').strip().lower()[:100]
+        if not key:
+            continue
+        entry_date = row.date if isinstance(row.date, date) else date.fromisoformat(str(row.date)[:10])
+        profile = profiles[(row.user_id, key)]
+        profile['name'] = row.name.strip()[:100]
+        profile['count'] += 1
+        for macro in MACROS:
+            profile[macro] += getattr(row, macro) or 0
+        profile['score'] += 2.0 ** ((entry_date - EPOCH).days / HALF_LIFE_DAYS)
+        profile['last_date'] = entry_date
+    if profiles:
+        table = sa.table('food_profile', *(sa.column(name) for name in (
+            'user_id', 'key', 'name', 'count', *MACROS, 'score', 'last_date',
+        )))
+        op.bulk_insert(table, [dict(user_id=user_id, key=key, **profile) for (user_id, key), profile in profiles.items()])
+
+    # Nibbly used to copy the top foods into this memory on every message.
+    op.execute("DELETE FROM user_memory WHERE key = 'common_foods_summary'")
+
+
+def downgrade():
+    op.drop_index('ix_food_profile_user_score', table_name='food_profile', if_exists=True)
+    op.drop_table('food_profile')
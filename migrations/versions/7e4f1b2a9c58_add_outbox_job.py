@@ -0,0 +1,37 @@
+"""add outbox_job for durable background work
+
+Revision ID: 7e4f1b2a9c58
+Revises: 5a2c8e9d1f36
+Create Date: 2026-10-18 14:10:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4f1b2a9c58'
+down_revision = '5a2c8e9d1f36'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('outbox_job'):
+        op.create_table(
+            'outbox_job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('kind', sa.String(length=80), nullable=False),
+            sa.Column('payload', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.Float(), nullable=False),
+            sa.Column('claimed_at', sa.Float(), nullable=True),
+            sa.Column('attempts', sa.Integer(), nullable=False),
+            sa.Column('last_error', sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+        )
+    op.create_index('ix_outbox_job_created_at', 'outbox_job', ['created_at'], unique=False, if_not_exists=True)
+
+
+def downgrade():
+    op.drop_index('ix_outbox_job_created_at', table_name='outbox_job', if_exists=True)
+    op.drop_table('outbox_job')
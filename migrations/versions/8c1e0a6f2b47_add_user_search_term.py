@@ -0,0 +1,82 @@
+"""add user_search_term prefix index and backfill it from users
+
+Revision ID: 8c1e0a6f2b47
+Revises: f21316b37ed8
+Create Date: 2026-10-18 10:20:00.000000
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1e0a6f2b47'
+down_revision = 'f21316b37ed8'
+branch_labels = None
+depends_on = None
+
+# Same terms as calorie_tracker.search, frozen for this migration.
+MAX_TERM_LENGTH = 32
+MIN_TERM_LENGTH = 2
+RANK_EXACT_USERNAME, RANK_USERNAME, RANK_PROFILE_NAME, RANK_EMAIL = range(4)
+
+
+def _normalize(text):
+    return re.sub(r'\s+', ' ', (text or '').strip().lower())
+
+
+def _search_terms(username, profile_name, email):
+    terms = {}
+
+    def add(term, rank):
+        if len(term) >= MIN_TERM_LENGTH and rank < terms.get(term, 99):
+            terms[term] = rank
+
+    def add_prefixes(text, rank):
+        text = text[:MAX_TERM_LENGTH]
+        for size in range(MIN_TERM_LENGTH, len(text) + 1):
+            add(text[:size], rank)
+
+    for source, rank in ((username, RANK_USERNAME), (profile_name, RANK_PROFILE_NAME), (email, RANK_EMAIL)):
+        if not source:
+            continue
+        add_prefixes(source, rank)
+        for word in re.split(r'[^a-z0-9]+', source.split('@')[0]):
+            add_prefixes(word, rank)
+    if username:
+        add(username[:MAX_TERM_LENGTH], RANK_EXACT_USERNAME)
+    return terms
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table('user_search_term'):
+        op.create_table(
+            'user_search_term',
+            sa.Column('term', sa.String(length=32), nullable=False),
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('rank', sa.SmallInteger(), nullable=False),
+            sa.Column('sort_name', sa.String(length=80), nullable=False),
+            sa.PrimaryKeyConstraint('term', 'user_id'),
+        )
+    op.create_index('ix_user_search_term_rank', 'user_search_term', ['term', 'rank', 'sort_name', 'user_id'],
+                    unique=False, if_not_exists=True)
+
+    op.execute('DELETE FROM user_search_term')
+    table = sa.table('user_search_term', *(sa.column(name) for name in ('term', 'user_id', 'rank', 'sort_name')))
+    users = bind.execute(sa.text('SELECT id, username, profile_name, email FROM "user" ORDER BY id'))
+    for batch in users.partitions(1000):
+        rows = []
+        for user in batch:
+            username = _normalize(user.username)
+            terms = _search_terms(username, _normalize(user.profile_name), _normalize(user.email))
+            rows.extend(dict(term=term, user_id=user.id, rank=rank, sort_name=username[:80])
+                        for term, rank in terms.items())
+        if rows:
+            op.bulk_insert(table, rows)
+
+
+def downgrade():
+    op.drop_index('ix_user_search_term_rank', table_name='user_search_term', if_exists=True)
+    op.drop_table('user_search_term')
@@ -0,0 +1,31 @@
+"""add resource_version for conditional GETs
+
+Revision ID: 9b3d6f0e2a71
+Revises: 7e4f1b2a9c58
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b3d6f0e2a71'
+down_revision = '7e4f1b2a9c58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('resource_version'):
+        op.create_table(
+            'resource_version',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('resource', sa.String(length=32), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id', 'resource'),
+        )
+
+
+def downgrade():
+    op.drop_table('resource_version')
@@ -0,0 +1,29 @@
+"""add user.shard for per-user data shards
+
+Revision ID: c4a7e2d91b06
+Revises: 9b3d6f0e2a71
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a7e2d91b06'
+down_revision = '9b3d6f0e2a71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing users keep their rows on the primary, which is shard 0.
+    columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('user')}
+    if 'shard' not in columns:
+        with op.batch_alter_table('user') as batch_op:
+            batch_op.add_column(sa.Column('shard', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('user') as batch_op:
+        batch_op.drop_column('shard')
@@ -0,0 +1,50 @@
+"""recompute food_profile.score from a 2026-01-01 epoch
+
+Revision ID: e6b2d8a4c193
+Revises: c4a7e2d91b06
+Create Date: 2026-10-18 19:30:00.000000
+
+"""
+from collections import defaultdict
+from datetime import date
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b2d8a4c193'
+down_revision = 'c4a7e2d91b06'
+branch_labels = None
+depends_on = None
+
+# Same weighting as calorie_tracker.food_profile, frozen for this migration.
+HALF_LIFE_DAYS = 30
+MAX_HALF_LIVES = 512
+
+
+def _rescore(epoch):
+    # Summed from raw entries rather than scaled, which would keep the
+    # rounding error of the old scores.
+    bind = op.get_bind()
+    scores = defaultdict(float)
+    for row in bind.execute(sa.text('SELECT user_id, name, date FROM food_entry ORDER BY date, id')):
+        key = (row.name or '').strip().lower()[:100]
+        if not key:
+            continue
+        entry_date = row.date if isinstance(row.date, date) else date.fromisoformat(str(row.date)[:10])
+        scores[(row.user_id, key)] += 2.0 ** min((entry_date - epoch).days / HALF_LIFE_DAYS, MAX_HALF_LIVES)
+    table = sa.table('food_profile', sa.column('user_id'), sa.column('key'), sa.column('score'))
+    statement = table.update().where(
+        table.c.user_id == sa.bindparam('b_user_id'), table.c.key == sa.bindparam('b_key'),
+    ).values(score=sa.bindparam('b_score'))
+    rows = [dict(b_user_id=user_id, b_key=key, b_score=score) for (user_id, key), score in scores.items()]
+    if rows:
+        bind.execute(statement, rows)
+
+
+def upgrade():
+    _rescore(date(2026, 1, 1))
+
+
+def downgrade():
+    _rescore(date(2020, 1, 1))
@@ -0,0 +1,56 @@
+"""add daily_rollup table and backfill it from raw entries
+
+Revision ID: f21316b37ed8
+Revises: 236186fc6ac5
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f21316b37ed8'
+down_revision = '236186fc6ac5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not sa.inspect(op.get_bind()).has_table('daily_rollup'):
+        op.create_table(
+            'daily_rollup',
+            sa.Column('user_id', sa.Integer(), sa.ForeignKey('user.id'), nullable=False),
+            sa.Column('date', sa.Date(), nullable=False),
+            sa.Column('calories', sa.Float(), nullable=False),
+            sa.Column('carbs', sa.Float(), nullable=False),
+            sa.Column('protein', sa.Float(), nullable=False),
+            sa.Column('fat', sa.Float(), nullable=False),
+            sa.Column('sugar', sa.Float(), nullable=False),
+            sa.Column('water', sa.Integer(), nullable=False),
+            sa.Column('steps', sa.Integer(), nullable=False),
+            sa.Column('sleep', sa.Float(), nullable=False),
+            sa.Column('calories_burnt', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('user_id', 'date'),
+        )
+    op.execute('DELETE FROM daily_rollup')
+    op.execute("""
+        INSERT INTO daily_rollup (user_id, date, calories, carbs, protein, fat, sugar, water, steps, sleep, calories_burnt)
+        SELECT user_id, date, SUM(calories), SUM(carbs), SUM(protein), SUM(fat), SUM(sugar),
+               SUM(water), SUM(steps), SUM(sleep), SUM(calories_burnt)
+        FROM (
+            SELECT user_id, date, COALESCE(calories, 0) AS calories, COALESCE(carbs, 0) AS carbs,
+                   COALESCE(protein, 0) AS protein, COALESCE(fat, 0) AS fat, COALESCE(sugar, 0) AS sugar,
+                   0 AS water, 0 AS steps, 0 AS sleep, 0 AS calories_burnt
+            FROM food_entry
+            UNION ALL SELECT user_id, date, 0, 0, 0, 0, 0, amount_ml, 0, 0, 0 FROM water_entry
+            UNION ALL SELECT user_id, date, 0, 0, 0, 0, 0, 0, steps, 0, 0 FROM step_entry
+            UNION ALL SELECT user_id, date, 0, 0, 0, 0, 0, 0, 0, duration_hours, 0 FROM sleep_entry
+            UNION ALL SELECT user_id, date, 0, 0, 0, 0, 0, 0, 0, 0, calories_burnt FROM calories_burnt_entry
+        ) AS entries
+        GROUP BY user_id, date
+    """)
+
+
+def downgrade():
+    op.drop_table('daily_rollup')
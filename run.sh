@@ -19,6 +19,7 @@ echo ""
 VITE_PID=$!
 
 # Flask serves everything
+FLASK_APP=app.py flask db upgrade
 FLASK_APP=app.py flask run --port 5001
 
 kill $VITE_PID 2>/dev/null
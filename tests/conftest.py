@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+from helpers import sqlite_url
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.join(ROOT, 'benchmarks')):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+# Settings the app reads from the environment; each test starts without them.
+APP_ENV = (
+    'GEMINI_API_KEY', 'GEMINI_API_BASE', 'GEMINI_MODEL', 'OPENAI_API_KEY', 'OPENAI_API_BASE', 'OPENAI_MODEL',
+    'READ_DATABASE_URL', 'READ_AFTER_WRITE_SECONDS', 'SHARD_URLS', 'AI_CACHE_BACKEND', 'METRICS',
+    'MEAL_PARSER', 'MEAL_PARSER_MIN_CONFIDENCE',
+)
+
+@pytest.fixture
+def make_app(tmp_path, monkeypatch):
+    from config import Config
+    from calorie_tracker import create_app, db
+    from calorie_tracker.cache import reset_cache
+    from calorie_tracker.llm import reset_client
+
+    def make(**env):
+        for key in APP_ENV:
+            monkeypatch.delenv(key, raising=False)
+        # Background suggestion refreshes would run queries outside the request.
+        monkeypatch.setenv('SUGGESTIONS_PRECOMPUTE', '0')
+        for key, value in env.items():
+            monkeypatch.setenv(key, value)
+        url = sqlite_url(tmp_path, 'primary')
+        monkeypatch.setenv('DATABASE_URL', url)
+        monkeypatch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', url)
+        reset_cache()
+        reset_client()
+        app = create_app()
+        app.config['TESTING'] = True
+        return app
+
+    # Binds such as the replica register a metadata on the shared db object.
+    metadatas = dict(db.metadatas)
+    yield make
+    db.metadatas.clear()
+    db.metadatas.update(metadatas)
+    reset_cache()
+    reset_client()
+
+@pytest.fixture
+def app(make_app):
+    return make_app()
+
+@pytest.fixture
+def stub_llm():
+    from stub_llm import start_stub
+    server, base = start_stub()
+    yield base
+    server.shutdown()
+    server.server_close()
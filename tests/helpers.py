@@ -0,0 +1,51 @@
+import os
+import sqlite3
+
+from sqlalchemy.engine import make_url
+
+def sqlite_url(directory, name):
+    return f"sqlite:///{os.path.join(directory, f'{name}.db')}"
+
+def sync_sqlite(source_url, target_url):
+    # Stands in for replication: copies the primary over the replica.
+    source = sqlite3.connect(make_url(source_url).database)
+    target = sqlite3.connect(make_url(target_url).database)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+
+def create_user(app, name):
+    from calorie_tracker import db
+    from calorie_tracker.models import User
+    with app.app_context():
+        user = User(username=name, email=f'{name}@test.local', profile_name=name.title())
+        user.password_hash = 'test'
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+def login(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    return client
+
+class StatementLog:
+    # Collects the SQL an engine runs while the block is open.
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+
+    def _record(self, conn, cursor, statement, *args):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._record)
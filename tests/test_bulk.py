@@ -0,0 +1,81 @@
+import json
+from datetime import date, timedelta
+
+import pytest
+
+from helpers import create_user, login
+
+TODAY = date.today()
+ROWS = [
+    dict(type='food', date=TODAY.isoformat(), name='oats', calories=300, protein=10),
+    dict(type='water', date=TODAY.isoformat(), amount_ml=500),
+    dict(type='weight', date=TODAY.isoformat(), weight_kg=154, unit='lbs'),
+    dict(type='steps', date=(TODAY - timedelta(days=30)).isoformat(), steps=4000),
+    dict(type='sleep', date=TODAY.isoformat(), sleep_time='23:00', wake_time='07:00'),
+    dict(type='calories_burnt', date=TODAY.isoformat(), calories_burnt=250),
+]
+
+def ndjson(rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows)
+
+def bulk_import(client, body, mimetype='application/x-ndjson'):
+    return client.post('/api/entries/bulk', data=body, content_type=mimetype)
+
+def test_import_round_trips_through_export(app):
+    client = login(app.test_client(), create_user(app, 'importer'))
+    future = dict(type='food', date=(TODAY + timedelta(days=1)).isoformat(), name='later', calories=1)
+    result = bulk_import(client, ndjson(ROWS + [future]) + 'not json\n').get_json()
+    assert result['inserted'] == len(ROWS) and result['rejected'] == 2
+    assert [error['line'] for error in result['errors']] == [7, 8]
+
+    totals = client.get('/api/dashboard').get_json()['totals']
+    assert totals['calories'] == 300 and totals['water'] == 500
+
+    exported = client.get('/api/entries/export').get_data(as_text=True)
+    assert sorted(row['type'] for row in map(json.loads, exported.splitlines())) == sorted(row['type'] for row in ROWS)
+    csv_export = client.get('/api/entries/export?format=csv').get_data(as_text=True)
+
+    # Either export loads back into another account unchanged.
+    for body, mimetype in ((exported, 'application/x-ndjson'), (csv_export, 'text/csv')):
+        other = login(app.test_client(), create_user(app, f'copy-{mimetype}'))
+        assert bulk_import(other, body, mimetype).get_json()['rejected'] == 0
+        assert other.get('/api/entries/export').get_data(as_text=True) == exported
+
+def test_single_writes_and_imports_share_validation(app):
+    client = login(app.test_client(), create_user(app, 'validator'))
+    bad = [
+        ('food', dict(date=(TODAY + timedelta(days=1)).isoformat(), name='later', calories=1)),
+        ('food', dict(name=' ', calories=1)),
+        ('water', dict(amount_ml='lots')),
+        ('sleep', dict(sleep_time='late', wake_time='07:00')),
+    ]
+    imported = bulk_import(client, ndjson([dict(row, type=entry_type) for entry_type, row in bad])).get_json()
+    for (entry_type, row), error in zip(bad, imported['errors']):
+        response = client.post(f'/api/entries/{entry_type}', json=row)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == error['error']
+
+def test_a_failed_import_writes_nothing(app):
+    from calorie_tracker import bulk, db
+    from calorie_tracker.models import DailyRollup, FoodEntry
+    user_id = create_user(app, 'interrupted')
+
+    def rows():
+        for line in range(1, 6):
+            yield line, dict(type='food', name='toast', calories=100), None
+        raise OSError('upload dropped')
+
+    with app.test_request_context():
+        with pytest.raises(OSError):
+            bulk.import_rows(user_id, rows(), batch_size=2)
+        assert FoodEntry.query.filter_by(user_id=user_id).count() == 0
+        assert db.session.query(DailyRollup).filter_by(user_id=user_id).count() == 0
+
+def test_import_refreshes_recent_suggestions(app, monkeypatch):
+    from calorie_tracker.routes import api_routes
+    scheduled = []
+    monkeypatch.setattr(api_routes, '_schedule_suggestions', lambda user_id, day: scheduled.append((user_id, day)))
+    user_id = create_user(app, 'suggested')
+    client = login(app.test_client(), user_id)
+    bulk_import(client, ndjson(ROWS))
+    assert scheduled == [(user_id, TODAY)]
@@ -0,0 +1,39 @@
+from datetime import date, timedelta
+
+import pytest
+
+from helpers import create_user, login
+
+TODAY, YESTERDAY = date.today().isoformat(), (date.today() - timedelta(days=1)).isoformat()
+
+def cache_stats(app):
+    from calorie_tracker.cache import get_cache
+    with app.app_context():
+        return get_cache().stats()
+
+@pytest.mark.parametrize('backend', ['memory', 'database'])
+def test_an_entry_write_drops_only_that_days_insights(make_app, stub_llm, backend):
+    app = make_app(GEMINI_API_KEY='stub', GEMINI_API_BASE=stub_llm, AI_CACHE_BACKEND=backend)
+    client = login(app.test_client(), create_user(app, 'cached'))
+    for day in (TODAY, YESTERDAY, TODAY):
+        assert client.get(f'/api/dashboard/insights?date={day}').get_json()['insights']
+    stats = cache_stats(app)
+    assert (stats['hits'], stats['sets'], stats['entries']) == (1, 2, 2)
+
+    client.post('/api/entries/water', json=dict(amount_ml=500, date=TODAY))
+    stats = cache_stats(app)
+    assert (stats['invalidations'], stats['entries']) == (1, 1)
+    # The other day is untouched and still answers from the cache.
+    client.get(f'/api/dashboard/insights?date={YESTERDAY}')
+    assert cache_stats(app)['hits'] == 2
+
+def test_moving_an_entry_drops_both_days(make_app, stub_llm):
+    app = make_app(GEMINI_API_KEY='stub', GEMINI_API_BASE=stub_llm)
+    client = login(app.test_client(), create_user(app, 'mover'))
+    entry_id = client.post('/api/entries/food', json=dict(name='oats', calories=300, date=TODAY)).get_json()['id']
+    for day in (TODAY, YESTERDAY):
+        client.get(f'/api/dashboard/insights?date={day}')
+    assert cache_stats(app)['entries'] == 2
+
+    client.put(f'/api/entries/food/{entry_id}', json=dict(name='oats', calories=300, date=YESTERDAY))
+    assert cache_stats(app)['entries'] == 0
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from helpers import create_user, login
+
+def read_events(response):
+    events = []
+    for block in response.get_data(as_text=True).strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+@pytest.fixture
+def client(make_app, stub_llm):
+    app = make_app(GEMINI_API_KEY='stub', GEMINI_API_BASE=stub_llm)
+    return login(app.test_client(), create_user(app, 'streamer'))
+
+def test_chat_turn_streams_tokens_then_done(client):
+    response = client.post('/api/coach/message/stream', json={'message': 'how is my day going'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    events = read_events(response)
+    names = [name for name, _ in events]
+    assert names[0] == 'start' and names[-1] == 'done'
+    assert set(names[1:-1]) == {'token'}
+
+    done = events[-1][1]
+    tokens = ''.join(data['text'] for name, data in events if name == 'token')
+    assert done['reply']['role'] == 'assistant'
+    assert done['reply']['content'] == tokens == 'Sounds good. Tell me what you ate next.'
+    # The same body the blocking endpoint returns.
+    blocking = client.post('/api/coach/message', json={'message': 'how is my day going'}).get_json()
+    assert set(done) == set(blocking) == {'reply', 'action', 'memories'}
+    history = client.get('/api/coach/history').get_json()['messages']
+    assert history[1]['id'] == done['reply']['id']
+
+def test_planner_turn_reports_tools_before_done(client):
+    response = client.post('/api/coach/message/stream', json={'message': 'ate a burrito for lunch'})
+    events = read_events(response)
+    names = [name for name, _ in events]
+    assert names[0] == 'start' and names[-1] == 'done'
+    assert 'token' in names and names.index('tool') > names.index('token')
+
+    tool = events[names.index('tool')][1]
+    done = events[-1][1]
+    assert tool['tool'] == 'create_food' and tool['result']['ok']
+    assert done['action']['tools'] == [tool]
+    foods = client.get('/api/entries').get_json()['food']
+    assert [food['id'] for food in foods] == [tool['result']['id']]
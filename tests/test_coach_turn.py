@@ -0,0 +1,23 @@
+import pytest
+
+from helpers import create_user, login
+
+# Same budget benchmarks/bench_coach_turn.py enforces.
+QUERY_BUDGET = 20
+
+@pytest.mark.parametrize('message', [
+    'ate a burrito for lunch',
+    'drank 500 ml water',
+    'walked 4000 steps',
+    'remember I like green tea',
+    'how am I doing today',
+])
+def test_coach_turn_stays_within_query_budget(make_app, stub_llm, message):
+    app = make_app(GEMINI_API_KEY='stub', GEMINI_API_BASE=stub_llm)
+    client = login(app.test_client(), create_user(app, 'coach'))
+    # The second turn also reads back the first one's chat and entries.
+    for _ in range(2):
+        response = client.post('/api/coach/message', json={'message': message})
+        assert response.status_code == 200, response.get_data(as_text=True)
+        assert response.get_json()['reply']
+        assert 0 < int(response.headers['X-Query-Count']) <= QUERY_BUDGET
@@ -0,0 +1,73 @@
+import gzip
+import json
+
+import pytest
+
+from helpers import create_user, login
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# A year of daily history is well past the compression threshold.
+HISTORY = '/api/history?start=2025-01-01&end=2025-12-31'
+DECODERS = {
+    'gzip': gzip.decompress,
+    'br': brotli.decompress,
+    'zstd': lambda body: zstandard.ZstdDecompressor().decompressobj().decompress(body),
+}
+
+@pytest.fixture
+def client(app):
+    return login(app.test_client(), create_user(app, 'squeezed'))
+
+def fetch(client, url, accept=None):
+    headers = {'Accept-Encoding': accept} if accept is not None else {}
+    return client.get(url, headers=headers)
+
+@pytest.mark.parametrize('accept, encoding', [
+    ('gzip, deflate, br, zstd', 'zstd'),
+    ('gzip, br', 'br'),
+    ('gzip', 'gzip'),
+    # The client's weights beat the server's preference order.
+    ('zstd;q=0.5, gzip', 'gzip'),
+    ('br;q=0.9, zstd;q=0', 'br'),
+])
+def test_negotiates_the_best_encoding_the_client_accepts(client, accept, encoding):
+    from calorie_tracker.compression import COMPRESSORS
+    if encoding not in COMPRESSORS:
+        pytest.skip(f'{encoding} support is not installed')
+    plain = fetch(client, HISTORY)
+    assert 'Content-Encoding' not in plain.headers
+    response = fetch(client, HISTORY, accept)
+    assert response.headers['Content-Encoding'] == encoding
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert len(response.data) < len(plain.data)
+    assert json.loads(DECODERS[encoding](response.data)) == plain.get_json()
+
+@pytest.mark.parametrize('accept', ['identity', 'gzip;q=0, br;q=0, zstd;q=0', 'compress'])
+def test_identity_when_nothing_acceptable_is_offered(client, accept):
+    response = fetch(client, HISTORY, accept)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.get_json()['periods']
+
+def test_small_bodies_go_out_uncompressed(client):
+    response = fetch(client, '/api/goals', 'gzip, br, zstd')
+    assert len(response.data) < 1024
+    assert 'Content-Encoding' not in response.headers
+
+def test_negotiate_skips_encodings_the_server_lacks():
+    from werkzeug.http import parse_accept_header
+    from werkzeug.datastructures import Accept
+    from calorie_tracker.compression import negotiate
+    accepted = parse_accept_header('zstd, br, gzip', Accept)
+    assert negotiate(accepted) == 'zstd'
+    assert negotiate(accepted, encodings={'gzip': None, 'br': None}) == 'br'
+    assert negotiate(parse_accept_header('zstd', Accept), encodings={'gzip': None}) is None
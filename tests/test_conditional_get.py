@@ -0,0 +1,35 @@
+import re
+
+from helpers import StatementLog, create_user, login
+
+ENTRY_TABLES = re.compile(
+    r'\b(food_entry|water_entry|weight_entry|step_entry|sleep_entry|calories_burnt_entry|daily_rollup)\b'
+)
+
+def test_unchanged_poll_is_a_304_without_entry_queries(app):
+    from calorie_tracker import db
+    client = login(app.test_client(), create_user(app, 'poller'))
+    assert client.post('/api/entries/food', json=dict(name='oats', calories=300)).status_code == 201
+
+    first = client.get('/api/entries')
+    assert first.status_code == 200
+    assert first.get_json()['food'][0]['name'] == 'oats'
+    etag = first.headers['ETag']
+
+    with app.app_context():
+        engine = db.engine
+    with StatementLog(engine) as log:
+        poll = client.get('/api/entries', headers={'If-None-Match': etag})
+    assert poll.status_code == 304
+    assert poll.headers['ETag'] == etag
+    assert [s for s in log.statements if ENTRY_TABLES.search(s)] == []
+    # The user and the version counters; the view never ran.
+    assert int(poll.headers['X-Query-Count']) == len(log.statements) <= 2
+
+def test_a_write_changes_the_etag(app):
+    client = login(app.test_client(), create_user(app, 'writer'))
+    etag = client.get('/api/entries').headers['ETag']
+    client.post('/api/entries/food', json=dict(name='rice', calories=200))
+    poll = client.get('/api/entries', headers={'If-None-Match': etag})
+    assert poll.status_code == 200
+    assert poll.headers['ETag'] != etag
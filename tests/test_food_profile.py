@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from helpers import create_user, login
+
+def test_startup_backfills_an_empty_food_profile_table(make_app):
+    from calorie_tracker import db
+    app = make_app()
+    user_id = create_user(app, 'legacy')
+    login(app.test_client(), user_id).post('/api/entries/food', json=dict(name='Oats', calories=300))
+    # What create_all leaves on a database that predates food_profile.
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM food_profile'))
+        db.session.commit()
+
+    restarted = make_app()
+    from calorie_tracker.food_profile import top_foods
+    with restarted.app_context():
+        assert [food['name'] for food in top_foods(user_id)] == ['Oats']
+
+def test_scores_stay_bounded_and_keep_decaying(app):
+    from calorie_tracker import db
+    from calorie_tracker.food_profile import find_drift, top_foods
+    from calorie_tracker.models import FoodEntry, FoodProfile
+    user_id = create_user(app, 'decades')
+    start = date(2026, 1, 1)
+    with app.app_context():
+        # Decades past where an additive 2 ** (days / 30) score stopped decaying.
+        for years in range(0, 80, 2):
+            day = start + timedelta(days=365 * years)
+            db.session.add(FoodEntry(user_id=user_id, date=day, name='rice', calories=200))
+        db.session.add(FoodEntry(user_id=user_id, date=start + timedelta(days=365 * 79), name='soup', calories=90))
+        db.session.commit()
+
+        rice = db.session.get(FoodProfile, (user_id, 'rice'))
+        assert rice.count == 40 and rice.score <= rice.count
+        assert rice.score_date == start + timedelta(days=365 * 78)
+        # One fresh bowl of soup outranks forty mostly-forgotten plates of rice.
+        later = start + timedelta(days=365 * 79 + 10)
+        assert [food['name'] for food in top_foods(user_id, today=later)] == ['soup', 'rice']
+        assert top_foods(user_id, today=later + timedelta(days=30))[0]['weight'] < top_foods(user_id, today=later)[0]['weight']
+
+        newest = FoodEntry.query.filter_by(user_id=user_id, name='rice').order_by(FoodEntry.date.desc()).first()
+        db.session.delete(newest)
+        db.session.commit()
+        assert find_drift(user_id) == []
+        assert db.session.get(FoodProfile, (user_id, 'rice')).last_date == start + timedelta(days=365 * 76)
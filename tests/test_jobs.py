@@ -0,0 +1,42 @@
+import json
+import threading
+import time
+
+def test_throttled_jobs_coalesce_until_the_interval_passes(app):
+    from calorie_tracker import jobs
+    runs = []
+    done = threading.Event()
+
+    def refresh():
+        runs.append(time.monotonic())
+        if len(runs) == 2:
+            done.set()
+
+    with app.app_context():
+        started = time.monotonic()
+        jobs.submit('refresh:1', refresh, min_interval=0.3)
+        jobs.wait()
+        # Both arrive inside the interval: one delayed run covers them.
+        assert jobs.submit('refresh:1', refresh, min_interval=0.3) is not None
+        assert jobs.submit('refresh:1', refresh, min_interval=0.3) is None
+        assert done.wait(2)
+    assert len(runs) == 2
+    assert runs[1] - runs[0] >= 0.3 - 0.01
+    assert runs[0] - started < 0.3
+
+def test_outbox_workers_start_with_the_first_request(make_app):
+    from calorie_tracker import jobs
+    app = make_app()
+    # Building the app, as every CLI command does, leaves the workers alone.
+    assert app not in jobs._outbox_apps
+    app.test_client().get('/api/auth/me')
+    assert app in jobs._outbox_apps
+
+def test_coach_response_includes_what_the_turn_learned(app):
+    from helpers import create_user, login
+    client = login(app.test_client(), create_user(app, 'learner'))
+    response = client.post('/api/coach/message', json={'message': 'had a coffee'})
+    # The rows are written later by the coach_turn job.
+    memories = response.get_json()['memories']
+    assert memories['last_coach_message'] == 'had a coffee'
+    assert json.loads(memories['last_food_log'])['name'] == 'brewed coffee, 12 oz'
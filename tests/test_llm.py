@@ -0,0 +1,139 @@
+import json
+import socket
+import time
+
+import pytest
+
+from calorie_tracker.llm import CircuitOpenError, LLMClient, LLMError
+
+BODY = {'input': [{'role': 'user', 'content': 'hello'}]}
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+@pytest.fixture
+def client():
+    client = LLMClient(failure_threshold=2, reset_after=0.1)
+    yield client
+    client.close()
+
+def count_connections(server):
+    accepted = []
+    process = server.process_request
+
+    def counted(request, address):
+        accepted.append(address)
+        return process(request, address)
+
+    server.process_request = counted
+    return accepted
+
+def test_pooled_calls_reuse_one_connection(client):
+    from stub_llm import start_stub
+    server, base = start_stub()
+    accepted = count_connections(server)
+    try:
+        for _ in range(5):
+            assert client.post_json(f'{base}/v1/responses', BODY)['output_text']
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert len(accepted) == 1
+
+def test_breaker_opens_half_opens_and_closes(client):
+    from stub_llm import start_stub
+    port = unused_port()
+    url = f'http://127.0.0.1:{port}/v1/responses'
+    breaker = client.breaker_for(url)
+
+    for _ in range(2):
+        with pytest.raises(LLMError) as failure:
+            client.post_json(url, BODY, timeout=1)
+        assert not isinstance(failure.value, CircuitOpenError)
+    assert breaker.state == 'open'
+    # Open: calls fail at once without touching the network.
+    with pytest.raises(CircuitOpenError):
+        client.post_json(url, BODY, timeout=1)
+
+    # Half-open lets one probe through; a failed probe opens it again.
+    time.sleep(0.15)
+    assert breaker.state == 'half_open'
+    with pytest.raises(LLMError) as failure:
+        client.post_json(url, BODY, timeout=1)
+    assert not isinstance(failure.value, CircuitOpenError)
+    assert breaker.state == 'open'
+
+    server, _ = start_stub(port=port)
+    try:
+        time.sleep(0.15)
+        assert breaker.state == 'half_open'
+        assert client.post_json(url, BODY, timeout=1)['output_text']
+        assert breaker.state == 'closed'
+        assert client.post_json(url, BODY, timeout=1)['output_text']
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_stream_events_arrive_in_order_and_release_the_connection(client, stub_llm, monkeypatch):
+    from calorie_tracker.llm import gemini_url
+    from stub_llm import STREAM_CHUNKS, canned_reply
+    monkeypatch.setenv('GEMINI_API_BASE', stub_llm)
+    url = gemini_url('stub-model', 'stub', method='streamGenerateContent', query='&alt=sse')
+    body = {'contents': [{'role': 'user', 'parts': [{'text': 'how is my day going'}]}]}
+    events = list(client.stream_events(url, body))
+    texts = [event['candidates'][0]['content']['parts'][0]['text'] for event in events]
+    assert len(texts) == STREAM_CHUNKS
+    assert json.loads(''.join(texts)) == canned_reply('how is my day going')
+    host = client._host('http', stub_llm.removeprefix('http://'))
+    assert len(host.idle) == 1
+
+def test_abandoned_stream_closes_its_connection(client):
+    from stub_llm import start_stub
+    server, base = start_stub()
+    # The stub keeps writing to the closed socket; that broken pipe is expected.
+    server.handle_error = lambda request, address: None
+    url = f'{base}/v1/responses'
+    try:
+        events = client.stream_events(url, dict(BODY, stream=True))
+        assert next(events)['type'] == 'response.output_text.delta'
+        events.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert client._host('http', base.removeprefix('http://')).idle == []
+    # Stopping early is the caller's choice, not a provider failure.
+    assert client.breaker_for(url).failures == 0
+
+def test_background_calls_have_their_own_slots(client):
+    from calorie_tracker.llm import ProviderBusyError
+    host = client._host('http', '127.0.0.1:9')
+    # A background call in flight leaves every user-facing slot free.
+    held = client._acquire(host, background=True)
+    with pytest.raises(ProviderBusyError):
+        client._acquire(host, background=True)
+    taken = [client._acquire(host) for _ in range(client.max_concurrency)]
+    assert all(slots is host.slots for slots in taken)
+    with pytest.raises(ProviderBusyError):
+        client._acquire(host)
+    for slots in [held, *taken]:
+        slots.release()
+
+def test_a_full_host_waits_briefly_for_a_slot():
+    import threading
+    from calorie_tracker.llm import ProviderBusyError
+    client = LLMClient(max_concurrency=1, acquire_timeout=0.5)
+    host = client._host('http', '127.0.0.1:9')
+    held = client._acquire(host)
+    # Freed inside the wait: the second call gets the slot instead of failing.
+    threading.Timer(0.1, held.release).start()
+    started = time.monotonic()
+    client._acquire(host).release()
+    assert 0.05 < time.monotonic() - started < 0.5
+
+    client.acquire_timeout = 0.1
+    held = client._acquire(host)
+    with pytest.raises(ProviderBusyError):
+        client._acquire(host)
+    held.release()
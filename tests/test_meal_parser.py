@@ -0,0 +1,47 @@
+import pytest
+
+from helpers import create_user, login
+
+def test_portions_share_the_reference_food(app):
+    from calorie_tracker.food_profile import top_foods
+    user_id = create_user(app, 'portions')
+    client = login(app.test_client(), user_id)
+    for message in ('had a coffee', 'had a large coffee'):
+        response = client.post('/api/coach/message', json={'message': message})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    foods = client.get('/api/entries').get_json()['food']
+    assert {food['name'] for food in foods} == {'brewed coffee, 12 oz'}
+    assert sorted(food['calories'] for food in foods) == [5.0, 6.2]
+    with app.app_context():
+        assert [food['times_logged'] for food in top_foods(user_id)] == [2]
+
+def test_confidence_counts_the_words_left_unmatched():
+    from calorie_tracker.meal_parser import parse_meal
+    parsed = parse_meal('had 2 large eggs')
+    assert parsed['confidence'] == 1.0
+    assert [(item['name'], item['multiplier']) for item in parsed['items']] == [('whole egg, 1 large', 2.0)]
+    assert parse_meal('had a coffee and some zorblax')['confidence'] == 0.5
+    # Corrections and questions never parse locally.
+    assert parse_meal('actually remove the coffee') == dict(items=[], confidence=0.0)
+    assert parse_meal('had a coffee?') == dict(items=[], confidence=0.0)
+
+@pytest.mark.parametrize('message, min_confidence, path', [
+    ('had a coffee', None, 'local'),
+    ('had a coffee and some zorblax', None, 'llm'),
+    ('had a coffee and some zorblax', '0.5', 'local'),
+])
+def test_low_confidence_turns_escalate_to_the_planner(make_app, stub_llm, message, min_confidence, path):
+    from calorie_tracker import meal_parser
+    from stub_llm import StubHandler
+    env = dict(GEMINI_API_KEY='stub', GEMINI_API_BASE=stub_llm)
+    if min_confidence:
+        env['MEAL_PARSER_MIN_CONFIDENCE'] = min_confidence
+    app = make_app(**env)
+    client = login(app.test_client(), create_user(app, 'parser'))
+    meal_parser.reset_path_stats()
+    before = StubHandler.requests
+    response = client.post('/api/coach/message', json={'message': message})
+    assert response.status_code == 200, response.get_data(as_text=True)
+    stats = meal_parser.path_stats()
+    assert stats[path] == 1 and sum(stats[p] for p in meal_parser.PATHS) == 1
+    assert (StubHandler.requests > before) == (path == 'llm')
@@ -0,0 +1,109 @@
+from datetime import date
+
+import pytest
+
+from helpers import StatementLog, create_user, login, sqlite_url, sync_sqlite
+
+@pytest.fixture
+def routed(make_app, tmp_path):
+    primary_url, replica_url = sqlite_url(tmp_path, 'primary'), sqlite_url(tmp_path, 'replica')
+    app = make_app(READ_DATABASE_URL=replica_url, READ_AFTER_WRITE_SECONDS='60')
+    from calorie_tracker import db
+    from calorie_tracker.routing import REPLICA
+    with app.app_context():
+        engines = db.engine, db.engines[REPLICA]
+    user_id = create_user(app, 'reader')
+
+    def sync():
+        sync_sqlite(primary_url, replica_url)
+
+    sync()
+    return app, user_id, engines, sync
+
+def food_names(client):
+    return [food['name'] for food in client.get('/api/entries').get_json()['food']]
+
+def test_get_reads_from_the_replica(routed):
+    app, user_id, (primary, replica), sync = routed
+    client = login(app.test_client(), user_id)
+    with StatementLog(primary) as on_primary, StatementLog(replica) as on_replica:
+        assert client.get('/api/dashboard').status_code == 200
+    assert on_primary.statements == []
+    assert on_replica.statements
+
+def test_a_write_pins_the_rest_of_the_request_to_the_primary(routed):
+    app, user_id, (primary, replica), sync = routed
+    from calorie_tracker import db
+    from calorie_tracker.models import FoodEntry
+    with app.test_request_context('/api/entries', method='GET'):
+        with StatementLog(primary) as on_primary, StatementLog(replica) as on_replica:
+            FoodEntry.query.filter_by(user_id=user_id).all()
+        assert on_replica.statements and not on_primary.statements
+
+        db.session.add(FoodEntry(user_id=user_id, date=date.today(), name='toast', calories=120))
+        db.session.flush()
+        with StatementLog(primary) as on_primary, StatementLog(replica) as on_replica:
+            names = [entry.name for entry in FoodEntry.query.filter_by(user_id=user_id)]
+        assert names == ['toast']
+        assert on_primary.statements and not on_replica.statements
+        db.session.rollback()
+
+def test_reads_after_a_write_stay_on_the_primary(routed):
+    app, user_id, (primary, replica), sync = routed
+    writer = login(app.test_client(), user_id)
+    with StatementLog(replica) as on_replica:
+        assert writer.post('/api/entries/food', json=dict(name='oats', calories=300)).status_code == 201
+    assert on_replica.statements == []
+
+    # The replica has not caught up, but the writer's cookie keeps it off.
+    with StatementLog(replica) as on_replica:
+        assert food_names(writer) == ['oats']
+    assert on_replica.statements == []
+
+    # Another session of the same user has no cookie and reads the stale replica.
+    other = login(app.test_client(), user_id)
+    assert food_names(other) == []
+    sync()
+    assert food_names(other) == ['oats']
+
+def test_read_only_routing(routed):
+    app, user_id, (primary, replica), sync = routed
+    from calorie_tracker.models import FoodEntry
+    from calorie_tracker.routing import read_only
+
+    @read_only
+    def count_entries():
+        return FoodEntry.query.filter_by(user_id=user_id).count()
+
+    # Outside a request there is no read-after-write state, so it stays on the primary.
+    with app.app_context():
+        with StatementLog(primary) as on_primary, StatementLog(replica) as on_replica:
+            count_entries()
+        assert on_primary.statements and not on_replica.statements
+
+    # Inside a POST it may use the replica until the request writes.
+    with app.test_request_context('/api/coach/message', method='POST'):
+        with StatementLog(primary) as on_primary, StatementLog(replica) as on_replica:
+            count_entries()
+            FoodEntry.query.filter_by(user_id=user_id).count()
+        assert len(on_replica.statements) == 1 and len(on_primary.statements) == 1
+
+def test_friend_activity_never_writes(routed):
+    app, user_id, (primary, replica), sync = routed
+    from calorie_tracker import db
+    from calorie_tracker.models import Friendship
+    friend_id = create_user(app, 'friend')
+    with app.app_context():
+        db.session.add(Friendship(requester_id=user_id, receiver_id=friend_id, status='accepted'))
+        db.session.commit()
+    sync()
+    client = login(app.test_client(), user_id)
+    # Neither user has a FriendPrivacy row; the defaults apply without one.
+    with StatementLog(primary) as on_primary:
+        response = client.get('/api/friends/activity')
+    assert response.status_code == 200
+    assert not [s for s in on_primary.statements if not s.lstrip().upper().startswith('SELECT')]
+    friend = response.get_json()['friends'][0]
+    assert friend['shared']['show_calories'] is True and 'weight_kg' not in friend
+    with app.app_context():
+        assert db.session.execute(db.text('SELECT count(*) FROM friend_privacy')).scalar() == 0
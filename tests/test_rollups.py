@@ -0,0 +1,58 @@
+from helpers import create_user, login
+
+def test_startup_backfills_an_empty_rollup_table(make_app):
+    from calorie_tracker import db
+    app = make_app()
+    client = login(app.test_client(), create_user(app, 'legacy'))
+    client.post('/api/entries/food', json=dict(name='oats', calories=800))
+    # What create_all leaves on a database that predates daily_rollup.
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM daily_rollup'))
+        db.session.commit()
+    assert client.get('/api/dashboard').get_json()['totals']['calories'] == 0
+
+    restarted = make_app()
+    client = login(restarted.test_client(), 1)
+    assert client.get('/api/dashboard').get_json()['totals']['calories'] == 800
+
+def stored_totals(app, metric='calories'):
+    from calorie_tracker.models import DailyRollup
+    with app.app_context():
+        return {row.date.isoformat(): getattr(row, metric) for row in DailyRollup.query if getattr(row, metric)}
+
+def test_entry_writes_keep_rollups_in_step(app):
+    from datetime import date, timedelta
+    today, yesterday = date.today().isoformat(), (date.today() - timedelta(days=1)).isoformat()
+    client = login(app.test_client(), create_user(app, 'roller'))
+    entry_id = client.post('/api/entries/food', json=dict(name='oats', calories=300)).get_json()['id']
+    client.post('/api/entries/food', json=dict(name='toast', calories=120))
+    assert stored_totals(app) == {today: 420}
+
+    client.put(f'/api/entries/food/{entry_id}', json=dict(name='oats', calories=350, date=today))
+    assert stored_totals(app) == {today: 470}
+
+    # Moving an entry to another day takes its calories with it.
+    client.put(f'/api/entries/food/{entry_id}', json=dict(name='oats', calories=350, date=yesterday))
+    assert stored_totals(app) == {today: 120, yesterday: 350}
+    assert client.get(f'/api/dashboard?date={yesterday}').get_json()['totals']['calories'] == 350
+
+    client.delete(f'/api/entries/food/{entry_id}')
+    assert stored_totals(app) == {today: 120}
+
+def test_check_reports_drift_and_rebuild_fixes_it(app):
+    from calorie_tracker import db
+    client = login(app.test_client(), create_user(app, 'drifter'))
+    client.post('/api/entries/food', json=dict(name='oats', calories=300))
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=['rollups', 'check']).exit_code == 0
+
+    with app.app_context():
+        db.session.execute(db.text('UPDATE daily_rollup SET calories = 999'))
+        db.session.commit()
+    result = runner.invoke(args=['rollups', 'check'])
+    assert result.exit_code != 0
+    assert 'calories stored=999' in result.output and 'expected=300' in result.output
+
+    assert '1 had drifted' in runner.invoke(args=['rollups', 'rebuild']).output
+    assert runner.invoke(args=['rollups', 'check']).exit_code == 0
+    assert client.get('/api/dashboard').get_json()['totals']['calories'] == 300
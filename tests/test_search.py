@@ -0,0 +1,21 @@
+from helpers import create_user, login
+
+def search(client, query):
+    response = client.get('/api/friends/search', query_string={'q': query})
+    return [result['user']['username'] for result in response.get_json()['results']]
+
+def test_startup_indexes_users_from_before_the_index(make_app):
+    from calorie_tracker import db
+    app = make_app()
+    create_user(app, 'alice')
+    # What create_all leaves on a database that predates user_search_term.
+    with app.app_context():
+        db.session.execute(db.text('DELETE FROM user_search_term'))
+        db.session.execute(db.text('DELETE FROM backfill'))
+        db.session.commit()
+
+    restarted = make_app()
+    # A later signup fills the index, but must not hide everyone else.
+    client = login(restarted.test_client(), create_user(restarted, 'bob'))
+    assert search(client, 'ali') == ['alice']
+    assert search(client, 'lic') == []
@@ -0,0 +1,61 @@
+import pytest
+
+from helpers import create_user, login, sqlite_url
+
+@pytest.fixture
+def sharded(make_app, tmp_path):
+    app = make_app(SHARD_URLS=sqlite_url(tmp_path, 'shard1'))
+    # Placement evens out user counts, so these land on shards 0 and 1.
+    return app, create_user(app, 'zero'), create_user(app, 'one')
+
+def shard_rows(app, shard, table='food_entry'):
+    from calorie_tracker.shards import row_counts
+    with app.app_context():
+        return row_counts(shard)[table]
+
+def user_shard(app, user_id):
+    from calorie_tracker import db
+    from calorie_tracker.models import User
+    with app.app_context():
+        return db.session.get(User, user_id).shard
+
+def test_each_users_entries_live_on_their_shard(sharded):
+    app, zero, one = sharded
+    assert (user_shard(app, zero), user_shard(app, one)) == (0, 1)
+    clients = {user_id: login(app.test_client(), user_id) for user_id in (zero, one)}
+    clients[zero].post('/api/entries/food', json=dict(name='oats', calories=300))
+    for name in ('rice', 'dal'):
+        clients[one].post('/api/entries/food', json=dict(name=name, calories=200))
+    assert (shard_rows(app, 0), shard_rows(app, 1)) == (1, 2)
+
+    # Equal ids on two shards stay two users' entries.
+    assert [food['name'] for food in clients[zero].get('/api/entries').get_json()['food']] == ['oats']
+    assert clients[zero].get('/api/dashboard').get_json()['totals']['calories'] == 300
+    assert clients[one].get('/api/dashboard').get_json()['totals']['calories'] == 400
+    assert app.test_cli_runner().invoke(args=['rollups', 'check']).exit_code == 0
+
+def test_move_carries_a_user_to_another_shard(sharded):
+    app, zero, one = sharded
+    client = login(app.test_client(), zero)
+    client.post('/api/entries/food', json=dict(name='oats', calories=300))
+    client.post('/api/entries/water', json=dict(amount_ml=500))
+    etag = client.get('/api/entries').headers['ETag']
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(args=['shards', 'move', str(zero), '1'])
+    assert result.exit_code == 0, result.output
+    assert 'from shard 0 to shard 1' in result.output
+    assert user_shard(app, zero) == 1
+    assert (shard_rows(app, 0), shard_rows(app, 1)) == (0, 1)
+    assert shard_rows(app, 1, 'water_entry') == 1
+
+    # New ids on the target, so cached entry lists are stale.
+    assert client.get('/api/entries', headers={'If-None-Match': etag}).status_code == 200
+    totals = client.get('/api/dashboard').get_json()['totals']
+    assert (totals['calories'], totals['water']) == (300, 500)
+    assert runner.invoke(args=['rollups', 'check']).exit_code == 0
+    assert 'shard 1: 2 users' in runner.invoke(args=['shards', 'stats']).output
+
+    again = runner.invoke(args=['shards', 'move', str(zero), '1'])
+    assert again.exit_code != 0 and 'already on shard 1' in again.output
+    assert 'does not exist' in runner.invoke(args=['shards', 'move', str(zero), '5']).output
@@ -0,0 +1,74 @@
+import gzip
+import os
+
+import pytest
+
+BUNDLE = 'assets/index-3fa9c1d2.js'
+SCRIPT = b'console.log("fitit");\n' * 200
+
+@pytest.fixture
+def build(tmp_path):
+    root = tmp_path / 'dist'
+    (root / 'assets').mkdir(parents=True)
+    (root / 'index.html').write_bytes(b'<!doctype html><div id="root"></div>' + b' ' * 2000)
+    (root / BUNDLE).write_bytes(SCRIPT)
+    (root / 'logo.png').write_bytes(b'\x89PNG' + bytes(4096))
+    return root
+
+@pytest.fixture
+def served(make_app, build):
+    from calorie_tracker.static_assets import reset_manifest
+    reset_manifest()
+    app = make_app(REACT_BUILD_DIR=str(build))
+    yield app
+    reset_manifest()
+
+def test_hashed_bundles_are_immutable_and_revalidate_by_etag(served):
+    client = served.test_client()
+    response = client.get(f'/{BUNDLE}', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Vary'] == 'Accept-Encoding'
+    # Compressed once, from the manifest; the response hook leaves it alone.
+    assert gzip.decompress(response.data) == SCRIPT
+    etag, weak = response.get_etag()
+    assert etag.endswith('-gzip') and not weak
+
+    again = client.get(f'/{BUNDLE}', headers={'Accept-Encoding': 'gzip', 'If-None-Match': f'"{etag}"'})
+    assert again.status_code == 304
+    plain = client.get(f'/{BUNDLE}', headers={'Accept-Encoding': 'identity'})
+    assert plain.data == SCRIPT and 'Content-Encoding' not in plain.headers
+    assert plain.get_etag()[0] != etag
+
+def test_unknown_paths_get_the_app_shell_without_long_caching(served):
+    client = served.test_client()
+    for path in ('/', '/friends/42', '/index.html'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert response.data.startswith(b'<!doctype html>')
+        assert response.headers['Cache-Control'] == 'no-cache'
+    image = client.get('/logo.png', headers={'Accept-Encoding': 'gzip, br'})
+    assert 'Content-Encoding' not in image.headers and 'Vary' not in image.headers
+
+def test_files_are_read_once_at_startup(served, build):
+    os.remove(build / BUNDLE)
+    assert served.test_client().get(f'/{BUNDLE}', headers={'Accept-Encoding': 'identity'}).data == SCRIPT
+
+def test_precompressed_sidecars_are_served_as_written(make_app, build):
+    from calorie_tracker.static_assets import reset_manifest
+    reset_manifest()
+    try:
+        app = make_app(REACT_BUILD_DIR=str(build))
+        result = app.test_cli_runner().invoke(args=['assets', 'compress'])
+        assert result.exit_code == 0, result.output
+        assert (build / f'{BUNDLE}.gz').exists() and not (build / 'logo.png.gz').exists()
+
+        sidecar = gzip.compress(SCRIPT, compresslevel=1, mtime=0)
+        (build / f'{BUNDLE}.gz').write_bytes(sidecar)
+        reset_manifest()
+        response = make_app(REACT_BUILD_DIR=str(build)).test_client().get(
+            f'/{BUNDLE}', headers={'Accept-Encoding': 'gzip'}
+        )
+        assert response.data == sidecar
+    finally:
+        reset_manifest()